@@ -15,14 +15,60 @@ Usage example::
 python -m audio_synch_tool -w ~/SAG_D1_10_M-Jem-2.wav
 -m audio_synch_tool/data/test_synched.mvnx
 -S ./audio_synch_tool/data/mvn_schema_adapted.xsd -n 10000 -x 20 -c
+
+# Headless: render check-mode overview and zoomed PNGs for many synched
+# takes, using 8 processes
+python -m audio_synch_tool render -m ~/takes/*.mvnx -o ~/qa_images
+-p first last frame:1000 -j 8
+
+# Headless: synch and trim all takes listed in a CSV/JSON manifest, with
+# columns shorter_wav, longer_wav, mvnx, anchors and (optional) out_path.
+# Rerunning resumes from the report of the previous run
+python -m audio_synch_tool batch ~/takes/manifest.csv -j 4
+
+# List the frame/sample pairs of the likely slate claps of a take
+python -m audio_synch_tool claps -w ~/take.wav -m ~/take.mvnx
+
+# Headless: apply known anchors to one or more MVNX files, streaming them
+# (the MVNX tree is never held in memory). -a and -w can be given once for
+# all files, or once per -m
+python -m audio_synch_tool apply -m ~/a.mvnx -a 0 1000 4000 801000
+-o ~/a_synched.mvnx -w a.wav -m ~/b.mvnx -a 0 20 4000 800020
+-o ~/b_synched.mvnx -w b.wav
+
+# Save the normal frames of a take as memory-mappable .npy arrays with a
+# JSON sidecar, synching them first with the given anchors (optional)
+python -m audio_synch_tool columns -m ~/a.mvnx -o ~/a_columns
+-a 0 1000 4000 801000
+
+# Save the audio features (RMS, spectral centroid, onset strength) of each
+# normal frame of synched takes, in one pass over each WAV and 4 processes
+python -m audio_synch_tool features -m ~/a_synched.mvnx ~/a_columns
+-o ~/features -j 4
+
+# Measure the clock drift along a take, aligning windows of 30 seconds
+python -m audio_synch_tool drift -w ~/take.wav -m ~/take.mvnx -W 30
+
+# Synch a take instantly via the timecodes of a BWF file and the MVN, or
+# via the LTC track on a given channel of the WAV
+python -m audio_synch_tool timecode -w ~/take.wav -m ~/take.mvnx
+python -m audio_synch_tool timecode -w ~/take.wav -m ~/take.mvnx -l 1
+
+# Any of the above can be profiled by adding --profile (prints a per-stage
+# summary on exit), --profile=trace.json (also saves a Chrome trace) and
+# --tracemalloc (also tracks allocations). See ``profiling`` module
+python -m audio_synch_tool drift -w ~/take.wav -m ~/take.mvnx --profile
 """
 
+import sys
 import argparse
-import soundfile as sf
 
 # from .utils import Timestamp
-from .plotters import AudioMvnSynchToolEditor, AudioMvnSynchToolChecker
+# the plotters (and matplotlib) are only imported when opening the GUI, so
+# that the headless subcommands start fast
 from .mvn import Mvn
+from .profiling import pop_profile_args, span
+from .validation import add_validation_args
 
 
 __author__ = "Andres FR"
@@ -37,31 +83,410 @@ __author__ = "Andres FR"
 # ## HELPERS
 # #############################################################################
 
+def per_file_args(parser, num_files, **values):
+    """
+    :param values: Lists of CLI values by option name, each given either
+      once for all files, or once per file. None counts as ``[None]``.
+    :returns: A dict with the same keys, where each list has ``num_files``
+      values.
+    """
+    result = {}
+    for name, vals in values.items():
+        vals = vals or [None]
+        if len(vals) == 1:
+            vals = vals * num_files
+        elif len(vals) != num_files:
+            parser.error("expected 1 or %d --%s, got %d" % (
+                num_files, name, len(vals)))
+        result[name] = vals
+    return result
+
+
 def get_edit_fig(wav_path, mvnx_path, validate_mvnx, max_samples_plotted,
-                 num_xticks):
+                 num_xticks, autosynch=False, timecode=False):
     """
+    If ``autosynch`` is true, the anchor boxes are prefilled with an
+    automatic estimation of the synchronization. If ``timecode`` is true,
+    they are prefilled with the synchronization given by the timecodes.
     """
+    from .plotters import AudioMvnSynchToolEditor
+    from .loaders import print_progress
     plotter = AudioMvnSynchToolEditor(wav_path, mvnx_path, validate_mvnx,
-                                      max_samples_plotted)
+                                      max_samples_plotted, print_progress)
     plotter.NUM_XTICKS = num_xticks
     fig = plotter.make_fig()
+    if autosynch:
+        fig.autosynch()
+    if timecode:
+        plotter.timecode_anchors(fig)
     return fig
 
 
 def get_test_fig(wav_path, mvnx_path, validate_mvnx, max_samples_plotted,
                  num_xticks):
     """
+    The WAV and MVNX are loaded concurrently (see ``loaders.load_take``).
     """
-    wav_arr, audio_samplerate = sf.read(wav_path)
-    mocap = Mvn(mvnx_path, validate_mvnx)
+    from .plotters import AudioMvnSynchToolChecker, accel_norm_arrays
+    from .loaders import load_take, print_progress
+    take = load_take(wav_path, mvnx_path, validate_mvnx,
+                     lambda mvn: accel_norm_arrays(
+                         mvn, AudioMvnSynchToolChecker.ACCEL_SEGMENTS),
+                     print_progress)
     #
-    plotter = AudioMvnSynchToolChecker(wav_arr, audio_samplerate, mocap,
-                                       max_samples_plotted)
+    plotter = AudioMvnSynchToolChecker(take["wav_arr"], take["samplerate"],
+                                       take["mvn"], max_samples_plotted,
+                                       take["decoded"])
     plotter.NUM_XTICKS = num_xticks
     fig = plotter.make_fig()
     return fig
 
 
+# #############################################################################
+# ## SUBCOMMANDS
+# #############################################################################
+
+def render_main(argv):
+    """
+    Headless rendering of check-mode images. See ``render`` module.
+    """
+    from .render import render_takes, DEFAULT_POINTS
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool render",
+        description="Render check-mode PNGs of synched MVNX files")
+    parser.add_argument("-m", "--mvnx_paths", help="synched MVNX files",
+                        type=str, nargs="+", required=True)
+    parser.add_argument("-o", "--out_dir", help="directory to save images",
+                        type=str, required=True)
+    parser.add_argument("-W", "--wav_dir",
+                        help="dir with the WAV files (default: MVNX dir)",
+                        type=str, default=None)
+    parser.add_argument("-p", "--points", type=str, nargs="+",
+                        default=DEFAULT_POINTS,
+                        help="zoom points: first, last, frame:N or sample N")
+    parser.add_argument("-z", "--zoom_secs", type=float, default=0.5,
+                        help="seconds shown at each side of a zoom point")
+    parser.add_argument("-j", "--num_processes", type=int, default=None,
+                        help="no. of parallel workers (default: no. of CPUs)")
+    parser.add_argument("-M", "--max_memory_mb", type=float, default=None,
+                        help="if given, memory limit per worker in MB")
+    add_validation_args(parser)
+    parser.add_argument("-n", "--max_samples_plotted",
+                        help="no. of samples per track to show",
+                        type=int, default=10000)
+    parser.add_argument("-x", "--num_xticks",
+                        help="no. of labels on the x axis",
+                        type=int, default=20)
+    parser.add_argument("-d", "--dpi", type=int, default=100)
+    args = parser.parse_args(argv)
+    #
+    results = render_takes(args.mvnx_paths, args.out_dir, args.num_processes,
+                           args.max_memory_mb, points=args.points,
+                           zoom_secs=args.zoom_secs, wav_dir=args.wav_dir,
+                           validate_mvnx=args.validate_mvnx,
+                           max_datapoints=args.max_samples_plotted,
+                           num_xticks=args.num_xticks, dpi=args.dpi)
+    num_failed = sum([err is not None for _, _, err in results])
+    print("[render] done:", len(results) - num_failed, "ok,", num_failed,
+          "failed")
+    return num_failed == 0
+
+
+def batch_main(argv):
+    """
+    Synch and trim many takes from a manifest. See ``batch`` module.
+    """
+    from .batch import run_batch, MIN_CONFIDENCE
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool batch",
+        description="Synch and trim the MVNX files listed in a manifest")
+    parser.add_argument("manifest", type=str,
+                        help="CSV or JSON file with one row per job")
+    parser.add_argument("-r", "--report_path", type=str, default=None,
+                        help="JSON lines report (default: manifest+.report)")
+    parser.add_argument("-j", "--num_processes", type=int, default=None,
+                        help="no. of parallel workers (default: no. of CPUs)")
+    parser.add_argument("-R", "--restart", action="store_true",
+                        help="If given, rerun all jobs instead of resuming")
+    parser.add_argument("-c", "--min_confidence", type=float,
+                        default=MIN_CONFIDENCE,
+                        help="Minimal correlation to accept a non-exact match")
+    add_validation_args(parser, "-V")
+    parser.add_argument("-p", "--pretty_print",
+                        help="If given, exported MVNX is indented",
+                        action="store_true")
+    args = parser.parse_args(argv)
+    #
+    report = run_batch(args.manifest, args.report_path, args.num_processes,
+                       not args.restart, args.min_confidence,
+                       args.validate_mvnx, args.pretty_print)
+    num_failed = sum([r["status"] != "ok" for r in report.values()])
+    print("[batch] done:", len(report) - num_failed, "ok,", num_failed,
+          "failed")
+    return num_failed == 0
+
+
+def claps_main(argv):
+    """
+    List the clap candidates of a take. See ``claps`` module.
+    """
+    from .claps import clap_candidates_wav, NUM_CANDIDATES
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool claps",
+        description="List candidate anchors at slate claps")
+    parser.add_argument("-w", "--wav_path", help="absolute path",
+                        required=True)
+    parser.add_argument("-m", "--mvnx_path", help="absolute path",
+                        type=str, required=True)
+    parser.add_argument("-n", "--num_candidates", type=int,
+                        default=NUM_CANDIDATES)
+    add_validation_args(parser)
+    args = parser.parse_args(argv)
+    #
+    mocap = Mvn(args.mvnx_path, args.validate_mvnx)
+    candidates = clap_candidates_wav(args.wav_path, mocap,
+                                     num_candidates=args.num_candidates)
+    print("frame\tsample\tscore")
+    for frame, sample, score in candidates:
+        print("%d\t%d\t%.3f" % (frame, sample, score))
+    return len(candidates) > 0
+
+
+def drift_main(argv):
+    """
+    Measure the clock drift along a take. See ``drift`` module.
+    """
+    import json
+    from .drift import drift_report_wav, WINDOW_SECS, SEARCH_SECS, MIN_SCORE
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool drift",
+        description="Report the drift between audio and MVN along a take")
+    parser.add_argument("-w", "--wav_path", help="absolute path",
+                        required=True)
+    parser.add_argument("-m", "--mvnx_path", help="absolute path",
+                        type=str, required=True)
+    parser.add_argument("-a", "--anchors", type=float, nargs=4, default=None,
+                        help="initial ori1 dest1 ori2 dest2 (default: auto)")
+    parser.add_argument("-W", "--window_secs", type=float,
+                        default=WINDOW_SECS)
+    parser.add_argument("-s", "--search_secs", type=float,
+                        default=SEARCH_SECS)
+    parser.add_argument("-c", "--min_score", type=float, default=MIN_SCORE,
+                        help="min. correlation of a window to be fitted")
+    parser.add_argument("-j", "--num_processes", type=int, default=None,
+                        help="no. of parallel workers (default: no. of CPUs)")
+    parser.add_argument("-o", "--out_path", type=str, default=None,
+                        help="If given, the report is saved here as JSON")
+    add_validation_args(parser)
+    args = parser.parse_args(argv)
+    #
+    mocap = Mvn(args.mvnx_path, args.validate_mvnx)
+    report = drift_report_wav(args.wav_path, mocap, args.anchors,
+                              args.window_secs, args.search_secs,
+                              args.min_score, args.num_processes)
+    print("frame\tsample\tscore\tresidual_ms")
+    for w in report["windows"]:
+        print("%.1f\t%.1f\t%.3f\t%.2f%s" % (
+            w["frame"], w["sample"], w["score"], w["residual_ms"],
+            "" if w["used"] else "\t(not used)"))
+    print("stretch:", report["stretch"], "shift:", report["shift"])
+    print("drift: %.2f ppm" % report["drift_ppm"])
+    print("residuals (ms): median %.2f, max %.2f (%d of %d windows)" % (
+        report["residual_ms_median"], report["residual_ms_max"],
+        report["num_used"], report["num_windows"]))
+    print("anchors:", " ".join(str(a) for a in report["anchors"]))
+    if args.out_path is not None:
+        with open(args.out_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print("saved report to", args.out_path)
+    return True
+
+
+def timecode_main(argv):
+    """
+    Synch a take via the BWF and MVN timecodes. See ``timecode`` module.
+    """
+    import json
+    from .utils import synch_to_anchors
+    from .timecode import timecode_synch_wav, ltc_synch_wav, DEFAULT_TIMEZONE
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool timecode",
+        description="Anchors from the timecodes of a BWF file (or LTC track)" +
+        " and an MVNX")
+    parser.add_argument("-w", "--wav_path", help="absolute path",
+                        required=True)
+    parser.add_argument("-m", "--mvnx_path", help="absolute path",
+                        type=str, required=True)
+    parser.add_argument("-s", "--source", choices=["tc", "ms"], default="tc",
+                        help="MVN frame attribute holding the time")
+    parser.add_argument("-f", "--tc_fps", type=float, default=None,
+                        help="timecode rate if the last tc field are frames")
+    parser.add_argument("-t", "--timezone", type=str,
+                        default=DEFAULT_TIMEZONE,
+                        help="timezone of the recorder clock (for ms)")
+    parser.add_argument("-l", "--ltc_channel", type=int, default=None,
+                        help="If given, decode the LTC on this WAV channel" +
+                        " and fit it to the MVN tc, instead of using BWF")
+    parser.add_argument("-F", "--ltc_fps", type=float, default=None,
+                        help="LTC rate (default: estimated)")
+    parser.add_argument("-o", "--out_path", type=str, default=None,
+                        help="If given, the result is saved here as JSON")
+    add_validation_args(parser)
+    args = parser.parse_args(argv)
+    #
+    mocap = Mvn(args.mvnx_path, args.validate_mvnx)
+    if args.ltc_channel is None:
+        stretch, shift, residual_ms = timecode_synch_wav(
+            args.wav_path, mocap, args.source, args.tc_fps, args.timezone)
+    else:
+        stretch, shift, residual_ms = ltc_synch_wav(
+            args.wav_path, mocap, args.ltc_fps, args.ltc_channel,
+            args.tc_fps)
+    indexes = mocap.get_frame_indexes()
+    anchors = synch_to_anchors(stretch, shift, int(indexes[0]),
+                               int(indexes[-1]))
+    print("anchors:", " ".join(str(a) for a in anchors))
+    if args.out_path is not None:
+        with open(args.out_path, "w") as f:
+            json.dump({"stretch": stretch, "shift": shift,
+                       "residual_ms": residual_ms,
+                       "anchors": list(anchors)}, f, indent=2)
+        print("saved result to", args.out_path)
+    return True
+
+
+def apply_main(argv):
+    """
+    Apply anchors to MVNX files without loading them. See ``apply`` module.
+    """
+    from .apply import apply_anchors, CHUNK_FRAMES
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool apply",
+        description="Stream MVNX files, adding the audio_sample and" +
+        " wav_file given by the anchors. Repeat -m and -o (and optionally" +
+        " -a and -w) for each file")
+    parser.add_argument("-m", "--mvnx_path", help="input MVNX",
+                        type=str, action="append", required=True)
+    parser.add_argument("-a", "--anchors", type=float, nargs="+",
+                        action="append", required=True,
+                        help="ori1 dest1 ori2 dest2 (ori3 dest3 ...)")
+    parser.add_argument("-o", "--out_path", help="output MVNX",
+                        type=str, action="append", required=True)
+    parser.add_argument("-w", "--wav", type=str, action="append",
+                        default=None,
+                        help="WAV whose name is stored in the output")
+    parser.add_argument("-c", "--chunk_frames", type=int,
+                        default=CHUNK_FRAMES,
+                        help="frames whose audio samples are set at once")
+    args = parser.parse_args(argv)
+    #
+    num_files = len(args.mvnx_path)
+    if len(args.out_path) != num_files:
+        parser.error("expected one --out_path per --mvnx_path")
+    per_file = per_file_args(parser, num_files, anchors=args.anchors,
+                             wav=args.wav)
+    num_failed = 0
+    for mvnx_path, out_path, anchors, wav in zip(
+            args.mvnx_path, args.out_path, per_file["anchors"],
+            per_file["wav"]):
+        try:
+            apply_anchors(mvnx_path, out_path, anchors, wav,
+                          args.chunk_frames)
+        except Exception as e:
+            num_failed += 1
+            print("[apply] FAILED:", mvnx_path, "->", out_path, e)
+    print("[apply] done:", num_files - num_failed, "ok,", num_failed,
+          "failed")
+    return num_failed == 0
+
+
+def columns_main(argv):
+    """
+    Export MVNX files as memory-mappable arrays. See ``columnar`` module.
+    """
+    from .utils import split_anchors
+    from .columnar import CHUNK_FRAMES
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool columns",
+        description="Save the normal frames of MVNX files as .npy arrays" +
+        " plus a JSON sidecar. Repeat -m and -o (and optionally -a) for" +
+        " each file")
+    parser.add_argument("-m", "--mvnx_path", help="input MVNX",
+                        type=str, action="append", required=True)
+    parser.add_argument("-o", "--out_dir", help="output directory",
+                        type=str, action="append", required=True)
+    parser.add_argument("-a", "--anchors", type=float, nargs="+",
+                        action="append", default=None,
+                        help="If given, ori1 dest1 ori2 dest2 (...) to" +
+                        " synch before exporting")
+    parser.add_argument("-c", "--chunk_frames", type=int,
+                        default=CHUNK_FRAMES,
+                        help="frames decoded at once")
+    add_validation_args(parser)
+    args = parser.parse_args(argv)
+    #
+    num_files = len(args.mvnx_path)
+    if len(args.out_dir) != num_files:
+        parser.error("expected one --out_dir per --mvnx_path")
+    per_file = per_file_args(parser, num_files, anchors=args.anchors)
+    num_failed = 0
+    for mvnx_path, out_dir, anchors in zip(args.mvnx_path, args.out_dir,
+                                           per_file["anchors"]):
+        try:
+            mocap = Mvn(mvnx_path, args.validate_mvnx)
+            if anchors is not None:
+                oris, dests = split_anchors(anchors)
+                mocap.set_audio_warp(oris, dests)
+            mocap.export_columns(out_dir, args.chunk_frames)
+        except Exception as e:
+            num_failed += 1
+            print("[columns] FAILED:", mvnx_path, "->", out_dir, e)
+    print("[columns] done:", num_files - num_failed, "ok,", num_failed,
+          "failed")
+    return num_failed == 0
+
+
+def features_main(argv):
+    """
+    Per-frame audio features of synched takes. See ``features`` module.
+    """
+    from .features import extract_features, FEATURE_NAMES
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool features",
+        description="Save the audio features (%s) of each normal frame of" %
+        ", ".join(FEATURE_NAMES) + " synched takes as .npy arrays")
+    parser.add_argument("-m", "--take_paths", type=str, nargs="+",
+                        required=True,
+                        help="synched MVNX files or their columns dirs")
+    parser.add_argument("-o", "--out_dir", help="directory to save features",
+                        type=str, required=True)
+    parser.add_argument("-W", "--wav_dir",
+                        help="dir with the WAV files (default: take dir)",
+                        type=str, default=None)
+    parser.add_argument("-s", "--window_size", type=int, default=None,
+                        help="audio samples per frame window (default:" +
+                        " power of 2 covering a frame period)")
+    parser.add_argument("-j", "--num_processes", type=int, default=None,
+                        help="no. of parallel workers (default: no. of CPUs)")
+    args = parser.parse_args(argv)
+    #
+    results = extract_features(args.take_paths, args.out_dir,
+                               args.num_processes, wav_dir=args.wav_dir,
+                               window_size=args.window_size)
+    num_failed = sum([err is not None for _, _, err in results])
+    print("[features] done:", len(results) - num_failed, "ok,", num_failed,
+          "failed")
+    return num_failed == 0
+
+
+# Subcommands are dispatched by their name as first CLI argument. Any other
+# arguments open the interactive GUI.
+SUBCOMMANDS = {"render": render_main, "batch": batch_main,
+               "claps": claps_main, "drift": drift_main,
+               "timecode": timecode_main, "apply": apply_main,
+               "columns": columns_main, "features": features_main}
+
+
 # #############################################################################
 # ## MAIN ROUTINE
 # #############################################################################
@@ -77,16 +502,23 @@ def main():
     5. Optionally export plot and metrics
     6. Optionally show interactive plot
     7. Send plot and metrics to TensorBoard
+
+    If the first argument is one of ``SUBCOMMANDS``, the corresponding
+    subcommand is run instead. The profiling flags (see ``profiling``) are
+    accepted anywhere.
     """
+    argv = pop_profile_args(sys.argv[1:])
+    if argv and argv[0] in SUBCOMMANDS:
+        with span("cli." + argv[0]):
+            success = SUBCOMMANDS[argv[0]](argv[1:])
+        sys.exit(0 if success else 1)
     # parse arguments from command line:
     parser = argparse.ArgumentParser(description="GUI to test WAV-MVNX synch")
     parser.add_argument("-w", "--wav_path", help="absolute path",
                         required=True)
     parser.add_argument("-m", "--mvnx_path", help="absolute path",
                         type=str, required=True)
-    parser.add_argument("-v", "--validate_mvnx",
-                        help="If given, the MVNX is validated to our schema",
-                        action="store_true")
+    add_validation_args(parser)
     parser.add_argument("-n", "--max_samples_plotted",
                         help="no. of samples per track to show (helps speed)",
                         type=int, default=10000)
@@ -95,7 +527,15 @@ def main():
                         type=int, default=20)
     parser.add_argument("-c", "--check_mode", action="store_true",
                         help="If given, opens in check mode (instead of edit)")
-    args = parser.parse_args()
+    parser.add_argument("-A", "--autosynch", action="store_true",
+                        help="If given, edit mode prefills estimated anchors")
+    parser.add_argument("-T", "--timecode", action="store_true",
+                        help="If given, edit mode prefills BWF timecode " +
+                        "anchors")
+    parser.add_argument("-H", "--performance_hud", action="store_true",
+                        help="If given, the latencies display is shown" +
+                        " from the start (toggled by a toolbar button)")
+    args = parser.parse_args(argv)
 
     # main globals
     WAV_PATH = args.wav_path
@@ -104,6 +544,8 @@ def main():
     MAX_SAMPLES_PLOTTED = args.max_samples_plotted
     NUM_XTICKS = args.num_xticks
     CHECK_MODE = args.check_mode
+    AUTOSYNCH = args.autosynch
+    TIMECODE = args.timecode
     #
     if CHECK_MODE:
         fig = get_test_fig(WAV_PATH, MVNX_PATH, VALIDATE_MVNX,
@@ -111,8 +553,11 @@ def main():
         fig.suptitle("Check Mode")
     else:  # edit mode
         fig = get_edit_fig(WAV_PATH, MVNX_PATH, VALIDATE_MVNX,
-                           MAX_SAMPLES_PLOTTED, NUM_XTICKS)
+                           MAX_SAMPLES_PLOTTED, NUM_XTICKS, AUTOSYNCH,
+                           TIMECODE)
         fig.suptitle("Edit Mode")
+    if args.performance_hud:
+        fig.hud.show()
     #
     fig.show()
     input("press any key into this terminal to exit")
@@ -0,0 +1,258 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains the functionality to apply known anchors to MVNX files
+without ever building their full tree: the input is parsed incrementally
+(``lxml.etree.iterparse``), the ``audio_sample`` of each normal frame and the
+``wav_file`` of the root are injected on the fly, and the output is written
+element by element, releasing the parsed frames. The memory is therefore
+independent of the number of frames, and the result is equivalent to
+setting the anchors with ``Mvn.set_audio_warp`` and exporting it, as done
+by the ``SynchAndSaveMvnButton`` of the GUI::
+
+  apply_anchors("in.mvnx", "out.mvnx", [o1, d1, o2, d2], "name.wav")
+
+The elements on the path to the frames (see ``STREAMED_TAGS``) are written
+as separate start and end tags, and every other element as a whole, each on
+its own line.
+"""
+
+
+import os
+#
+import numpy as np
+from lxml import etree
+#
+from .utils import make_timestamp, split_anchors, convert_anchors
+from .utils import piecewise_linear_map
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+STREAMED_TAGS = {"mvnx", "subject", "frames"}  # written as start/end tags
+CHUNK_FRAMES = 4096  # frames held in memory to compute their samples at once
+XML_DECLARATION = b'<?xml version="1.0" encoding="UTF-8"?>\n'
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def anchored_audio_samples(indexes, oris, dests):
+    """
+    :param indexes: The ``index`` attributes of some normal frames.
+    :param oris: Frame indexes of at least 2 anchors.
+    :param dests: Corresponding audio samples, same length as ``oris``.
+    :returns: An int64 array with the ``audio_sample`` of each given frame,
+      exactly as ``Mvn.set_audio_warp`` computes it.
+    """
+    indexes = np.asarray(indexes, dtype=np.float64)
+    if len(oris) == 2:
+        stretch, shift = convert_anchors(oris[0], dests[0], oris[1], dests[1])
+        audio_idxs = np.rint(indexes * float(stretch) + float(shift))
+    else:
+        audio_idxs = np.rint(piecewise_linear_map(indexes, oris, dests))
+    return audio_idxs.astype(np.int64)
+
+
+def _localname(el):
+    """
+    :returns: The tag of the given element without namespace, or None for
+      comments and processing instructions.
+    """
+    return etree.QName(el).localname if isinstance(el.tag, str) else None
+
+
+class _StreamWriter(object):
+    """
+    Serializes the elements of a document in the same order as they are
+    parsed. Since every element is serialized on its own, lxml declares the
+    default namespace on each one: this declaration is removed, since it is
+    already declared by the root.
+    """
+
+    def __init__(self, f, default_ns=None):
+        """
+        :param f: A file opened in binary mode.
+        """
+        self.f = f
+        self.ns_decl = (None if default_ns is None else
+                        (' xmlns="%s"' % default_ns).encode("utf-8"))
+
+    def _tostring(self, el, is_root=False):
+        """
+        """
+        data = etree.tostring(el, encoding="UTF-8", xml_declaration=False,
+                              with_tail=False)
+        if self.ns_decl is not None and not is_root:
+            data = data.replace(self.ns_decl, b"", 1)
+        return data
+
+    def start(self, el, attrib=None, is_root=False):
+        """
+        Writes the start tag of the given element, with the given attributes
+        (default: its own).
+        """
+        shallow = etree.Element(el.tag, el.attrib if attrib is None else
+                                attrib, nsmap=el.nsmap)
+        data = self._tostring(shallow, is_root)
+        assert data.endswith(b"/>"), "Unexpected start tag: %s" % data
+        self.f.write(data[:-2] + b">\n")
+
+    def end(self, el):
+        """
+        """
+        name = _localname(el)
+        if el.prefix:
+            name = el.prefix + ":" + name
+        self.f.write(("</%s>\n" % name).encode("utf-8"))
+
+    def write(self, el):
+        """
+        Writes the whole given element.
+        """
+        self.f.write(self._tostring(el) + b"\n")
+
+
+class _AnchorStream(object):
+    """
+    Receives the events of ``iterparse`` (restricted to the
+    ``STREAMED_TAGS`` and the frames) and writes the elements as soon as
+    they are complete, adding the audio samples to the normal frames.
+    """
+
+    def __init__(self, f, oris, dests, root_attrib, chunk_frames):
+        """
+        :param dict root_attrib: Attributes added to the root.
+        """
+        self.f = f
+        self.oris, self.dests = oris, dests
+        self.root_attrib = root_attrib
+        self.chunk_frames = chunk_frames
+        self.writer = None
+        self.open_els = []  # streamed elements whose start tag was written
+        self.written = None  # written element kept as placeholder
+        self.num_pending = 0  # parsed frames not written yet
+        self.num_synched = 0
+
+    def _keep_placeholder(self, el):
+        """
+        """
+        el.clear()
+        self.written = el
+
+    def _write_children(self, parent, stop=None, last=None):
+        """
+        Writes the unwritten children of ``parent`` before ``stop``, or up
+        to ``last`` (which is then kept as placeholder, since the parser may
+        still append its tail), or all of them, and frees them. Events are
+        reported in batches, so later children may be under construction.
+        """
+        children = []
+        for ch in parent:
+            if ch is stop:
+                break
+            children.append(ch)
+            if ch is last:
+                break
+        new = [ch for ch in children if ch is not self.written]
+        normal = [ch for ch in new if _localname(ch) == "frame" and
+                  ch.get("type") == "normal"]
+        if normal:
+            samples = anchored_audio_samples(
+                [ch.get("index") for ch in normal], self.oris, self.dests)
+            for ch, a_idx in zip(normal, samples.tolist()):
+                ch.set("audio_sample", str(a_idx))
+        for ch in new:
+            self.writer.write(ch)
+        if last is not None:
+            self._keep_placeholder(children.pop())
+        for ch in children:
+            parent.remove(ch)
+        self.num_pending = 0
+        self.num_synched += len(normal)
+
+    def feed(self, event, el):
+        """
+        """
+        open_els = self.open_els
+        if not open_els:  # root start
+            assert _localname(el) == "mvnx", "Not an MVNX: %s" % el.tag
+            self.writer = _StreamWriter(self.f, el.nsmap.get(None))
+            attrib = dict(el.attrib)
+            attrib.update(self.root_attrib)
+            self.writer.start(el, attrib, is_root=True)
+            open_els.append(el)
+        elif el is open_els[-1]:  # end of a streamed element
+            self._write_children(el)
+            self.writer.end(el)
+            open_els.pop()
+            if open_els:
+                self._keep_placeholder(el)
+        elif el.getparent() is not open_els[-1]:
+            return  # inside of an element that is written as a whole
+        elif event == "start":
+            if _localname(el) != "frame":
+                self._write_children(open_els[-1], stop=el)
+                self.writer.start(el)
+                open_els.append(el)
+        else:  # end of a frame
+            self.num_pending += 1
+            if self.num_pending >= self.chunk_frames:
+                self._write_children(open_els[-1], last=el)
+
+
+# #############################################################################
+# ## APPLY ANCHORS
+# #############################################################################
+
+@profiled("apply.apply_anchors")
+def apply_anchors(mvnx_path, out_path, anchors, wav_path=None,
+                  chunk_frames=CHUNK_FRAMES, extra_comment=""):
+    """
+    Streams the given MVNX into ``out_path``, adding an ``audio_sample``
+    attribute to each normal frame as given by the anchors (see
+    ``Mvn.set_audio_warp``) and the ``wav_file`` and ``pythonComment``
+    attributes to the root. If it fails, no output is left behind.
+
+    :param anchors: The numbers ``ori1, dest1, ori2, dest2, ...`` of at least
+      2 anchor pairs (frame index, audio sample).
+    :param str wav_path: If given, its basename is stored as ``wav_file``.
+    :param int chunk_frames: Frames are written in chunks of this size,
+      whose audio samples are computed at once.
+    :returns: The number of normal frames that were synched.
+    """
+    oris, dests = split_anchors(anchors)
+    assert os.path.abspath(mvnx_path) != os.path.abspath(out_path), \
+        "Output can't overwrite the input while streaming it!"
+    assert chunk_frames > 0, "chunk_frames must be positive!"
+    root_attrib = {}
+    if wav_path is not None:
+        root_attrib["wav_file"] = os.path.basename(wav_path)
+    root_attrib["pythonComment"] = "Exported from %s on %s. " % (
+        "apply_anchors", make_timestamp()) + extra_comment
+    # only the streamed elements and the frames produce events. Any other
+    # element is written when the next event comes, from the parsed tree
+    events = etree.iterparse(mvnx_path, events=("start", "end"),
+                             tag=["{*}" + t for t in STREAMED_TAGS] +
+                             ["{*}frame"])
+    try:
+        with open(out_path, "wb") as f:
+            f.write(XML_DECLARATION)
+            stream = _AnchorStream(f, oris, dests, root_attrib, chunk_frames)
+            for event, el in events:
+                stream.feed(event, el)
+    except BaseException:
+        # don't leave a truncated output behind
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        raise
+    print("[apply] synched", stream.num_synched, "frames into", out_path)
+    return stream.num_synched
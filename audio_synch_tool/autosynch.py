@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains functionality to estimate the synchronization between
+an audio signal and an MVN automatically, to be used as a starting point in
+the editor instead of finding the anchors by eye.
+
+Both signals are reduced to envelopes at the MVN frame rate: an onset
+envelope for the audio (positive changes of the log-energy per frame), and
+the sum of the acceleration norms of the arms for the MVN. Claps, hits and
+other impacts show up as peaks in both. The MVN envelope is resampled for a
+small grid of stretch factors around the nominal frame rate, and for each
+one the normalized cross-correlation with the audio envelope is computed via
+FFT for all offsets (see ``locators.xcorr_overlap_save``). The best
+stretch and offset are then converted into ``(stretch, shift)`` in audio
+samples per frame index (see ``utils.convert_anchors``). Usage example::
+
+  mvn = Mvn("take.mvnx")
+  stretch, shift, score = autosynch_wav("take.wav", mvn)
+  anchors = synch_to_anchors(stretch, shift, ori1, ori2)
+
+The score is the Pearson correlation of the envelopes at the estimate, so
+values close to 0 mean that no reliable synchronization was found.
+"""
+
+
+import numpy as np
+import soundfile as sf
+#
+from .locators import xcorr_overlap_save
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+MOCAP_SEGMENTS = ["LeftForeArm", "LeftHand", "RightForeArm", "RightHand"]
+STRETCH_TOLERANCE = 0.002  # max. relative deviation from the nominal rate
+NUM_STRETCHES = 9  # size of the grid of stretch factors
+BLOCKSIZE = 2 ** 20  # frames per block when streaming WAV files
+
+
+# #############################################################################
+# ## ENVELOPES
+# #############################################################################
+
+def _add_frame_energy(sums, counts, block, offset, samplerate, frame_rate):
+    """
+    Adds the energy of each audio sample in ``block`` (whose first sample
+    has position ``offset``) to ``sums[k]``, where ``k`` is the MVN frame
+    containing the sample. The number of added samples goes to ``counts``.
+    """
+    if block.ndim > 1:
+        block = block.mean(axis=1)
+    positions = np.arange(offset, offset + len(block), dtype=np.float64)
+    frames = (positions * (frame_rate / samplerate)).astype(np.int64)
+    frames = np.minimum(frames, len(sums) - 1)
+    k0 = frames[0]
+    n = frames[-1] - k0 + 1
+    sums[k0:k0 + n] += np.bincount(frames - k0, block ** 2, minlength=n)
+    counts[k0:k0 + n] += np.bincount(frames - k0, minlength=n)
+
+
+def onset_envelope(sums, counts):
+    """
+    :returns: The positive part of the differences of the log-energy per
+      frame, given the energy ``sums`` and sample ``counts`` per frame.
+    """
+    energy = sums / np.maximum(counts, 1)
+    log_energy = np.log(energy + 1e-10)
+    return np.maximum(np.diff(log_energy, prepend=log_energy[0]), 0)
+
+
+def audio_envelope(audio, samplerate, frame_rate):
+    """
+    :param audio: Array of shape ``(samples,)`` or ``(samples, channels)``
+    :returns: The onset envelope of the audio, with one entry per MVN frame
+      (see ``onset_envelope``).
+    """
+    num_frames = int(np.ceil(len(audio) * frame_rate / samplerate))
+    sums, counts = np.zeros(num_frames), np.zeros(num_frames)
+    _add_frame_energy(sums, counts, audio, 0, samplerate, frame_rate)
+    return onset_envelope(sums, counts)
+
+
+@profiled("autosynch.wav_envelope")
+def wav_envelope(wav_path, frame_rate, blocksize=BLOCKSIZE):
+    """
+    Like ``audio_envelope``, but streams the given audio file in blocks.
+    """
+    info = sf.info(wav_path)
+    num_frames = int(np.ceil(info.frames * frame_rate / info.samplerate))
+    sums, counts = np.zeros(num_frames), np.zeros(num_frames)
+    offset = 0
+    for block in sf.blocks(wav_path, blocksize=blocksize):
+        _add_frame_energy(sums, counts, block, offset, info.samplerate,
+                          frame_rate)
+        offset += len(block)
+    return onset_envelope(sums, counts)
+
+
+@profiled("autosynch.mocap_envelope")
+def mocap_envelope(mvn, segment_names=MOCAP_SEGMENTS):
+    """
+    :returns: The sum of the acceleration norms of the given segments, with
+      one entry per normal frame.
+    """
+    return mvn.extract_accel_norms(segment_names).sum(axis=1)
+
+
+# #############################################################################
+# ## ESTIMATION
+# #############################################################################
+
+def xcorr_peak(audio_env, mocap_env):
+    """
+    :returns: A tuple ``(lag, score)``, where the MVN envelope placed at
+      ``lag`` (possibly negative, with subsample precision) in the audio
+      envelope has the maximal correlation ``score``.
+    """
+    if len(mocap_env) <= len(audio_env):
+        signal, template, sign = audio_env, mocap_env, 1
+    else:
+        signal, template, sign = mocap_env, audio_env, -1
+    ncc = np.concatenate([n for _, n in xcorr_overlap_save([signal],
+                                                           template)])
+    k = int(ncc.argmax())
+    # refine the peak with a parabola through its neighbours
+    delta = 0.0
+    if 0 < k < len(ncc) - 1:
+        left, mid, right = ncc[k - 1], ncc[k], ncc[k + 1]
+        curvature = left - 2 * mid + right
+        if curvature < 0:
+            delta = 0.5 * (left - right) / curvature
+    return sign * (k + delta), float(ncc[k])
+
+
+def _moving_average(arr, width):
+    """
+    :returns: The centered moving average of ``arr`` over ``width`` entries,
+      with the same length as ``arr``. Computed via cumsum in linear time.
+    """
+    width = int(round(width))
+    if width <= 1:
+        return arr
+    cs = np.concatenate(([0.0], np.cumsum(arr)))
+    beg = np.clip(np.arange(len(arr)) - width // 2, 0, len(arr))
+    end = np.clip(beg + width, 0, len(arr))
+    return (cs[end] - cs[beg]) / (end - beg)
+
+
+@profiled("autosynch.estimate_synch")
+def estimate_synch(audio_env, mocap_env, stretch_tolerance=STRETCH_TOLERANCE,
+                   num_stretches=NUM_STRETCHES):
+    """
+    Coarse-to-fine search of the stretch factor: a grid of ``num_stretches``
+    factors is evaluated and then zoomed around the best one, until
+    neighbouring factors drift less than 1 frame apart along the MVN. At each
+    level, both envelopes are smoothed by the drift between neighbouring
+    factors, so that sharp peaks still overlap for a nearly right factor.
+
+    :param audio_env: Audio envelope at the MVN frame rate.
+    :param mocap_env: MVN envelope, one entry per normal frame.
+    :returns: A tuple ``(ratio, lag, score)`` such that normal frame ``j``
+      corresponds to the audio envelope position ``j * ratio + lag``, where
+      ``ratio`` is around 1 and ``score`` is the correlation of the envelopes
+      at that position.
+    """
+    def standardize(x):
+        x = np.asarray(x, dtype=np.float64)
+        return (x - x.mean()) / (x.std() + 1e-10)
+
+    def correlate(ratio, smoothing):
+        # resample the mocap envelope so one entry is one audio envelope entry
+        new_len = int((len(mocap_env) - 1) * ratio) + 1
+        resampled = np.interp(np.arange(new_len) / ratio,
+                              np.arange(len(mocap_env)), mocap_env)
+        return xcorr_peak(_moving_average(audio_env, smoothing),
+                          _moving_average(resampled, smoothing))
+    #
+    audio_env, mocap_env = standardize(audio_env), standardize(mocap_env)
+    center, half_range = 1.0, stretch_tolerance
+    while True:
+        ratios = center + np.linspace(-half_range, half_range, num_stretches)
+        step = ratios[1] - ratios[0]
+        drift = step * len(mocap_env)
+        scores = [correlate(r, drift)[1] for r in ratios]
+        center, half_range = ratios[int(np.argmax(scores))], step
+        if drift <= 1:
+            break
+    lag, score = correlate(center, 1)
+    return float(center), lag, score
+
+
+def autosynch(audio, samplerate, mvn, **kwargs):
+    """
+    Estimates the synchronization between an audio array and an Mvn.
+
+    :param audio: Array of shape ``(samples,)`` or ``(samples, channels)``
+    :param Mvn mvn: The Mvn to be synched.
+    :param kwargs: Further keyword arguments for ``estimate_synch``.
+    :returns: A tuple ``(stretch, shift, score)``, such that the normal frame
+      with a given index corresponds to the audio sample
+      ``index * stretch + shift`` (see ``Mvn.set_audio_synch``).
+    """
+    frame_rate = float(mvn.mvn.subject.attrib["frameRate"])
+    audio_env = audio_envelope(audio, samplerate, frame_rate)
+    return _envelopes_to_synch(audio_env, samplerate, mvn, **kwargs)
+
+
+def autosynch_wav(wav_path, mvn, blocksize=BLOCKSIZE, **kwargs):
+    """
+    Like ``autosynch``, but streams the audio from the given file.
+    """
+    frame_rate = float(mvn.mvn.subject.attrib["frameRate"])
+    audio_env = wav_envelope(wav_path, frame_rate, blocksize)
+    samplerate = sf.info(wav_path).samplerate
+    return _envelopes_to_synch(audio_env, samplerate, mvn, **kwargs)
+
+
+def _envelopes_to_synch(audio_env, samplerate, mvn, **kwargs):
+    """
+    Helper for ``autosynch``: runs ``estimate_synch`` and converts its result
+    into stretch and shift in audio samples per frame index.
+    """
+    frame_rate = float(mvn.mvn.subject.attrib["frameRate"])
+    first_idx = int(mvn.get_frame_indexes()[0])
+    ratio, lag, score = estimate_synch(audio_env, mocap_envelope(mvn),
+                                       **kwargs)
+    samples_per_frame = samplerate / frame_rate
+    stretch = ratio * samples_per_frame
+    shift = (lag - first_idx * ratio) * samples_per_frame
+    print("[autosynch] stretch =", stretch, "shift =", shift,
+          "score =", score)
+    return stretch, shift, score
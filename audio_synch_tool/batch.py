@@ -0,0 +1,341 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains the functionality to run ``synch_and_trim_mvn.py`` on
+many takes at once, as described by a manifest file. Each job has the
+following fields:
+
+* ``shorter_wav``: The WAV the synched MVNX will refer to
+* ``longer_wav``: The WAV the anchors refer to, containing ``shorter_wav``
+* ``mvnx``: The MVNX to be synched and trimmed
+* ``anchors``: The numbers ``ori1 dest1 ori2 dest2``, optionally followed
+  by more ``ori dest`` pairs for a piecewise-linear synch (see
+  ``Mvn.set_audio_warp``)
+* ``out_path`` (optional): Where to save the result. If empty, the same
+  default as in ``synch_and_trim_mvn.py`` is used.
+
+Manifests can be CSV files with a header row containing these field names
+(anchors separated by whitespace), or JSON files with a list of objects
+(anchors as a list or a string). Relative paths are resolved with respect
+to the manifest's directory.
+
+Jobs sharing a longer WAV are grouped, so that each longer WAV is streamed
+only once to locate all its shorter WAVs (see ``locators.locate_wavs``).
+The groups are located in a process pool, and then each job is synched and
+trimmed as its own pool task. Each finished job is appended as a JSON line
+to a report file with its status and timings as soon as it finishes. When
+run again, jobs reported as successful whose output exists are skipped, so
+an interrupted batch resumes where it stopped. Jobs are identified by their
+contents (see ``job_key``), so the manifest can be reordered or extended in
+between. If a shorter WAV has a different samplerate than its longer WAV,
+its audio samples are rescaled to it (see ``synch_and_trim``). Usage example::
+
+  report = run_batch("manifest.csv", num_processes=4)
+"""
+
+
+import os
+import csv
+import json
+import time
+import hashlib
+import multiprocessing
+#
+import soundfile as sf
+#
+from .utils import split_anchors
+from .mvn import Mvn
+from .locators import locate_wavs, xcorr_locate_wav
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+MIN_CONFIDENCE = 0.5  # min. xcorr confidence to accept a non-exact match
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def default_out_path(mvnx_path, anchors):
+    """
+    :returns: The path ``<mvnx_path>_o1d1o2d2=<o1>_<d1>_<o2>_<d2>``, where
+      integer anchors are printed without decimals. For more than 2 anchor
+      pairs, the prefix is ``_anchors=`` instead.
+    """
+    strs = [str(int(a) if float(a).is_integer() else a) for a in anchors]
+    prefix = "_o1d1o2d2=" if len(anchors) == 4 else "_anchors="
+    return mvnx_path + prefix + "_".join(strs)
+
+
+def locate_shorter_wavs(short_paths, long_path,
+                        min_confidence=MIN_CONFIDENCE):
+    """
+    Locates the given shorter WAVs in the longer one, streaming it once for
+    all of them. Shorter WAVs that aren't a bit-exact slice are located via
+    cross-correlation instead.
+
+    :returns: A list with one ``(beg, end, confidence)`` tuple per shorter
+      WAV, where confidence is 1.0 for exact matches. Entries are None if the
+      shorter WAV wasn't found with at least ``min_confidence``.
+    """
+    results = []
+    for sp, pos in zip(short_paths, locate_wavs(short_paths, long_path)):
+        if pos is not None:
+            results.append((pos[0], pos[1], 1.0))
+            continue
+        xc = xcorr_locate_wav(sp, long_path)
+        if xc is not None and xc[2] >= min_confidence:
+            results.append(xc)
+        else:
+            results.append(None)
+    return results
+
+
+def synch_and_trim(shorter_wav, mvnx_path, anchors, beg, end, out_path,
+                   validate_mvnx=False, pretty_print=False,
+                   long_samplerate=None):
+    """
+    Synchs the given MVNX to the longer WAV via the anchors, trims it to the
+    ``[beg, end]`` range of the longer WAV (where the shorter one is), makes
+    it refer to the shorter WAV and exports it to ``out_path``.
+
+    :param anchors: The numbers ``ori1, dest1, ori2, dest2, ...``. With more
+      than 2 pairs, the synch is piecewise-linear (see
+      ``Mvn.set_audio_warp``).
+    :param long_samplerate: The samplerate of the longer WAV. If given and
+      different from the one of the shorter WAV (e.g. a resampled snippet
+      located via ``xcorr_locate_wav``), the audio samples are rescaled to
+      the shorter WAV.
+    """
+    scale = 1
+    if long_samplerate is not None:
+        scale = sf.info(shorter_wav).samplerate / long_samplerate
+    oris, dests = split_anchors(anchors)
+    mocap = Mvn(mvnx_path, validate_mvnx)
+    mocap.set_audio_warp(oris, dests)
+    mocap.mvn.attrib["wav_file"] = os.path.basename(shorter_wav)
+    mocap.trim_to_audio_range(beg, end, scale)
+    mocap.export(out_path, pretty_print=pretty_print, extra_comment="")
+
+
+# #############################################################################
+# ## MANIFEST
+# #############################################################################
+
+def _parse_anchors(anchors):
+    """
+    :returns: A list of floats, from a list or whitespace-separated string.
+    """
+    if isinstance(anchors, str):
+        anchors = anchors.split()
+    anchors = [float(a) for a in anchors]
+    split_anchors(anchors)
+    return anchors
+
+
+def job_key(job):
+    """
+    :returns: A hash of the paths and anchors of the given job, identifying
+      it in the report regardless of its position in the manifest.
+    """
+    fields = [job[k] for k in ("shorter_wav", "longer_wav", "mvnx",
+                               "anchors", "out_path")]
+    return hashlib.sha1(json.dumps(fields).encode("utf-8")).hexdigest()
+
+
+def load_manifest(manifest_path):
+    """
+    :returns: A list of job dicts with the fields described in the module
+      docstring, plus the ``job`` field with the job's position in the
+      manifest and its ``key`` (see ``job_key``). Paths are absolute and
+      ``out_path`` is always given.
+    """
+    if manifest_path.lower().endswith(".json"):
+        with open(manifest_path) as f:
+            rows = json.load(f)
+    else:
+        with open(manifest_path, newline="") as f:
+            rows = list(csv.DictReader(f))
+    base_dir = os.path.dirname(os.path.abspath(manifest_path))
+    jobs = []
+    for i, row in enumerate(rows):
+        job = {"job": i}
+        for k in ("shorter_wav", "longer_wav", "mvnx"):
+            job[k] = os.path.join(base_dir, row[k])
+        job["anchors"] = _parse_anchors(row["anchors"])
+        out_path = row.get("out_path")
+        job["out_path"] = (os.path.join(base_dir, out_path) if out_path else
+                           default_out_path(job["mvnx"], job["anchors"]))
+        job["key"] = job_key(job)
+        jobs.append(job)
+    return jobs
+
+
+def load_report(report_path):
+    """
+    :returns: A dict ``{key: record}`` with the last record of each job key
+      in the given JSON lines report, empty if it doesn't exist.
+    """
+    result = {}
+    if os.path.isfile(report_path):
+        with open(report_path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    result[record["key"]] = record
+    return result
+
+
+def group_jobs(jobs):
+    """
+    :returns: A list of job lists, one per distinct ``longer_wav``, in order
+      of first appearance.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(job["longer_wav"], []).append(job)
+    return list(groups.values())
+
+
+# #############################################################################
+# ## BATCH RUNNER
+# #############################################################################
+
+def _fail(record, exc):
+    """
+    """
+    record["status"] = "failed"
+    record["error"] = "%s: %s" % (exc.__class__.__name__, exc)
+
+
+def _locate_group(args):
+    """
+    Process pool worker: locates all shorter WAVs of a group in its longer
+    WAV, streaming it only once.
+
+    :param args: A tuple ``(jobs, min_confidence)``
+    :returns: A list with one ``(job, record)`` pair per job, where the
+      report record (dict) has status ``failed`` if the job can't be run,
+      and no status otherwise.
+    """
+    jobs, min_confidence = args
+    long_path = jobs[0]["longer_wav"]
+    result = [(j, {"job": j["job"], "key": j["key"], "mvnx": j["mvnx"],
+                   "out_path": j["out_path"]}) for j in jobs]
+    # check the shorter WAVs first, so a broken one doesn't fail the group
+    short_infos = {}
+    for j, r in result:
+        try:
+            short_infos[j["job"]] = sf.info(j["shorter_wav"])
+        except Exception as e:
+            _fail(r, e)
+    valid = [(j, r) for j, r in result if j["job"] in short_infos]
+    if not valid:
+        return result
+    t0 = time.time()
+    try:
+        long_samplerate = sf.info(long_path).samplerate
+        positions = locate_shorter_wavs([j["shorter_wav"] for j, _ in valid],
+                                        long_path, min_confidence)
+    except Exception as e:
+        for _, r in valid:
+            _fail(r, e)
+        return result
+    locate_secs = (time.time() - t0) / len(valid)
+    #
+    for (j, r), pos in zip(valid, positions):
+        r["locate_secs"] = locate_secs
+        if pos is None:
+            _fail(r, AssertionError("shorter wav not in longer wav"))
+            continue
+        beg, end, confidence = pos
+        r.update({"beg": int(beg), "end": int(end),
+                  "confidence": float(confidence)})
+        j["long_samplerate"] = long_samplerate
+        short_samplerate = short_infos[j["job"]].samplerate
+        if short_samplerate != long_samplerate:
+            r["rescaled"] = short_samplerate / long_samplerate
+    return result
+
+
+def _run_job(args):
+    """
+    Process pool worker: synchs and trims a located job.
+
+    :param args: A tuple ``(job, record, validate_mvnx, pretty_print)``,
+      where the record is the one returned by ``_locate_group``.
+    :returns: The completed report record.
+    """
+    j, r, validate_mvnx, pretty_print = args
+    t0 = time.time()
+    try:
+        synch_and_trim(j["shorter_wav"], j["mvnx"], j["anchors"],
+                       r["beg"], r["end"], j["out_path"], validate_mvnx,
+                       pretty_print, j["long_samplerate"])
+        r["status"] = "ok"
+    except Exception as e:
+        _fail(r, e)
+    r["synch_secs"] = time.time() - t0
+    return r
+
+
+def _report_record(report_f, report, record):
+    """
+    Appends the record to the report file and flushes it, so a crash loses
+    at most the running jobs.
+    """
+    report_f.write(json.dumps(record) + "\n")
+    report_f.flush()
+    report[record["key"]] = record
+    if record["status"] == "ok":
+        print("[batch] job %d ok: %s" % (record["job"], record["out_path"]))
+    else:
+        print("[batch] job %d FAILED: %s" % (record["job"], record["error"]))
+
+
+def run_batch(manifest_path, report_path=None, num_processes=None,
+              resume=True, min_confidence=MIN_CONFIDENCE,
+              validate_mvnx=False, pretty_print=False):
+    """
+    Runs all jobs of the given manifest. See module docstring.
+
+    :param str report_path: JSON lines file where one record per finished
+      job is appended. Defaults to ``<manifest_path>.report.jsonl``.
+    :param int num_processes: Max. number of groups located, and jobs
+      synched, in parallel. If None, the number of CPUs is used.
+    :param bool resume: If true, jobs reported as successful in an existing
+      report, and whose output exists, are skipped.
+    :returns: A dict ``{job: record}`` with the latest record of every job
+      of the manifest that has been run (including the skipped ones), by
+      position in the manifest.
+    """
+    if report_path is None:
+        report_path = manifest_path + ".report.jsonl"
+    jobs = load_manifest(manifest_path)
+    report = load_report(report_path) if resume else {}
+    pending = [j for j in jobs
+               if not (report.get(j["key"], {}).get("status") == "ok" and
+                       os.path.isfile(j["out_path"]))]
+    print("[batch]", len(jobs) - len(pending), "of", len(jobs),
+          "jobs already done")
+    locate_tasks = [(g, min_confidence) for g in group_jobs(pending)]
+    with open(report_path, "a" if resume else "w") as report_f:
+        with multiprocessing.Pool(num_processes) as pool:
+            synch_tasks = []
+            for located in pool.imap_unordered(_locate_group, locate_tasks):
+                for j, r in located:
+                    if "status" in r:
+                        _report_record(report_f, report, r)
+                    else:
+                        synch_tasks.append((j, r, validate_mvnx,
+                                            pretty_print))
+            for r in pool.imap_unordered(_run_job, synch_tasks):
+                _report_record(report_f, report, r)
+    return {j["job"]: report[j["key"]] for j in jobs if j["key"] in report}
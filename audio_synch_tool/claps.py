@@ -0,0 +1,213 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains functionality to find slate claps in a take: sharp
+audio transients that coincide with acceleration spikes of the hands. The
+resulting ``(frame, sample)`` pairs are good candidates for the anchors.
+
+The audio is scanned in blocks: its energy is computed per hop of ``HOP``
+samples, and the positive changes of the log-energy (onsets) are picked as
+peaks, at least ``PEAK_WINDOW_SECS`` apart. The same is done for the sum
+of the hand acceleration norms of the MVN. Both peak strengths are robust
+z-scores (in median absolute deviations above the median), so they are
+comparable across takes.
+
+Since the synchronization isn't known, every audio peak is paired with
+every mocap peak. Each pair implies a shift (assuming the nominal
+samplerates), and true claps imply approximately the same shift. Pairs are
+ranked by the total strength of the pairs that agree with them, so e.g. the
+start and end claps support each other. Usage example::
+
+  mvn = Mvn("take.mvnx")
+  for frame, sample, score in clap_candidates_wav("take.wav", mvn):
+      print(frame, sample, score)
+"""
+
+
+import numpy as np
+import soundfile as sf
+#
+from .autosynch import STRETCH_TOLERANCE
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+HAND_SEGMENTS = ["LeftHand", "RightHand"]
+HOP = 64  # audio samples per energy value
+PEAK_WINDOW_SECS = 0.25  # min. distance between peaks
+THRESHOLD_MADS = 12  # peaks must be this many MADs above the median
+MAX_PEAKS = 50  # max. number of peaks per signal
+NUM_CANDIDATES = 20
+BLOCKSIZE = 2 ** 20  # frames per block when streaming WAV files
+
+
+# #############################################################################
+# ## PEAK DETECTION
+# #############################################################################
+
+def robust_zscores(arr, reference=None):
+    """
+    :param reference: If given, the median and MAD are computed on this
+      array instead of ``arr``.
+    :returns: The distance of each entry to the median of ``arr``, in median
+      absolute deviations (MAD). If the MAD is zero, e.g. because most
+      entries are equal, the standard deviation is used instead.
+    """
+    if reference is None or len(reference) == 0:
+        reference = arr
+    median = np.median(reference)
+    scale = np.median(np.abs(reference - median))
+    if scale == 0:
+        scale = reference.std()
+    return (arr - median) / (scale + 1e-10)
+
+
+def pick_peaks(arr, window, max_peaks=MAX_PEAKS,
+               threshold_mads=THRESHOLD_MADS):
+    """
+    Greedy non-maximum suppression: the strongest entries are picked, and
+    their neighbours within ``window`` entries are discarded.
+
+    :returns: A tuple ``(positions, strengths)`` of arrays with at most
+      ``max_peaks`` peaks of ``arr`` above the threshold, sorted by
+      decreasing strength. Strengths are given as robust z-scores of the
+      positive entries, since rectified signals are mostly zero.
+    """
+    z = robust_zscores(arr, arr[arr > 0])
+    cands = np.flatnonzero(z >= threshold_mads)
+    cands = cands[np.argsort(-z[cands], kind="stable")]
+    suppressed = np.zeros(len(arr), dtype=bool)
+    positions = []
+    for c in cands:
+        if suppressed[c]:
+            continue
+        positions.append(c)
+        suppressed[max(0, c - window):c + window + 1] = True
+        if len(positions) >= max_peaks:
+            break
+    positions = np.array(positions, dtype=np.int64)
+    return positions, z[positions]
+
+
+def audio_onsets(blocks, samplerate, hop=HOP,
+                 peak_window_secs=PEAK_WINDOW_SECS, **kwargs):
+    """
+    :param blocks: Iterable of consecutive audio arrays of shape
+      ``(samples,)`` or ``(samples, channels)``. All but the last one must
+      have a length divisible by ``hop``.
+    :param kwargs: Further keyword arguments for ``pick_peaks``.
+    :returns: A tuple ``(samples, strengths)`` with the onset peaks (see
+      module docstring), at hop resolution.
+    """
+    energies = []
+    for block in blocks:
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        n = int(np.ceil(len(block) / hop))
+        padded = np.zeros(n * hop)
+        padded[:len(block)] = block
+        energies.append((padded.reshape(n, hop) ** 2).mean(axis=1))
+    log_energy = np.log(np.concatenate(energies) + 1e-10)
+    onsets = np.maximum(np.diff(log_energy, prepend=log_energy[0]), 0)
+    window = max(1, int(peak_window_secs * samplerate / hop))
+    positions, strengths = pick_peaks(onsets, window, **kwargs)
+    return positions * hop, strengths
+
+
+def mocap_spikes(mvn, segment_names=HAND_SEGMENTS,
+                 peak_window_secs=PEAK_WINDOW_SECS, **kwargs):
+    """
+    :param kwargs: Further keyword arguments for ``pick_peaks``.
+    :returns: A tuple ``(frames, strengths)`` with the peaks of the summed
+      acceleration norms of the given segments. ``frames`` are the
+      ``index`` attributes of the corresponding normal frames.
+    """
+    frame_rate = float(mvn.mvn.subject.attrib["frameRate"])
+    accel = mvn.extract_accel_norms(segment_names).sum(axis=1)
+    window = max(1, int(peak_window_secs * frame_rate))
+    positions, strengths = pick_peaks(accel, window, **kwargs)
+    return mvn.get_frame_indexes()[positions], strengths
+
+
+# #############################################################################
+# ## MATCHING
+# #############################################################################
+
+def match_peaks(frames, frame_strengths, samples, sample_strengths,
+                samples_per_frame, tolerance,
+                num_candidates=NUM_CANDIDATES):
+    """
+    Pairs mocap and audio peaks, see module docstring.
+
+    :param samples_per_frame: Nominal ratio between audio samplerate and MVN
+      frame rate.
+    :param tolerance: Two pairs agree if their implied shifts differ by at
+      most this many audio samples.
+    :returns: A list of at most ``num_candidates`` tuples
+      ``(frame, sample, score)``, sorted by decreasing score, where the best
+      score is 1. Each frame and sample appears at most once.
+    """
+    if len(frames) == 0 or len(samples) == 0:
+        return []
+    shifts = (samples[None, :] - frames[:, None] * samples_per_frame).ravel()
+    strengths = (frame_strengths[:, None] * sample_strengths[None, :]).ravel()
+    # support of a pair: total strength of the pairs with a similar shift
+    order = np.argsort(shifts)
+    cs = np.concatenate(([0.0], np.cumsum(strengths[order])))
+    lo = np.searchsorted(shifts[order], shifts - tolerance, "left")
+    hi = np.searchsorted(shifts[order], shifts + tolerance, "right")
+    support = cs[hi] - cs[lo]
+    support /= support.max()
+    # rank by support, then by own strength. Keep each peak only once
+    result = []
+    used_frames, used_samples = set(), set()
+    for k in np.lexsort((-strengths, -support)):
+        i, j = divmod(int(k), len(samples))
+        if i in used_frames or j in used_samples:
+            continue
+        used_frames.add(i)
+        used_samples.add(j)
+        result.append((int(frames[i]), int(samples[j]), float(support[k])))
+        if len(result) >= num_candidates:
+            break
+    return result
+
+
+@profiled("claps.clap_candidates")
+def clap_candidates(blocks, samplerate, mvn,
+                    stretch_tolerance=STRETCH_TOLERANCE,
+                    num_candidates=NUM_CANDIDATES, **kwargs):
+    """
+    :param blocks: The audio, as in ``audio_onsets``.
+    :param stretch_tolerance: Max. relative deviation of the real from the
+      nominal samplerate ratio. Determines the tolerance for matching.
+    :param kwargs: Further keyword arguments for ``pick_peaks``.
+    :returns: The ranked ``(frame, sample, score)`` clap candidates (see
+      ``match_peaks``).
+    """
+    frame_rate = float(mvn.mvn.subject.attrib["frameRate"])
+    samples_per_frame = samplerate / frame_rate
+    samples, sample_strengths = audio_onsets(blocks, samplerate, **kwargs)
+    frames, frame_strengths = mocap_spikes(mvn, **kwargs)
+    span = 0 if len(frames) == 0 else (frames.max() - frames.min())
+    tolerance = max(2 * samples_per_frame,
+                    stretch_tolerance * span * samples_per_frame)
+    return match_peaks(frames, frame_strengths, samples, sample_strengths,
+                       samples_per_frame, tolerance, num_candidates)
+
+
+def clap_candidates_wav(wav_path, mvn, blocksize=BLOCKSIZE, **kwargs):
+    """
+    Like ``clap_candidates``, but streams the audio from the given file.
+    """
+    samplerate = sf.info(wav_path).samplerate
+    blocksize = max(HOP, blocksize - blocksize % HOP)
+    blocks = sf.blocks(wav_path, blocksize=blocksize)
+    return clap_candidates(blocks, samplerate, mvn, **kwargs)
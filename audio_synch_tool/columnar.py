@@ -0,0 +1,266 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains the columnar export of the normal frames of an MVNX
+into a directory of ``.npy`` arrays, so that downstream consumers don't need
+to parse XML::
+
+  mvn = Mvn("take.mvnx")
+  mvn.set_audio_warp(oris, dests)  # optional
+  mvn.export_columns("take_columns")
+  meta, arrays = load_columns("take_columns")  # memory-mapped, read-only
+  arrays["acceleration"][1000:2000, meta["labels"]["segments"].index(
+      "LeftHand")]  # reads only the pages of these frames
+
+The directory contains:
+
+* One array per vector magnitude of the normal frames, of shape
+  ``(frames, entities, dims)``, e.g. ``(N, segmentCount, 4)`` for
+  ``orientation``, ``(N, 1, 3)`` for ``centerOfMass`` or ``(N, 4, 1)`` for
+  ``footContacts``. All are float32, except ``footContacts`` (int8)
+* The int64 ``index``, ``time`` and ``ms`` attributes of the normal frames,
+  and ``audio_sample`` if the MVNX is synched, of shape ``(N,)``
+* A JSON sidecar (``COLUMNS_META``) with the labels of the entities
+  (segments, sensors, joints...), the ``wav_file``, the frame rate and the
+  shape, dtype and entity list of each array. It is written last, so a
+  directory without it is an incomplete export
+
+The arrays are decoded in chunks of frames and appended to their files, so
+the memory needed besides the tree is independent of the number of frames.
+"""
+
+
+import os
+import json
+#
+import numpy as np
+from lxml import etree
+#
+from .utils import make_timestamp
+from .validation import VECTOR_DIMS, SUBJECT_LISTS, entity_counts
+from .validation import MvnxStructureError
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+COLUMNS_META = "columns.json"
+FORMAT_VERSION = 1
+CHUNK_FRAMES = 4096  # frames decoded at once
+VECTOR_DTYPE = np.float32
+VECTOR_DTYPES = {"footContacts": np.int8}  # exceptions to VECTOR_DTYPE
+FRAME_ATTRIBS = ["index", "time", "ms"]  # int64 columns, plus audio_sample
+# subject list holding the labels of each count, see validation module
+ENTITY_LISTS = {v: k for k, v in SUBJECT_LISTS.items()}
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+class _NpyWriter(object):
+    """
+    Writes an ``.npy`` file of known shape by appending chunks of rows.
+    """
+
+    def __init__(self, path, shape, dtype):
+        """
+        """
+        self.path = path
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.num_rows = 0
+        self.f = open(path, "wb")
+        np.lib.format.write_array_header_1_0(self.f, {
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False, "shape": self.shape})
+
+    def write(self, arr):
+        """
+        """
+        assert arr.shape[1:] == self.shape[1:], "Wrong chunk shape!"
+        self.f.write(np.ascontiguousarray(arr, dtype=self.dtype).tobytes())
+        self.num_rows += len(arr)
+
+    def close(self):
+        """
+        """
+        self.f.close()
+        assert self.num_rows == self.shape[0], \
+            "%s: expected %d rows, wrote %d" % (
+                self.path, self.shape[0], self.num_rows)
+
+
+def _labels(subject):
+    """
+    :returns: A dict with the list of labels of each list in the subject
+      (see ``SUBJECT_LISTS``) that is present.
+    """
+    result = {}
+    for list_el in subject.iterchildren(tag=etree.Element):
+        name = etree.QName(list_el).localname
+        if name in SUBJECT_LISTS:
+            result[name] = [ch.get("label") for ch in
+                            list_el.iterchildren(tag=etree.Element)]
+    return result
+
+
+def _vector_layouts(first_frame, counts):
+    """
+    :returns: A list of ``(name, tag, entity_list, shape)`` for each vector
+      in the given normal frame, where ``shape`` is ``(entities, dims)``.
+      Unknown magnitudes are exported as a single entity.
+    """
+    result = []
+    for ch in first_frame.iterchildren(tag=etree.Element):
+        name = etree.QName(ch).localname
+        if name in VECTOR_DIMS:
+            count_name, dims = VECTOR_DIMS[name]
+            shape = (counts[count_name], dims)
+            entity_list = ENTITY_LISTS.get(count_name)
+        else:
+            shape, entity_list = (1, len((ch.text or "").split())), None
+        result.append((name, ch.tag, entity_list, shape))
+    return result
+
+
+def _decode_chunk(frames, layouts):
+    """
+    :returns: A list with the array of each vector layout for the given
+      normal frames.
+    :raises: ``MvnxStructureError`` if the frames don't match the layouts.
+    """
+    texts = [[] for _ in layouts]
+    tags = [tag for _, tag, _, _ in layouts]
+    for fr in frames:
+        children = fr.getchildren()
+        if [ch.tag for ch in children] != tags:
+            raise MvnxStructureError("Normal frame %s has different fields" %
+                                     fr.get("index"))
+        for t, ch in zip(texts, children):
+            t.append(ch.text or "")
+    result = []
+    for t, (name, _, _, shape) in zip(texts, layouts):
+        arr = np.fromstring(" ".join(t), dtype=VECTOR_DTYPE, sep=" ")
+        try:
+            arr = arr.reshape((len(frames),) + shape)
+        except ValueError:
+            raise MvnxStructureError(
+                "%s of normal frames %s-%s should have %d numbers" % (
+                    name, frames[0].get("index"), frames[-1].get("index"),
+                    shape[0] * shape[1]))
+        result.append(arr.astype(VECTOR_DTYPES.get(name, VECTOR_DTYPE),
+                                 copy=False))
+    return result
+
+
+# #############################################################################
+# ## EXPORT AND LOAD
+# #############################################################################
+
+@profiled("columnar.write_columns")
+def write_columns(out_dir, root, normal_frames, audio_samples=None,
+                  chunk_frames=CHUNK_FRAMES, source=None):
+    """
+    Writes the columnar export (see module docstring). Usually called via
+    ``Mvn.export_columns``.
+
+    :param root: The root element of the MVNX.
+    :param normal_frames: The list of its normal frame elements.
+    :param audio_samples: If given, an int64 array with the audio sample of
+      each normal frame.
+    :param str source: Optional path of the MVNX, stored in the sidecar.
+    :returns: The metadata dict that was saved as sidecar.
+    :raises: ``MvnxStructureError`` if the frames are inconsistent. If the
+      export fails, the files written so far are removed.
+    """
+    assert chunk_frames > 0, "chunk_frames must be positive!"
+    num_frames = len(normal_frames)
+    assert num_frames > 0, "No normal frames to export!"
+    assert audio_samples is None or len(audio_samples) == num_frames, \
+        "Expected one audio sample per normal frame!"
+    subject = root.find("{*}subject")
+    counts = entity_counts(root)
+    layouts = _vector_layouts(normal_frames[0], counts)
+    attribs = FRAME_ATTRIBS + ([] if audio_samples is None
+                               else ["audio_sample"])
+    #
+    os.makedirs(out_dir, exist_ok=True)
+    meta_path = os.path.join(out_dir, COLUMNS_META)
+    if os.path.exists(meta_path):
+        os.remove(meta_path)  # the directory is incomplete until the end
+    arrays, writers = {}, []
+    try:
+        for name, _, entity_list, shape in layouts:
+            dtype = np.dtype(VECTOR_DTYPES.get(name, VECTOR_DTYPE))
+            arrays[name] = {"shape": [num_frames, shape[0], shape[1]],
+                            "dtype": dtype.name, "entities": entity_list}
+        for name in attribs:
+            arrays[name] = {"shape": [num_frames], "dtype": "int64",
+                            "entities": None}
+        for name, info in arrays.items():
+            info["file"] = name + ".npy"
+            writers.append(_NpyWriter(os.path.join(out_dir, info["file"]),
+                                      info["shape"], info["dtype"]))
+        vector_writers = writers[:len(layouts)]
+        attrib_writers = writers[len(layouts):]
+        for beg in range(0, num_frames, chunk_frames):
+            chunk = normal_frames[beg:beg + chunk_frames]
+            for w, arr in zip(vector_writers, _decode_chunk(chunk, layouts)):
+                w.write(arr)
+            for w, name in zip(attrib_writers, FRAME_ATTRIBS):
+                w.write(np.array([fr.get(name) for fr in chunk],
+                                 dtype=np.int64))
+            if audio_samples is not None:
+                attrib_writers[-1].write(
+                    audio_samples[beg:beg + chunk_frames])
+        for w in writers:
+            w.close()
+        meta = {"format_version": FORMAT_VERSION, "source": source,
+                "wav_file": root.get("wav_file"),
+                "frame_rate": float(subject.get("frameRate", "nan")),
+                "num_frames": num_frames, "labels": _labels(subject),
+                "arrays": arrays,
+                "pythonComment": "Exported from write_columns on %s" %
+                make_timestamp()}
+        with open(meta_path, "w") as f:
+            json.dump(meta, f, indent=2)
+    except BaseException:
+        for w in writers:
+            w.f.close()
+            os.remove(w.path)
+        raise
+    return meta
+
+
+def load_columns(columns_dir, names=None, mmap_mode="r"):
+    """
+    Loads a columnar export (see module docstring). With the default
+    ``mmap_mode``, nothing is read until the arrays are accessed.
+
+    :param names: Optional list of the arrays to load (all by default).
+    :param mmap_mode: As in ``np.load``. If None, the arrays are read fully.
+    :returns: A tuple ``(meta, arrays)`` with the sidecar dict and a dict
+      with the arrays by name.
+    """
+    meta_path = os.path.join(columns_dir, COLUMNS_META)
+    assert os.path.isfile(meta_path), \
+        "%s not found: incomplete or missing export?" % meta_path
+    with open(meta_path) as f:
+        meta = json.load(f)
+    arrays = {}
+    for name, info in meta["arrays"].items():
+        if names is not None and name not in names:
+            continue
+        arr = np.load(os.path.join(columns_dir, info["file"]),
+                      mmap_mode=mmap_mode)
+        assert list(arr.shape) == info["shape"], \
+            "Unexpected shape of %s: %s" % (info["file"], arr.shape)
+        arrays[name] = arr
+    return meta, arrays
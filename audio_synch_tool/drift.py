@@ -0,0 +1,194 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains functionality to measure the clock drift between the
+mocap system and the audio recorder along a whole take, instead of assuming
+a single global ``x -> x * stretch + shift`` map (see
+``utils.convert_anchors``) and spot-checking it.
+
+The take is split into windows of ``WINDOW_SECS`` (of mocap). Starting from
+an initial synchronization (e.g. given anchors or ``autosynch``), each
+window of the MVN envelope is aligned by cross-correlation against the audio
+envelope, within ``SEARCH_SECS`` around its predicted position (see the
+``autosynch`` module for the envelopes). Windows are aligned in parallel.
+
+A line is then fitted robustly to the measured ``(frame, sample)`` pairs
+with the Theil-Sen estimator (median of the pairwise slopes), so that a few
+misaligned windows don't bias the result. The residuals of each window
+show whether the drift is linear (i.e. the fitted stretch and shift can be
+used as anchors) or not. Usage example::
+
+  report = drift_report_wav("take.wav", Mvn("take.mvnx"),
+                            anchors=(0, 1234, 100000, 20001234))
+  print(report["drift_ppm"], report["residual_ms_max"])
+"""
+
+
+import multiprocessing
+#
+import numpy as np
+import soundfile as sf
+#
+from .utils import convert_anchors, synch_to_anchors
+from .autosynch import wav_envelope, mocap_envelope, xcorr_peak
+from .autosynch import autosynch_wav
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+WINDOW_SECS = 30.0  # length of the aligned windows
+SEARCH_SECS = 2.0  # max. deviation from the initial synch of a window
+MIN_SCORE = 0.3  # windows with a lower correlation aren't used for the fit
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def _align_window(job):
+    """
+    Process pool worker: aligns a window of the MVN envelope within a region
+    of the audio envelope.
+
+    :param job: A tuple ``(audio_region, mocap_window, ratio)``, where the
+      window is resampled by ``ratio`` before aligning.
+    :returns: A tuple ``(lag, score)`` of the window within the region.
+    """
+    audio_region, mocap_window, ratio = job
+    if audio_region.std() == 0 or mocap_window.std() == 0:
+        return 0.0, 0.0
+    new_len = int((len(mocap_window) - 1) * ratio) + 1
+    resampled = np.interp(np.arange(new_len) / ratio,
+                          np.arange(len(mocap_window)), mocap_window)
+    return xcorr_peak(audio_region, resampled)
+
+
+def theil_sen(x, y):
+    """
+    :returns: A tuple ``(slope, intercept)`` of the Theil-Sen line fit to
+      the given points: the median of the slopes between all pairs of points,
+      and the median of ``y - slope * x``.
+    """
+    x, y = np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64)
+    i, j = np.triu_indices(len(x), k=1)
+    dx = x[j] - x[i]
+    valid = dx != 0
+    slope = np.median((y[j] - y[i])[valid] / dx[valid])
+    intercept = np.median(y - slope * x)
+    return float(slope), float(intercept)
+
+
+# #############################################################################
+# ## DRIFT ESTIMATION
+# #############################################################################
+
+@profiled("drift.align_windows")
+def align_windows(audio_env, mocap_env, first_idx, samplerate, frame_rate,
+                  stretch, shift, window_secs=WINDOW_SECS,
+                  search_secs=SEARCH_SECS, num_processes=None):
+    """
+    :param audio_env: Audio envelope at the MVN frame rate.
+    :param mocap_env: MVN envelope, one entry per normal frame.
+    :param first_idx: ``index`` attribute of the first normal frame.
+    :param stretch: Initial synch in audio samples per frame index. Same for
+      ``shift``.
+    :param num_processes: Number of parallel workers. If None, the number of
+      CPUs is used. If 1, windows are aligned in this process.
+    :returns: A list of ``(frame_idx, audio_sample, score)`` tuples, one per
+      window, where ``frame_idx`` is the (possibly fractional) index at the
+      center of the window and ``audio_sample`` its measured position in the
+      audio. Centers are used since they don't depend on errors of the
+      initial stretch, unlike the window boundaries.
+    """
+    audio_env = np.asarray(audio_env, dtype=np.float64)
+    mocap_env = np.asarray(mocap_env, dtype=np.float64)
+    env_per_sample = frame_rate / samplerate
+    ratio = stretch * env_per_sample  # audio env entries per mocap frame
+    window = max(2, int(window_secs * frame_rate))
+    radius = int(search_secs * frame_rate)
+    jobs, centers, frame_idxs = [], [], []
+    for j0 in range(0, len(mocap_env) - window // 2, window):
+        mocap_window = mocap_env[j0:j0 + window]
+        predicted = ((first_idx + j0) * stretch + shift) * env_per_sample
+        beg = max(0, int(predicted) - radius)
+        end = min(int(predicted + len(mocap_window) * ratio) + radius,
+                  len(audio_env))
+        if end - beg < len(mocap_window) * ratio:
+            continue  # window falls (mostly) outside of the audio
+        jobs.append((audio_env[beg:end], mocap_window, ratio))
+        half = (len(mocap_window) - 1) / 2
+        centers.append(beg + half * ratio)
+        frame_idxs.append(first_idx + j0 + half)
+    if num_processes == 1:
+        results = [_align_window(job) for job in jobs]
+    else:
+        with multiprocessing.Pool(num_processes) as pool:
+            results = pool.map(_align_window, jobs)
+    return [(idx, (center + lag) / env_per_sample, score)
+            for idx, center, (lag, score) in zip(frame_idxs, centers,
+                                                 results)]
+
+
+def fit_drift(windows, samplerate, frame_rate, min_score=MIN_SCORE):
+    """
+    Robustly fits a line to the aligned windows (see ``align_windows``).
+
+    :returns: A dict with the fitted ``stretch`` and ``shift``, the drift
+      in parts per million w.r.t. the nominal rates, residual statistics in
+      milliseconds, and one entry per window with its residual. Windows with
+      a score below ``min_score`` are reported but not used for the fit.
+    """
+    used = [(f, s) for f, s, score in windows if score >= min_score]
+    assert len(used) >= 2, "Less than 2 reliable windows: can't fit drift!"
+    stretch, shift = theil_sen(*zip(*used))
+    ms_per_sample = 1000.0 / samplerate
+    report_windows = []
+    for f, s, score in windows:
+        residual_ms = (s - (f * stretch + shift)) * ms_per_sample
+        report_windows.append({"frame": float(f), "sample": float(s),
+                               "score": float(score), "used": bool(
+                                   score >= min_score),
+                               "residual_ms": float(residual_ms)})
+    abs_res = np.abs([w["residual_ms"] for w in report_windows if w["used"]])
+    return {"stretch": stretch, "shift": shift,
+            "drift_ppm": (stretch * frame_rate / samplerate - 1) * 1e6,
+            "num_windows": len(windows), "num_used": len(used),
+            "residual_ms_median": float(np.median(abs_res)),
+            "residual_ms_max": float(abs_res.max()),
+            "windows": report_windows}
+
+
+def drift_report_wav(wav_path, mvn, anchors=None, window_secs=WINDOW_SECS,
+                     search_secs=SEARCH_SECS, min_score=MIN_SCORE,
+                     num_processes=None):
+    """
+    Measures the drift between the given audio file and Mvn.
+
+    :param anchors: The initial synch as ``(ori1, dest1, ori2, dest2)``. If
+      None, it is estimated with ``autosynch``.
+    :returns: The report of ``fit_drift``, plus the ``anchors`` for the first
+      and last normal frames according to the fitted line.
+    """
+    frame_rate = float(mvn.mvn.subject.attrib["frameRate"])
+    samplerate = sf.info(wav_path).samplerate
+    if anchors is None:
+        stretch, shift, _ = autosynch_wav(wav_path, mvn)
+    else:
+        stretch, shift = convert_anchors(*anchors)
+    indexes = mvn.get_frame_indexes()
+    first_idx, last_idx = int(indexes[0]), int(indexes[-1])
+    windows = align_windows(wav_envelope(wav_path, frame_rate),
+                            mocap_envelope(mvn), first_idx, samplerate,
+                            frame_rate, stretch, shift, window_secs,
+                            search_secs, num_processes)
+    report = fit_drift(windows, samplerate, frame_rate, min_score)
+    report["anchors"] = list(synch_to_anchors(
+        report["stretch"], report["shift"], first_idx, last_idx))
+    return report
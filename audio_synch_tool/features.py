@@ -0,0 +1,271 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains the extraction of audio features aligned to the mocap
+frames of synched takes, e.g. as model inputs. For each normal frame, a
+window of ``window_size`` audio samples centered at its ``audio_sample`` is
+analyzed, yielding one row of ``FEATURE_NAMES``:
+
+:rms: Root mean square of the (mono) window
+:spectral_centroid: Magnitude-weighted mean frequency of the Hann-windowed
+  spectrum, in Hz (0 for silent windows)
+:onset_strength: Spectral flux: mean positive change of the log-magnitude
+  spectrum with respect to the previous frame (0 for the first one)
+
+The WAV is read once, in blocks. The windows of all frames that are
+complete in the current buffer are gathered from a strided view of it and
+analyzed together, and the buffer is then trimmed to the first pending
+window. Parts of windows outside of the audio are zeros. The audio samples
+are read from the MVNX in a streaming pass (the tree is never built), or
+from a columnar export (see ``columnar``)::
+
+  features = take_features("take.mvnx")  # (num_frames, 3) float32 array
+  results = extract_features(["a.mvnx", "b_columns"], "/tmp/features")
+
+Several takes are processed in a process pool.
+"""
+
+
+import os
+import multiprocessing
+#
+import numpy as np
+import soundfile as sf
+from lxml import etree
+#
+from .columnar import load_columns
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+FEATURE_NAMES = ["rms", "spectral_centroid", "onset_strength"]
+BLOCKSIZE = 2 ** 20  # audio frames per block when streaming WAV files
+FEATURES_SUFFIX = "_features.npy"
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def default_window_size(samplerate, frame_rate):
+    """
+    :returns: The smallest power of 2 that covers one mocap frame period.
+    """
+    return int(2 ** np.ceil(np.log2(max(2.0, samplerate / frame_rate))))
+
+
+def read_audio_synch(take_path):
+    """
+    :param take_path: A synched MVNX, or the directory of its columnar
+      export.
+    :returns: A tuple ``(audio_samples, frame_rate, wav_file)``, where
+      ``audio_samples`` is an int64 array with the ``audio_sample`` of each
+      normal frame.
+    :raises: KeyError if the take isn't synched.
+    """
+    if os.path.isdir(take_path):
+        meta, arrays = load_columns(take_path, ["audio_sample"])
+        if "audio_sample" not in arrays:
+            raise KeyError("No audio_sample in %s. Is it synched?" %
+                           take_path)
+        return (np.array(arrays["audio_sample"]), meta["frame_rate"],
+                meta["wav_file"])
+    samples, frame_rate, wav_file = [], None, None
+    # open the file here, so it's closed also if the loop raises
+    with open(take_path, "rb") as f:
+        for event, el in etree.iterparse(
+                f, events=("start", "end"),
+                tag=["{*}mvnx", "{*}subject", "{*}frame"]):
+            name = etree.QName(el).localname
+            if event == "start":
+                if name == "mvnx":
+                    wav_file = el.get("wav_file")
+                elif name == "subject":
+                    frame_rate = float(el.get("frameRate"))
+                continue
+            if name != "frame":
+                continue
+            if el.get("type") == "normal":
+                try:
+                    samples.append(el.attrib["audio_sample"])
+                except KeyError:
+                    raise KeyError("Frame %s in %s has no audio_sample. Is it "
+                                   "synched?" % (el.get("index"), take_path))
+            # release the parsed frames, only the attributes are needed
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+    return np.array(samples, dtype=np.int64), frame_rate, wav_file
+
+
+def window_features(windows, samplerate, prev_logmag=None):
+    """
+    :param windows: A float array of shape ``(num_windows, window_size)``.
+    :param prev_logmag: The log-magnitude spectrum of the window before the
+      first one, if any (for the onset strength).
+    :returns: A tuple ``(features, last_logmag)``, where ``features`` has
+      shape ``(num_windows, len(FEATURE_NAMES))``.
+    """
+    window_size = windows.shape[1]
+    rms = np.sqrt((windows ** 2).mean(axis=1))
+    mag = np.abs(np.fft.rfft(windows * np.hanning(window_size), axis=1))
+    freqs = np.fft.rfftfreq(window_size, 1.0 / samplerate)
+    total = mag.sum(axis=1)
+    centroid = (mag @ freqs) / np.where(total > 0, total, 1)
+    logmag = np.log1p(mag)
+    if prev_logmag is None:
+        prev_logmag = logmag[:1]
+    flux = np.maximum(np.diff(logmag, axis=0, prepend=prev_logmag), 0)
+    features = np.stack([rms, centroid, flux.mean(axis=1)], axis=1)
+    return features, logmag[-1:]
+
+
+# #############################################################################
+# ## EXTRACTION
+# #############################################################################
+
+@profiled("features.frame_features")
+def frame_features(blocks, samplerate, audio_samples, window_size):
+    """
+    Computes the features of each frame in a single pass over the audio
+    (see module docstring).
+
+    :param blocks: Iterable of consecutive audio arrays of shape
+      ``(samples,)`` or ``(samples, channels)``.
+    :param audio_samples: The non-decreasing audio sample of each frame.
+    :returns: A float32 array of shape ``(num_frames, len(FEATURE_NAMES))``.
+    """
+    audio_samples = np.asarray(audio_samples, dtype=np.int64)
+    assert (np.diff(audio_samples) >= 0).all(), \
+        "audio_samples must be non-decreasing!"
+    num_frames = len(audio_samples)
+    result = np.zeros((num_frames, len(FEATURE_NAMES)), dtype=np.float32)
+    if num_frames == 0:
+        return result
+    starts = audio_samples - window_size // 2
+    ends = starts + window_size
+    # the buffer holds the audio from buf_beg on, with zeros before 0
+    buf_beg = min(0, int(starts[0]))
+    buf = np.zeros(-buf_beg)
+    done, prev_logmag = 0, None
+
+    def process(buf, buf_beg, done, prev_logmag):
+        """
+        Computes the frames whose windows are complete in the buffer, and
+        returns the trimmed buffer and updated state.
+        """
+        ready = int(np.searchsorted(ends, buf_beg + len(buf), "right"))
+        if ready > done:
+            view = np.lib.stride_tricks.sliding_window_view(buf, window_size)
+            windows = view[starts[done:ready] - buf_beg]
+            result[done:ready], prev_logmag = window_features(
+                windows, samplerate, prev_logmag)
+        drop = len(buf) if ready >= num_frames else \
+            max(0, min(len(buf), int(starts[ready]) - buf_beg))
+        return buf[drop:], buf_beg + drop, ready, prev_logmag
+    #
+    for block in blocks:
+        if block.ndim > 1:
+            block = block.mean(axis=1)
+        buf = np.concatenate([buf, block])
+        buf, buf_beg, done, prev_logmag = process(buf, buf_beg, done,
+                                                  prev_logmag)
+        if done >= num_frames:
+            break
+    if done < num_frames:  # windows past the end of the audio
+        pad = max(0, int(ends[-1]) - buf_beg - len(buf))
+        buf = np.concatenate([buf, np.zeros(pad)])
+        process(buf, buf_beg, done, prev_logmag)
+    return result
+
+
+def frame_features_wav(wav_path, audio_samples, frame_rate,
+                       window_size=None, blocksize=BLOCKSIZE):
+    """
+    Like ``frame_features``, but streams the audio from the given file.
+
+    :param window_size: If None, ``default_window_size`` is used.
+    """
+    samplerate = sf.info(wav_path).samplerate
+    if window_size is None:
+        window_size = default_window_size(samplerate, frame_rate)
+    blocks = sf.blocks(wav_path, blocksize=blocksize)
+    return frame_features(blocks, samplerate, audio_samples, window_size)
+
+
+@profiled("features.take_features")
+def take_features(take_path, out_path=None, wav_dir=None, window_size=None,
+                  blocksize=BLOCKSIZE):
+    """
+    :param take_path: A synched MVNX, or the directory of its columnar
+      export (see ``read_audio_synch``).
+    :param str out_path: If given, the features are saved here as ``.npy``.
+    :param str wav_dir: The directory containing the WAV given by the
+      ``wav_file`` of the take. If None, the directory of ``take_path`` is
+      used.
+    :returns: The features of the take (see ``frame_features``).
+    """
+    audio_samples, frame_rate, wav_file = read_audio_synch(take_path)
+    if wav_file is None:
+        raise KeyError("No wav_file attribute in %s. Is it synched?" %
+                       take_path)
+    if wav_dir is None:
+        wav_dir = os.path.dirname(os.path.abspath(take_path.rstrip(os.sep)))
+    features = frame_features_wav(os.path.join(wav_dir, wav_file),
+                                  audio_samples, frame_rate, window_size,
+                                  blocksize)
+    if out_path is not None:
+        np.save(out_path, features)
+    return features
+
+
+def _take_features_job(job):
+    """
+    Process pool wrapper around ``take_features``, that returns errors
+    instead of raising them, so a broken take doesn't stop the batch.
+
+    :param job: A tuple ``(take_path, out_path, kwargs)``
+    :returns: A tuple ``(take_path, out_path, error_str)``
+    """
+    take_path, out_path, kwargs = job
+    try:
+        take_features(take_path, out_path, **kwargs)
+        return (take_path, out_path, None)
+    except Exception as e:
+        return (take_path, None, "%s: %s" % (e.__class__.__name__, e))
+
+
+def extract_features(take_paths, out_dir, num_processes=None, **kwargs):
+    """
+    Computes the features of several takes in a process pool, saving each
+    one to ``<out_dir>/<take name>_features.npy``.
+
+    :param int num_processes: Number of parallel workers. If None, the
+      number of CPUs is used.
+    :param kwargs: Further keyword arguments for ``take_features``.
+    :returns: A list of ``(take_path, out_path, error_str)`` tuples, in the
+      same order as ``take_paths``. ``error_str`` is None on success.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = []
+    for p in take_paths:
+        name = os.path.splitext(os.path.basename(p.rstrip(os.sep)))[0]
+        jobs.append((p, os.path.join(out_dir, name + FEATURES_SUFFIX),
+                     kwargs))
+    with multiprocessing.Pool(num_processes) as pool:
+        results = []
+        for r in pool.imap(_take_features_job, jobs):
+            take_path, out_path, error = r
+            if error is None:
+                print("[features]", take_path, "->", out_path)
+            else:
+                print("[features] FAILED %s: %s" % (take_path, error))
+            results.append(r)
+    return results
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains the concurrent loading of a take (WAV and MVNX) for the
+plotters. The loading stages run as tasks on a small thread pool, as soon as
+their inputs are ready::
+
+  audio:    sf.read(wav)
+  mvnx:     Mvn(mvnx)  --> validate (optional, see Mvn.validate)
+                       --> decode (frame indexes, audio synch, decode(mvn))
+
+libsndfile and lxml release the GIL while reading, parsing and validating,
+so with enough cores the loading takes about as long as its slowest chain of
+stages, instead of the sum of all of them. Usage example::
+
+  cancel = threading.Event()  # cancel.set() from another thread aborts
+  take = load_take("take.wav", "take.mvnx", validate_mvnx=True,
+                   progress=print_progress, cancel=cancel)
+  take["wav_arr"], take["samplerate"], take["mvn"], take["decoded"]
+"""
+
+
+import threading
+import concurrent.futures
+#
+import soundfile as sf
+#
+from .mvn import Mvn
+from .profiling import span, profiled
+from .validation import STRICT
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+MAX_WORKERS = 3  # audio, validation and decoding can run at the same time
+POLL_SECS = 0.05  # how often the cancellation is checked while waiting
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+class LoadCancelled(Exception):
+    """
+    Raised by ``load_take`` if it was cancelled before finishing.
+    """
+    pass
+
+
+def print_progress(stage, num_done, num_total):
+    """
+    A progress callback for ``load_take`` that prints each finished stage.
+    """
+    print("[load_take] %s done (%d/%d)" % (stage, num_done, num_total))
+
+
+def _read_audio(wav_path):
+    """
+    """
+    with span("audio.read"):
+        return sf.read(wav_path)
+
+
+def _decode(mvn, decode=None):
+    """
+    Fills the caches of the given ``Mvn`` that the plotters need, and calls
+    ``decode`` on it.
+    """
+    mvn.get_frame_indexes()
+    mvn.get_audio_synch()
+    return None if decode is None else decode(mvn)
+
+
+# #############################################################################
+# ## LOADER
+# #############################################################################
+
+@profiled("loaders.load_take")
+def load_take(wav_path, mvnx_path, validate_mvnx=False, decode=None,
+              progress=None, cancel=None, max_workers=MAX_WORKERS):
+    """
+    Loads the given WAV and MVNX concurrently (see module docstring).
+
+    :param validate_mvnx: As the ``validate`` argument of ``Mvn``: false,
+      true or ``"strict"``.
+    :param decode: An optional function that receives the parsed ``Mvn``
+      and extracts further data from it (e.g. the arrays to be plotted). It
+      runs in parallel with the validation.
+    :param progress: An optional function that is called as
+      ``progress(stage, num_done, num_total)`` from the calling thread each
+      time a stage (``audio``, ``mvnx``, ``validate``, ``decode``) finishes.
+    :param threading.Event cancel: If given and set before the loading
+      finishes, the pending stages are cancelled and ``LoadCancelled`` is
+      raised without waiting for the running ones, whose results are
+      discarded.
+    :returns: A dict with the ``wav_arr``, ``samplerate``, ``mvn`` and the
+      output of ``decode`` (``decoded``).
+    :raises: The exception of the first failed stage (e.g.
+      ``validation.MvnxStructureError``), after cancelling the others.
+    """
+    assert cancel is None or isinstance(cancel, threading.Event), \
+        "cancel must be a threading.Event!"
+    num_total = 4 if validate_mvnx else 3
+    result, num_done = {}, 0
+    executor = concurrent.futures.ThreadPoolExecutor(
+        max_workers, thread_name_prefix="load_take")
+    finished = False
+    try:
+        pending = {executor.submit(_read_audio, wav_path): "audio",
+                   executor.submit(Mvn, mvnx_path, False): "mvnx"}
+        while pending:
+            done, _ = concurrent.futures.wait(
+                pending, POLL_SECS,
+                return_when=concurrent.futures.FIRST_COMPLETED)
+            if cancel is not None and cancel.is_set():
+                raise LoadCancelled("Loading of %s and %s cancelled" % (
+                    wav_path, mvnx_path))
+            for future in done:
+                stage = pending.pop(future)
+                value = future.result()  # raises if the stage failed
+                if stage == "audio":
+                    result["wav_arr"], result["samplerate"] = value
+                elif stage == "mvnx":
+                    result["mvn"] = value
+                    if validate_mvnx:
+                        pending[executor.submit(
+                            value.validate,
+                            validate_mvnx == STRICT)] = "validate"
+                    pending[executor.submit(_decode, value,
+                                            decode)] = "decode"
+                elif stage == "decode":
+                    result["decoded"] = value
+                num_done += 1
+                if progress is not None:
+                    progress(stage, num_done, num_total)
+        finished = True
+    finally:
+        # on failure or cancellation, don't wait for the running stages
+        executor.shutdown(wait=finished, cancel_futures=not finished)
+    return result
@@ -0,0 +1,378 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains functionality to locate a "shorter" audio signal within
+a "longer" one, e.g. a WAV snippet exported from a long-form recording.
+
+The exact search works in linear time with a fingerprint prefilter: a short
+"probe" of consecutive frames is taken around the loudest frame at the
+beginning of the shorter signal (loud frames are unlikely to repeat, unlike
+e.g. digital silence). The longer signal is scanned for the probe in a
+vectorized way, and the few candidate positions that contain it are then
+verified exactly. When working with files, the longer WAV is streamed in
+blocks and the verification is also done blockwise, so memory stays
+constant regardless of the file sizes. Usage example::
+
+  beg, end = locate_wav("snippet.wav", "master.wav")
+
+If the shorter WAV isn't a bit-exact slice of the longer one (e.g. because an
+editor applied gain, dithering or resampling), a tolerant coarse-to-fine
+search based on normalized cross-correlation can be used instead. First,
+decimated amplitude envelopes are correlated to find the approximate
+offset. Then, a short reference segment of the shorter WAV is correlated
+sample-wise within a small window of the longer one. The correlation is
+computed blockwise via FFT (overlap-save), so the longer WAV is never fully
+loaded. The peak correlation is reported as confidence score::
+
+  beg, end, confidence = xcorr_locate_wav("snippet.wav", "master.wav")
+"""
+
+
+import numpy as np
+import soundfile as sf
+#
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+NUM_PROBE_FRAMES = 16  # length of the fingerprint
+PROBE_SEARCH_FRAMES = 2 ** 16  # fingerprint is searched at the beginning
+BLOCKSIZE = 2 ** 20  # frames per block when streaming files
+DECIMATION = 256  # frames per envelope sample in the coarse xcorr search
+REFINE_FRAMES = 2 ** 16  # length of the reference in the fine xcorr search
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def _as_2d(arr):
+    """
+    :returns: A view of the given array with shape ``(frames, channels)``
+    """
+    return arr.reshape(len(arr), -1)
+
+
+def make_probe(head, num_probe_frames=NUM_PROBE_FRAMES):
+    """
+    :param head: The first frames of the shorter signal, as an array of shape
+      ``(frames, channels)``.
+    :returns: A tuple ``(probe_beg, probe)``, where ``probe`` is an array with
+      the ``num_probe_frames`` consecutive frames of ``head`` starting at
+      ``probe_beg``.
+    """
+    num_probe_frames = min(num_probe_frames, len(head))
+    energy = np.abs(head[:len(head) - num_probe_frames + 1]).sum(axis=1)
+    probe_beg = int(energy.argmax())
+    return probe_beg, head[probe_beg:probe_beg + num_probe_frames]
+
+
+def find_probe(arr, probe):
+    """
+    :param arr: An array of shape ``(frames, channels)``
+    :param probe: An array of shape ``(probe_frames, channels)``
+    :returns: A sorted int64 array with all positions ``i`` such that
+      ``arr[i:i+len(probe)] == probe``. The first probe frame is checked for
+      the whole array, and the next ones only for the surviving positions.
+    """
+    n = len(arr) - len(probe) + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    cands = np.flatnonzero((arr[:n] == probe[0]).all(axis=1))
+    for k in range(1, len(probe)):
+        if not len(cands):
+            break
+        cands = cands[(arr[cands + k] == probe[k]).all(axis=1)]
+    return cands
+
+
+# #############################################################################
+# ## IN-MEMORY SEARCH
+# #############################################################################
+
+def find_sublist(haystack, needle, num_probe_frames=NUM_PROBE_FRAMES):
+    """
+    :param haystack: Array of shape ``(frames,)`` or ``(frames, channels)``
+    :param needle: Array with the same number of channels as ``haystack``
+    :returns: The smallest ``beg`` such that
+      ``haystack[beg:beg+len(needle)] == needle``, or None if there is no such
+      position.
+    """
+    haystack, needle = _as_2d(haystack), _as_2d(needle)
+    len_h, len_n = len(haystack), len(needle)
+    if (haystack.shape[1] != needle.shape[1]) or (len_n > len_h):
+        return None
+    if len_n == 0:
+        return 0
+    probe_beg, probe = make_probe(needle[:PROBE_SEARCH_FRAMES],
+                                  num_probe_frames)
+    for pos in find_probe(haystack, probe):
+        beg = pos - probe_beg
+        if beg < 0 or beg + len_n > len_h:
+            continue
+        if np.array_equal(haystack[beg:beg + len_n], needle):
+            return int(beg)
+    return None
+
+
+def numpy_find_sublist(arr1, arr2):
+    """
+    :param ndarray arr1: numpy array of shape ``(frames,)`` or
+      ``(frames, channels)``
+    :param ndarray arr2: numpy array with the same number of channels as arr1
+    :returns: a tuple (A, B) where A is the tuple (beg, end) if
+      arr2[beg:end]==arr1, and None otherwise. B works the same for arr2.
+    """
+    result1, result2 = None, None
+    beg1 = find_sublist(arr2, arr1)
+    if beg1 is not None:
+        result1 = (beg1, beg1 + len(arr1))
+    beg2 = find_sublist(arr1, arr2)
+    if beg2 is not None:
+        result2 = (beg2, beg2 + len(arr2))
+    return (result1, result2)
+
+
+# #############################################################################
+# ## STREAMING SEARCH
+# #############################################################################
+
+def wav_range_equals(short_path, long_path, beg, blocksize=BLOCKSIZE):
+    """
+    :returns: True if the whole contents of the ``short_path`` audio file
+      equal the contents of the ``long_path`` file starting at frame ``beg``.
+      Both files are read blockwise.
+    """
+    with sf.SoundFile(long_path) as long_f:
+        long_f.seek(beg)
+        for short_block in sf.blocks(short_path, blocksize=blocksize,
+                                     always_2d=True):
+            long_block = long_f.read(len(short_block), always_2d=True)
+            if not np.array_equal(short_block, long_block):
+                return False
+    return True
+
+
+@profiled("locators.locate_wavs")
+def locate_wavs(short_paths, long_path, blocksize=BLOCKSIZE,
+                num_probe_frames=NUM_PROBE_FRAMES, verbose=False):
+    """
+    Locates several shorter audio files within a longer one, streaming the
+    longer file only once.
+
+    :param short_paths: A list of paths to the shorter audio files.
+    :param long_path: Path to the longer audio file.
+    :param int blocksize: Number of frames per block read from the long file.
+    :returns: A list with one entry per ``short_path``: the tuple
+      ``(beg, end)`` with the range of frames in the long file that exactly
+      equals the short file, or None if there is no such range.
+    """
+    long_info = sf.info(long_path)
+    len_long = long_info.frames
+    results = [None for _ in short_paths]
+    probes = {}  # short idx -> (probe_beg, probe, len_short)
+    for i, sp in enumerate(short_paths):
+        info = sf.info(sp)
+        if info.channels != long_info.channels or info.frames > len_long:
+            continue
+        if info.frames == 0:
+            results[i] = (0, 0)
+            continue
+        head, _ = sf.read(sp, frames=PROBE_SEARCH_FRAMES, always_2d=True)
+        probe_beg, probe = make_probe(head, num_probe_frames)
+        probes[i] = (probe_beg, probe, info.frames)
+    if not probes:
+        return results
+    #
+    overlap = max([len(p) for _, p, _ in probes.values()]) - 1
+    block_beg = 0
+    for block in sf.blocks(long_path, blocksize=blocksize, overlap=overlap,
+                           always_2d=True):
+        for i, (probe_beg, probe, len_short) in list(probes.items()):
+            for pos in find_probe(block, probe):
+                beg = block_beg + int(pos) - probe_beg
+                if beg < 0 or beg + len_short > len_long:
+                    continue
+                if wav_range_equals(short_paths[i], long_path, beg,
+                                    blocksize):
+                    results[i] = (beg, beg + len_short)
+                    del probes[i]
+                    if verbose:
+                        print("[locate_wavs] found", short_paths[i], "at",
+                              results[i])
+                    break
+        if not probes:
+            break
+        block_beg += blocksize - overlap
+    return results
+
+
+def locate_wav(short_path, long_path, blocksize=BLOCKSIZE,
+               num_probe_frames=NUM_PROBE_FRAMES):
+    """
+    :returns: the tuple ``(beg, end)`` such that the frames ``[beg:end]`` of
+      the audio file in ``long_path`` exactly equal the contents of the audio
+      file in ``short_path``, or None if not found. See ``locate_wavs``.
+    """
+    return locate_wavs([short_path], long_path, blocksize,
+                       num_probe_frames)[0]
+
+
+# #############################################################################
+# ## TOLERANT SEARCH
+# #############################################################################
+
+def xcorr_overlap_save(blocks, template, fft_size=None):
+    """
+    Streaming normalized cross-correlation of a 1D signal, given as an
+    iterable of consecutive 1D blocks, with a (shorter) 1D template. The
+    correlation is computed via FFT with the overlap-save method, so only
+    ``fft_size`` samples of the signal are in memory at once.
+
+    :param int fft_size: FFT length. If None, the smallest power of 2 that is
+      at least 4 times the template length is used.
+    :returns: A generator of tuples ``(lag_beg, ncc)``, where ``ncc[k]`` is
+      the Pearson correlation between the template and the signal segment
+      starting at ``lag_beg + k`` (0 if the segment is constant). Only lags
+      where the template fully overlaps the signal are yielded.
+    """
+    t = np.asarray(template, dtype=np.float64)
+    t = t - t.mean()
+    m = len(t)
+    t_norm = np.sqrt((t ** 2).sum())
+    if fft_size is None:
+        fft_size = 1 << int(np.ceil(np.log2(4 * m)))
+    assert fft_size >= m, "fft_size can't be smaller than the template!"
+    t_spectrum = np.conj(np.fft.rfft(t, fft_size))
+    hop = fft_size - m + 1
+
+    def ncc(seg):
+        corr = np.fft.irfft(np.fft.rfft(seg, fft_size) * t_spectrum,
+                            fft_size)[:len(seg) - m + 1]
+        cs1 = np.concatenate(([0.0], np.cumsum(seg)))
+        cs2 = np.concatenate(([0.0], np.cumsum(seg ** 2)))
+        s1 = cs1[m:] - cs1[:-m]
+        var = np.maximum((cs2[m:] - cs2[:-m]) - s1 ** 2 / m, 0)
+        denom = np.sqrt(var) * t_norm
+        return np.divide(corr, denom, out=np.zeros_like(corr),
+                         where=denom > 0)
+    #
+    buf = np.empty(0)
+    lag = 0
+    for block in blocks:
+        buf = np.concatenate((buf, block))
+        while len(buf) >= fft_size:
+            yield lag, ncc(buf[:fft_size])
+            lag += hop
+            buf = buf[hop:]
+    if len(buf) >= m:
+        yield lag, ncc(buf)
+
+
+def envelope_blocks(path, decimation=DECIMATION, blocksize=BLOCKSIZE):
+    """
+    :returns: A generator of 1D arrays with the amplitude envelope of the
+      given audio file: each envelope sample is the mean absolute value
+      (across channels) of ``decimation`` consecutive frames. Remaining
+      frames at the end of the file are ignored.
+    """
+    blocksize = max(decimation, blocksize - blocksize % decimation)
+    for block in sf.blocks(path, blocksize=blocksize, always_2d=True):
+        mono = np.abs(block).mean(axis=1)
+        n = len(mono) // decimation
+        if n > 0:
+            yield mono[:n * decimation].reshape(n, decimation).mean(axis=1)
+
+
+def _resample(arr, ratio):
+    """
+    Linear interpolation of ``arr`` to ``round(len(arr) * ratio)`` samples.
+    """
+    if ratio == 1:
+        return arr
+    new_len = max(1, int(round(len(arr) * ratio)))
+    return np.interp(np.arange(new_len) / ratio, np.arange(len(arr)), arr)
+
+
+def _best_lag(ncc_blocks):
+    """
+    :returns: The ``(lag, ncc)`` tuple with maximal ncc among the outputs of
+      ``xcorr_overlap_save``, or ``(None, -inf)`` if there are no outputs.
+    """
+    best_lag, best_ncc = None, -np.inf
+    for lag_beg, ncc in ncc_blocks:
+        k = int(ncc.argmax())
+        if ncc[k] > best_ncc:
+            best_lag, best_ncc = lag_beg + k, float(ncc[k])
+    return best_lag, best_ncc
+
+
+@profiled("locators.xcorr_locate_wav")
+def xcorr_locate_wav(short_path, long_path, decimation=DECIMATION,
+                     refine_frames=REFINE_FRAMES, blocksize=BLOCKSIZE,
+                     verbose=False):
+    """
+    Tolerant counterpart of ``locate_wav``, for shorter WAVs that aren't a
+    bit-exact slice of the longer one. See module docstring for details.
+
+    :param int decimation: Frames per envelope sample in the coarse search.
+    :param int refine_frames: Length in frames of the reference segment of
+      the shorter file used for the sample-accurate refinement.
+    :returns: A tuple ``(beg, end, confidence)`` where ``[beg:end]`` is the
+      range of frames in the longer file that best matches the shorter file,
+      and ``confidence`` is the Pearson correlation (between -1 and 1) of the
+      reference segment at that position. If the shorter file doesn't fit
+      into the longer one, returns None.
+
+    .. note::
+
+      If the samplerates differ, the shorter file is linearly resampled to
+      the samplerate of the longer one. Results are given in frames of the
+      longer file.
+    """
+    short_info, long_info = sf.info(short_path), sf.info(long_path)
+    ratio = long_info.samplerate / short_info.samplerate
+    len_short = int(round(short_info.frames * ratio))
+    if len_short > long_info.frames:
+        return None
+    # coarse: correlate decimated envelopes, streaming the long one
+    short_env = _resample(np.concatenate(
+        list(envelope_blocks(short_path, decimation, blocksize))), ratio)
+    coarse_lag, coarse_ncc = _best_lag(xcorr_overlap_save(
+        envelope_blocks(long_path, decimation, blocksize), short_env))
+    if coarse_lag is None:
+        return None
+    coarse_beg = coarse_lag * decimation
+    if verbose:
+        print("[xcorr_locate_wav] coarse offset:", coarse_beg,
+              "envelope correlation:", coarse_ncc)
+    # fine: correlate a loud reference segment of the short file, sample-wise
+    # within a small window of the long one
+    refine_frames = min(refine_frames, short_info.frames)
+    env_per_ref = max(1, int(refine_frames / decimation * ratio))
+    loudness = np.convolve(short_env, np.ones(env_per_ref), mode="valid")
+    ref_beg = int(loudness.argmax() * decimation / ratio)
+    ref_beg = min(ref_beg, short_info.frames - refine_frames)
+    ref, _ = sf.read(short_path, start=ref_beg, frames=refine_frames,
+                     always_2d=True)
+    ref = _resample(ref.mean(axis=1), ratio)
+    ref_beg = int(round(ref_beg * ratio))  # in long frames from now on
+    margin = 2 * decimation
+    win_beg = max(0, coarse_beg + ref_beg - margin)
+    win, _ = sf.read(long_path, start=win_beg,
+                     frames=len(ref) + 2 * margin, always_2d=True)
+    fine_lag, confidence = _best_lag(xcorr_overlap_save([win.mean(axis=1)],
+                                                        ref))
+    if fine_lag is None:
+        return None
+    beg = win_beg + fine_lag - ref_beg
+    if verbose:
+        print("[xcorr_locate_wav] offset:", beg, "confidence:", confidence)
+    return (beg, beg + len_short, confidence)
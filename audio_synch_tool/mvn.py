@@ -15,7 +15,7 @@ MVN file and the way they can be accessed from Python::
 
   # load mvn schema https://www.xsens.com/mvn/mvnx/schema.xsd
   mvn_path = "XXX"
-  mmvn = Mvn(mvn_path, validate=True)
+  mmvn = Mvn(mvn_path, validate=True)  # or "strict" to also use the XSD
 
   # These elements contain some small metadata:
   mmvn.mvn.attrib
@@ -102,9 +102,15 @@ for shoulders usually).
 __author__ = "Andres FR"
 
 
+import threading
+#
 import numpy as np
 from lxml import etree, objectify  # https://lxml.de/validation.html
 from .utils import make_timestamp, resolve_path
+from .utils import convert_anchors, piecewise_linear_map
+from .profiling import span, profiled
+from .validation import validate_structure, STRICT
+from .columnar import write_columns, CHUNK_FRAMES
 
 
 # #############################################################################
@@ -129,39 +135,142 @@ class Mvn(object):
     """
 
     MVNX_SCHEMA_PATH = resolve_path("data", "mvn_schema_adapted.xsd")
+    _SCHEMAS = {}  # compiled schemas by path, shared by all instances
+    _SCHEMAS_LOCK = threading.Lock()
 
     def __init__(self, mvn_path, validate=False):
         """
         :param str mvn_path: a valid path pointing to the XML file to load
-        :param str validate: (optional): if true, the loaded XML will be
-          validated against the schema definition in self.MVNX_SCHEMA_PATH.
+        :param validate: (optional): if true, the structure of the loaded XML
+          will be validated (see ``validation``). If ``"strict"``, it will
+          also be validated against the schema in ``self.MVNX_SCHEMA_PATH``.
         """
+        assert validate in (False, True, STRICT), \
+            "validate must be a boolean or %r!" % STRICT
         self.mvn_path = mvn_path
         #
-        mvn = etree.parse(mvn_path)
-        # if a schema is given, load it and validate mvn
+        # parsed directly into an objectify tree: a round trip through a
+        # string would hold the whole file in memory twice more
+        with span("mvn.parse"):
+            self.mvn = objectify.parse(mvn_path).getroot()
+        self._normal_cache = None  # (normal frame nodes, their indexes)
+        self._audio_samples = None  # audio sample per normal frame
+        self._audio_samples_pending = False  # not written to the XML yet
         if validate:
-            self.schema = etree.XMLSchema(file=self.MVNX_SCHEMA_PATH)
-            self.schema.assertValid(mvn)
-        #
-        self.mvn = objectify.fromstring(etree.tostring(mvn))
+            self.validate(validate == STRICT)
+
+    @classmethod
+    def get_schema(cls):
+        """
+        :returns: The ``etree.XMLSchema`` in ``cls.MVNX_SCHEMA_PATH``. It is
+          compiled only once, and reused by all instances and threads.
+        """
+        with cls._SCHEMAS_LOCK:
+            if cls.MVNX_SCHEMA_PATH not in cls._SCHEMAS:
+                cls._SCHEMAS[cls.MVNX_SCHEMA_PATH] = etree.XMLSchema(
+                    file=cls.MVNX_SCHEMA_PATH)
+            return cls._SCHEMAS[cls.MVNX_SCHEMA_PATH]
+
+    @profiled("mvn.validate")
+    def validate(self, strict=False):
+        """
+        Validates the structure of ``self.mvn`` that the extraction methods
+        rely on (see ``validation``). It only reads the tree, so it can run in
+        a separate thread while the frames are extracted (see ``loaders``).
+
+        :param bool strict: If true, ``self.mvn`` is also validated against
+          the schema definition in ``self.MVNX_SCHEMA_PATH``.
+        :raises: ``validation.MvnxStructureError`` if the structure isn't
+          valid, and ``lxml.etree.DocumentInvalid`` if the MVN isn't valid
+          against the schema.
+        """
+        validate_structure(self.mvn)
+        if strict:
+            self.schema = self.get_schema()
+            with span("mvn.validate_schema"):
+                self.schema.assertValid(self.mvn)
 
+    @profiled("mvn.export")
     def export(self, filepath, pretty_print=True, extra_comment=""):
         """
         Saves the current ``mvn`` attribute to the given file path as XML and
         adds the ``self.mvn.attrib["pythonComment"]`` attribute with
         a timestamp.
         """
-        #
-        with open(filepath, "w") as f:
-            msg = "Exported from %s on %s. " % (
-                self.__class__.__name__, make_timestamp()) + extra_comment
-            self.mvn.attrib["pythonComment"] = msg
-            s = etree.tostring(self.mvn,
-                               pretty_print=pretty_print).decode("utf-8")
-            f.write(s)
-            print("[Mvn] exported to", filepath)
+        self.flush_audio_synch()
+        msg = "Exported from %s on %s. " % (
+            self.__class__.__name__, make_timestamp()) + extra_comment
+        self.mvn.attrib["pythonComment"] = msg
+        # serialized incrementally into the file, without a full-tree string
+        with open(filepath, "wb") as f:
+            etree.ElementTree(self.mvn).write(f, pretty_print=pretty_print)
+        print("[Mvn] exported to", filepath)
+
+    @profiled("mvn.export_columns")
+    def export_columns(self, out_dir, chunk_frames=CHUNK_FRAMES):
+        """
+        Saves the normal frames to the given directory as memory-mappable
+        ``.npy`` arrays plus a JSON sidecar, including the audio samples if
+        synched. See ``columnar`` module.
 
+        :returns: The metadata dict that was saved as sidecar.
+        """
+        try:
+            audio_samples = self._get_audio_samples()
+        except KeyError:
+            audio_samples = None
+        meta = write_columns(out_dir, self.mvn, self._normal_frames(),
+                             audio_samples, chunk_frames, self.mvn_path)
+        print("[Mvn] exported columns to", out_dir)
+        return meta
+
+    def _normal_frames(self):
+        """
+        :returns: A list with the normal frame nodes of this Mvn. It is
+          cached, so the frames must be removed via this class (e.g.
+          ``trim_to_audio_range``).
+        """
+        if self._normal_cache is None:
+            with span("mvn.index_frames"):
+                frames = [f for f in self.mvn.subject.frames.iterchildren()
+                          if f.attrib["type"] == "normal"]
+                indexes = np.array([f.attrib["index"] for f in frames],
+                                   dtype=np.int64)
+            self._normal_cache = (frames, indexes)
+        return self._normal_cache[0]
+
+    def get_frame_indexes(self):
+        """
+        :returns: An int64 array with the ``index`` attributes of the normal
+          frames (cached, don't modify it).
+        """
+        self._normal_frames()
+        return self._normal_cache[1]
+
+    def _set_audio_samples(self, audio_samples):
+        """
+        Stores the given int64 array as the ``audio_sample`` of each normal
+        frame. Writing them into the XML is deferred until needed (see
+        ``flush_audio_synch``), so that re-synching is cheap.
+        """
+        self._audio_samples = audio_samples
+        self._audio_samples_pending = True
+
+    @profiled("mvn.flush_audio_synch")
+    def flush_audio_synch(self):
+        """
+        Writes the pending audio samples (see ``set_audio_synch``) into the
+        ``audio_sample`` attributes of the normal frames. This is done
+        automatically when exporting or extracting frames, but must be
+        called before reading the attributes directly from ``self.mvn``.
+        """
+        if self._audio_samples_pending:
+            for f, a_idx in zip(self._normal_frames(),
+                                self._audio_samples.tolist()):
+                f.attrib["audio_sample"] = str(a_idx)
+            self._audio_samples_pending = False
+
+    @profiled("mvn.set_audio_synch")
     def set_audio_synch(self, stretch, shift):
         """
         Given the list of normal frames in this Mvn, each one with an "index"
@@ -170,15 +279,47 @@ class Mvn(object):
         See ``utils.convert_anchors`` for converting anchor points into stretch
         and shift.
         """
-        normal_frames = [f for f in self.mvn.subject.frames.getchildren()
-                         if f.attrib["type"] == "normal"]
-        for f in normal_frames:
-            f_idx = float(f.attrib["index"])
-            audio_idx = round(f_idx * float(stretch) + float(shift))
-            f.attrib["audio_sample"] = str(audio_idx)
+        indexes = self.get_frame_indexes().astype(np.float64)
+        # np.rint rounds half to even, like python's round
+        audio_idxs = np.rint(indexes * float(stretch) + float(shift))
+        self._set_audio_samples(audio_idxs.astype(np.int64))
         print("finished adding 'audio_sample' attrib to normal frames",
               "with stretch =", stretch, "and shift =", shift)
 
+    @profiled("mvn.set_audio_warp")
+    def set_audio_warp(self, oris, dests):
+        """
+        Like ``set_audio_synch``, but for any number of anchors (at least 2),
+        e.g. to correct a recorder that drifted non-linearly or dropped
+        frames: the ``audio_sample`` of each normal frame is its ``index``,
+        mapped piecewise-linearly between the anchors and rounded (see
+        ``utils.piecewise_linear_map``).
+
+        :param oris: Frame indexes of the anchors.
+        :param dests: Corresponding audio samples, same length as ``oris``.
+          With 2 anchors, this is equivalent to ``set_audio_synch``.
+        """
+        if len(oris) == 2:
+            self.set_audio_synch(*convert_anchors(oris[0], dests[0],
+                                                  oris[1], dests[1]))
+            return
+        audio_idxs = np.rint(piecewise_linear_map(self.get_frame_indexes(),
+                                                  oris, dests))
+        self._set_audio_samples(audio_idxs.astype(np.int64))
+        print("finished adding 'audio_sample' attrib to normal frames",
+              "with", len(oris), "anchors")
+
+    def _get_audio_samples(self):
+        """
+        :returns: An int64 array with the audio sample of each normal frame.
+        :raises: KeyError if a normal frame has no ``audio_sample``.
+        """
+        if self._audio_samples is None:
+            self._audio_samples = np.array(
+                [f.attrib["audio_sample"] for f in self._normal_frames()],
+                dtype=np.int64)
+        return self._audio_samples
+
     def get_audio_synch(self):
         """
         :returns: a list with the ``audio_sample`` attributes for the
@@ -189,17 +330,67 @@ class Mvn(object):
           an exception.
         """
         try:
-            return [int(f.attrib["audio_sample"])
-                    for f in self.mvn.subject.frames.getchildren()
-                    if f.attrib["type"] == "normal"]
+            return self._get_audio_samples().tolist()
         except KeyError:
             return None
 
+    @profiled("mvn.trim_to_audio_range")
+    def trim_to_audio_range(self, beg, end, scale=1):
+        """
+        Removes the normal frames that lie outside of the ``[beg, end]`` audio
+        range, and subtracts ``beg`` from the ``audio_sample`` of the remaining
+        ones, so that they refer to an audio file starting at ``beg``. The
+        last frame at or before ``beg`` is kept, with ``audio_sample=0``, so
+        the trimmed audio begins with mocap information.
+
+        :param int beg: First audio sample of the range.
+        :param int end: Last audio sample of the range.
+        :param scale: The shifted samples are multiplied by this and rounded,
+          e.g. ``short_samplerate / long_samplerate`` if the trimmed audio
+          file has a different samplerate than the synched one.
+        :returns: A tuple ``(first, last)`` with the range of the normal
+          frames that were kept, i.e. ``normal_frames[first:last]``.
+
+        .. note::
+
+          Requires the ``audio_sample`` attributes (see ``set_audio_synch``)
+          to be present and non-decreasing.
+        """
+        normal_frames = self._normal_frames()
+        try:
+            audio_idxs = self._get_audio_samples()
+        except KeyError:
+            raise KeyError("Mvn has frames without audio_sample. Synch first!")
+        assert (np.diff(audio_idxs) >= 0).all(), \
+            "audio_sample attributes must be non-decreasing!"
+        first = max(0, int(np.searchsorted(audio_idxs, beg, "right")) - 1)
+        last = int(np.searchsorted(audio_idxs, end, "right"))
+        # remove the frames outside of the range
+        frames_node = self.mvn.subject.frames
+        for f in normal_frames[:first]:
+            frames_node.remove(f)
+        for f in normal_frames[last:]:
+            frames_node.remove(f)
+        self._normal_cache = (normal_frames[first:last],
+                              self._normal_cache[1][first:last])
+        # shift the rest. If there is a frame before beg, it becomes 0
+        shifted = audio_idxs[first:last] - int(beg)
+        if len(shifted) > 0:
+            shifted[0] = max(shifted[0], 0)
+        if scale != 1:
+            shifted = np.rint(shifted * scale).astype(np.int64)
+        self._set_audio_samples(shifted)
+        print("[Mvn] trimmed to audio range", (beg, end), "keeping",
+              last - first, "of", len(normal_frames), "normal frames")
+        return first, last
+
     # EXTRACTORS: LIKE "GETTERS" BUT RETURN A MODIFIED COPY OF THE CONTENTS
+    @profiled("mvn.extract_frame_info")
     def extract_frame_info(self):
         """
         :returns: The tuple ``(frames_metadata, config_frames, normal_frames)``
         """
+        self.flush_audio_synch()
         f_meta, config_f, normal_f = self.extract_frames(self.mvn)
         frames_metadata = f_meta
         config_frames = config_f
@@ -210,6 +401,7 @@ class Mvn(object):
         return frames_metadata, config_frames, normal_frames
 
     @staticmethod
+    @profiled("mvn.extract_frames")
     def extract_frames(mvn):
         """
         The bulk of the MVN file is the ``mvn->subject->frames`` section.
@@ -271,6 +463,35 @@ class Mvn(object):
             "Segments aren't ordered by id?"
         return segments
 
+    @profiled("mvn.extract_accel_norms")
+    def extract_accel_norms(self, segment_names):
+        """
+        Faster alternative to ``extract_normalframe_sequences`` when only the
+        acceleration magnitudes are needed: only the ``acceleration`` node of
+        each normal frame is parsed.
+
+        :param segment_names: A list of segment names, e.g. ``["LeftHand"]``
+        :returns: A float32 array of shape ``(num_normalframes, num_names)``
+          with the euclidean norm of the 3D acceleration of each segment.
+        """
+        segments = self.extract_segments()
+        seg_idxs = [segments.index(s) for s in segment_names]
+        normal_frames = self._normal_frames()
+        accels = np.array([f.acceleration.text.split() for f in normal_frames],
+                          dtype=np.float32)
+        accels = accels.reshape(len(normal_frames), len(segments), 3)
+        return np.linalg.norm(accels[:, seg_idxs], ord=2, axis=-1)
+
+    @profiled("mvn.extract_normalframe_attrib")
+    def extract_normalframe_attrib(self, name):
+        """
+        :param str name: An attribute of the normal frames, e.g. ``tc``
+        :returns: A list with the given attribute (string) of each normal
+          frame.
+        """
+        self.flush_audio_synch()
+        return [f.attrib[name] for f in self._normal_frames()]
+
     @staticmethod
     def extract_normalframe_magnitudes(normal_frames):
         """
@@ -283,6 +504,7 @@ class Mvn(object):
                 "Inconsistent magnitudes in frame %d?" % i
         return result
 
+    @profiled("mvn.extract_normalframe_sequences")
     def extract_normalframe_sequences(self, frames_metadata, normal_frames):
         """
         :returns: a dict with np arrays of shape
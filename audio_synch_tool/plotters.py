@@ -7,6 +7,7 @@
 
 # os+plt imports right after __future__
 import os
+import time
 import numpy as np
 import matplotlib
 # if os.environ.get('DISPLAY', '') == '':
@@ -16,18 +17,24 @@ import matplotlib.pyplot as plt
 from matplotlib import gridspec
 from matplotlib.widgets import TextBox  # Button
 from matplotlib.backend_tools import ToolBase
+from matplotlib.transforms import Affine2D
+from matplotlib.ticker import FuncFormatter
 from mpl_toolkits.axes_grid1 import make_axes_locatable
 
-import soundfile as sf
-
 
 from .utils import resolve_path
 from .utils import DownsamplableFunction
 from .utils import IdentityFormatter, SampleToTimestampFormatter
 from .utils import SynchedMvnFormatter
 from .utils import XlimCallbackFunctor, SharedXlimCallbackFunctor
-from .utils import convert_anchors
+from .utils import RollingLatencies
+from .utils import convert_anchors, synch_to_anchors, split_anchors
 from .mvn import Mvn
+from .autosynch import autosynch
+from .claps import clap_candidates
+from .timecode import timecode_synch_wav
+from .loaders import load_take
+from .profiling import profiled, instrument_figure
 
 __author__ = "Andres FR"
 
@@ -47,6 +54,8 @@ def redefine_plt_shortcuts(fig, help_keys=["f1"], save_keys=["ctrl+s"]):
     rc = matplotlib.rcParams
     #
     if rc["toolbar"] == "toolmanager":
+        if not has_toolbar(fig):
+            return  # headless backends like Agg have no toolbar
         tm = fig.canvas.manager.toolbar.toolmanager
         tm._keys = {}  # delete all preexisting mappings
         for hk in help_keys:
@@ -76,6 +85,48 @@ def redefine_plt_shortcuts(fig, help_keys=["f1"], save_keys=["ctrl+s"]):
 # ## HELPERS
 # #############################################################################
 
+def has_toolbar(fig):
+    """
+    :returns: False if the figure has no toolbar to hold widgets, as it
+      happens with non-interactive backends like Agg. True otherwise.
+    """
+    manager = fig.canvas.manager
+    return getattr(manager, "toolbar", None) is not None
+
+
+class ArrayFuncFormatter(FuncFormatter):
+    """
+    A ``plt.FuncFormatter`` that, if the wrapped functor provides a
+    ``format_ticks(vals)->[str]`` method (like the formatters in ``utils``),
+    delegates to it the labeling of all ticks at once, instead of calling
+    the functor once per tick.
+    """
+    def format_ticks(self, values):
+        """
+        """
+        format_ticks = getattr(self.func, "format_ticks", None)
+        if format_ticks is None:
+            return super().format_ticks(values)
+        self.set_locs(values)
+        return format_ticks(values)
+
+
+@profiled("plotters.accel_norm_arrays")
+def accel_norm_arrays(mvn, segment_groups):
+    """
+    :param Mvn mvn: The Mvn to extract the accelerations from.
+    :param segment_groups: A list of lists of segment names.
+    :returns: A list of lists of 1D arrays, with the acceleration norm of
+      each given segment, grouped in the same way.
+    """
+    norms = mvn.extract_accel_norms([s for g in segment_groups for s in g])
+    result, i = [], 0
+    for g in segment_groups:
+        result.append([norms[:, j] for j in range(i, i + len(g))])
+        i += len(g)
+    return result
+
+
 def add_to_toolbar(fig, *widgets):
     """
     Adds a set of button-like widgets to the toolbar of a given figure.
@@ -109,11 +160,12 @@ class SignalTransformButtons(ToolBase):
 class SynchAndSaveMvnButton(SignalTransformButtons):
     """
     Given the current anchors, set the audio_synch info into the MVN
-    and save it to the given path.
+    and save it to the given path. If extra anchors are given, the synch is
+    piecewise-linear between all anchors (see ``Mvn.set_audio_warp``).
     ..note::
 
       This assumes the following textboxes ordering!:
-      ``[ori1, dest1, ori2, dest2, outpath]``
+      ``[ori1, dest1, ori2, dest2, (extra_anchors,) outpath]``
     """
 
     name = "synch_and_save_mvn"
@@ -131,7 +183,16 @@ class SynchAndSaveMvnButton(SignalTransformButtons):
                   "please set all text boxes wit valid values before!")
             return
         #
-        tb_ori1, tb_dest1, tb_ori2, tb_dest2, tb_outpath = self.fig.textboxes
+        tb_ori1, tb_dest1, tb_ori2, tb_dest2 = self.fig.textboxes[:4]
+        tb_outpath = self.fig.textboxes[-1]
+        anchors = [tb_ori1.val, tb_dest1.val, tb_ori2.val, tb_dest2.val]
+        for tb in self.fig.textboxes[4:-1]:
+            anchors.extend(x for pair in tb.val for x in pair)
+        try:
+            oris, dests = split_anchors(anchors)
+        except AssertionError as e:
+            print("[SynchAndSaveMvnButton] wrong anchors!", e)
+            return
         # also check if path works
         try:
             with open(tb_outpath.val, "w"):
@@ -139,12 +200,9 @@ class SynchAndSaveMvnButton(SignalTransformButtons):
         except Exception as e:
             print("[SynchAndSaveMvnButton] wrong path!", e)
             return
-        # convert anchors into stretch and shift, then
-        # apply stretch, shift and round to every frame idx to get audio sample
-        stretch, shift = convert_anchors(tb_ori1.val, tb_dest1.val,
-                                         tb_ori2.val, tb_dest2.val)
+        # map every frame idx through the anchors and round to get audio sample
         mvn = self.fig.mvn
-        mvn.set_audio_synch(stretch, shift)
+        mvn.set_audio_warp(oris, dests)
         # finally add wav info
         wav_name = os.path.basename(self.fig.wav_path)
         mvn.mvn.attrib["wav_file"] = wav_name
@@ -153,6 +211,95 @@ class SynchAndSaveMvnButton(SignalTransformButtons):
         mvn.export(tb_outpath.val)
 
 
+class PerformanceHudButton(SignalTransformButtons):
+    """
+    Toggles the performance HUD (see ``PerformanceHud``). Expects the figure
+    to have a ``hud`` attribute.
+    """
+
+    name = "performance_hud"
+    default_keymap = ""
+    description = ("Toggle a display of the callback, downsampling and draw" +
+                   " latencies, and the points plotted per track")
+    image = resolve_path("data", "performance_hud.png")
+
+    def trigger(self, *args, **kwargs):
+        """
+        """
+        self.fig.hud.toggle()
+
+
+class SynchPreviewButton(SignalTransformButtons):
+    """
+    Toggles the live preview of the current anchors (see ``SynchPreview``).
+    Expects the figure to have a ``preview`` attribute.
+    """
+
+    name = "synch_preview"
+    default_keymap = ""
+    description = ("Toggle a live preview of the synchronization given by" +
+                   " the current anchors")
+    image = resolve_path("data", "synch_preview.png")
+
+    def trigger(self, *args, **kwargs):
+        """
+        """
+        self.fig.preview.toggle()
+
+
+class AutoSynchButton(SignalTransformButtons):
+    """
+    Estimates the synchronization automatically and fills the anchor text
+    boxes with it (see ``autosynch`` module). Expects the figure to have an
+    ``autosynch`` attribute.
+    """
+
+    name = "autosynch"
+    default_keymap = ""
+    description = ("Estimate the anchors automatically by correlating audio" +
+                   " onsets with the arm accelerations")
+    image = resolve_path("data", "auto_synch.png")
+
+    def trigger(self, *args, **kwargs):
+        """
+        """
+        self.fig.autosynch()
+
+
+class PrevCandidateButton(SignalTransformButtons):
+    """
+    Jumps to the previous candidate anchor (see ``CandidateNavigator``).
+    Expects the figure to have a ``navigator`` attribute.
+    """
+
+    name = "prev_candidate"
+    default_keymap = ""
+    description = "Jump to the previous clap candidate"
+    image = resolve_path("data", "prev_candidate.png")
+
+    def trigger(self, *args, **kwargs):
+        """
+        """
+        self.fig.navigator.jump(-1)
+
+
+class NextCandidateButton(SignalTransformButtons):
+    """
+    Jumps to the next candidate anchor (see ``CandidateNavigator``).
+    Expects the figure to have a ``navigator`` attribute.
+    """
+
+    name = "next_candidate"
+    default_keymap = ""
+    description = "Jump to the next clap candidate"
+    image = resolve_path("data", "next_candidate.png")
+
+    def trigger(self, *args, **kwargs):
+        """
+        """
+        self.fig.navigator.jump(1)
+
+
 class TextPromptOutPath(TextBox):
     NAME = "OutPath"
     AX_TITLE = "Synched MVNX Out Path:"
@@ -173,6 +320,40 @@ class TextPromptOutPath(TextBox):
         self.val = txt
 
 
+class TextPromptExtraAnchors(TextBox):
+    """
+    Optional anchors in addition to the 2 given by the ``NumberPrompt``
+    boxes, as whitespace-separated ``ori:dest`` pairs like ``12000:2401234``.
+    The ``val`` attribute holds a list of ``(ori, dest)`` float tuples.
+
+    ..note::
+
+      The synch preview only shows the first 2 anchors.
+    """
+    NAME = "ExtraAnchors"
+    AX_TITLE = "Extra Anchors (ori:dest ...)"
+    LABEL = ""
+    SIZE_PERCENT = "300%"
+    PADDING = 0.5
+
+    def __init__(self, axis):
+        """
+        """
+        super().__init__(axis, self.LABEL)
+        axis.set_title(self.AX_TITLE)
+        self.val = []
+        self.on_submit(self._submit)
+
+    def _submit(self, txt):
+        try:
+            self.val = [tuple(float(x) for x in pair.split(":"))
+                        for pair in txt.split()]
+            assert all(len(pair) == 2 for pair in self.val)
+        except (ValueError, AssertionError):
+            print(txt, "are not valid ori:dest pairs! ignored...")
+            self.val = []
+
+
 class NumberPrompt(TextBox):
     """
     """
@@ -228,6 +409,541 @@ class NumberPromptDest2(NumberPrompt):
     AX_TITLE = "Destiny 2"
 
 
+# #############################################################################
+# ## OVERLAYS
+# #############################################################################
+
+class BlittedCursorOverlay(object):
+    """
+    Draws a vertical crosshair that follows the mouse, plus a text readout
+    of the hovered x-position, on top of a figure. The crosshair is drawn
+    with blitting: the figure background (including all downsampled tracks)
+    is cached after every full redraw, and moving the cursor only restores
+    that background and draws the animated artists on top of it. See:
+
+    https://matplotlib.org/stable/tutorials/advanced/blitting.html
+
+    .. note::
+
+      Axes that share their x-coordinates (given as ``axis_groups``) show
+      the crosshair at the same time, since the hovered x-position means the
+      same for all of them.
+    """
+
+    CURSOR_STYLE = {"color": "grey", "linewidth": 0.8, "linestyle": "--"}
+    READOUT_POS = (0.01, 0.01)  # in figure coordinates
+    READOUT_FONTSIZE = 8
+
+    def __init__(self, fig, axis_groups, readouts):
+        """
+        :param fig: The ``plt.Figure`` containing the axes.
+        :param axis_groups: A list of lists of axes. All axes in a group are
+          expected to share the same x-coordinates.
+        :param readouts: A list of the same length as ``axis_groups``, with
+          functors in the form ``(xval)->str`` to display the hovered
+          position of the corresponding group.
+        """
+        assert len(axis_groups) == len(readouts), \
+            "len(axis_groups) != len(readouts)"
+        self.fig = fig
+        self.canvas = fig.canvas
+        self.axis_groups = axis_groups
+        self.readouts = readouts
+        self.group_of = {ax: i for i, axs in enumerate(axis_groups)
+                         for ax in axs}
+        self.background = None
+        self.artists = []
+        #
+        self.cursors = {ax: self.add_artist(ax.axvline(
+            0, visible=False, **self.CURSOR_STYLE))
+                        for axs in axis_groups for ax in axs}
+        self.readout_text = self.add_artist(fig.text(
+            *self.READOUT_POS, "", fontsize=self.READOUT_FONTSIZE))
+        #
+        self.cids = [
+            self.canvas.mpl_connect("draw_event", self.on_draw),
+            self.canvas.mpl_connect("motion_notify_event", self.on_move),
+            self.canvas.mpl_connect("axes_leave_event", self.on_leave)]
+
+    def add_artist(self, artist):
+        """
+        Registers an artist to be drawn by blitting. The artist is set to
+        animated, so regular redraws of the canvas will ignore it.
+        """
+        artist.set_animated(True)
+        self.artists.append(artist)
+        return artist
+
+    def on_draw(self, event):
+        """
+        Callback for full redraws: cache the new background and draw the
+        animated artists on top.
+        """
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self._draw_animated()
+
+    def _draw_animated(self):
+        """
+        """
+        for a in self.artists:
+            self.fig.draw_artist(a)
+
+    def update(self):
+        """
+        Restores the cached background and blits the animated artists. If
+        there is no background yet, does nothing since the next full draw
+        will take care of the artists.
+        """
+        if self.background is None:
+            return
+        self.canvas.restore_region(self.background)
+        self._draw_animated()
+        self.canvas.blit(self.fig.bbox)
+
+    def on_move(self, event):
+        """
+        """
+        group_idx = self.group_of.get(event.inaxes, None)
+        if group_idx is None or event.xdata is None:
+            self.on_leave(event)
+            return
+        for ax, cursor in self.cursors.items():
+            is_hovered = self.group_of[ax] == group_idx
+            cursor.set_visible(is_hovered)
+            if is_hovered:
+                cursor.set_xdata([event.xdata, event.xdata])
+        self.readout_text.set_text(self.readouts[group_idx](event.xdata))
+        self.update()
+
+    def on_leave(self, event):
+        """
+        """
+        if not self.readout_text.get_text():
+            return  # already hidden, avoid needless blitting
+        for cursor in self.cursors.values():
+            cursor.set_visible(False)
+        self.readout_text.set_text("")
+        self.update()
+
+    def disconnect(self):
+        """
+        Removes all callbacks from the canvas.
+        """
+        for cid in self.cids:
+            self.canvas.mpl_disconnect(cid)
+
+
+class AnchorCursorOverlay(BlittedCursorOverlay):
+    """
+    Extends the cursor overlay with markers for the anchors held by the
+    ``NumberPrompt`` text boxes, and click-to-set-anchor: clicking with the
+    left (resp. right) mouse button sets the anchor 1 (resp. 2). Clicking on
+    the origin axes sets the ``ori`` anchor, and clicking on the destination
+    axes sets the ``dest`` anchor. Clicks are ignored while a navigation tool
+    like zoom or pan is active.
+
+    If the ori axes display their data through a transform (see
+    ``SynchPreview``), set the ``ori_transform`` attribute to the
+    corresponding ``Affine2D``, so markers, readouts and clicks are mapped
+    accordingly.
+
+    ..note::
+
+      This assumes the following textboxes ordering!:
+      ``[ori1, dest1, ori2, dest2, ...]``
+    """
+
+    ANCHOR_BUTTONS = {1: 0, 3: 1}  # mouse button -> anchor number - 1
+    ANCHOR_STYLES = [{"color": "tab:red", "linewidth": 1.2},
+                     {"color": "tab:green", "linewidth": 1.2}]
+
+    def __init__(self, fig, ori_axes, dest_axes, ori_readout, dest_readout,
+                 textboxes):
+        """
+        :param ori_axes: A list of axes in the same coordinates as the
+          ``ori`` anchors (e.g. MVN frames).
+        :param dest_axes: A list of axes in the same coordinates as the
+          ``dest`` anchors (e.g. audio samples).
+        :param textboxes: The list of ``NumberPrompt`` instances holding the
+          anchors (see class docstring for the expected ordering).
+        """
+        super().__init__(fig, [ori_axes, dest_axes],
+                         [self._ori_readout, dest_readout])
+        self.ori_readout = ori_readout
+        self.ori_transform = None
+        self.ori_axes = ori_axes
+        self.dest_axes = dest_axes
+        self.anchor_boxes = [(textboxes[0], textboxes[1]),
+                             (textboxes[2], textboxes[3])]
+        # one marker per anchor and axis
+        self.markers = []
+        for style in self.ANCHOR_STYLES:
+            ori_m = [self.add_artist(ax.axvline(0, visible=False, **style))
+                     for ax in ori_axes]
+            dest_m = [self.add_artist(ax.axvline(0, visible=False, **style))
+                      for ax in dest_axes]
+            self.markers.append((ori_m, dest_m))
+        #
+        for ori_box, dest_box in self.anchor_boxes:
+            ori_box.on_submit(self.on_anchor_submit)
+            dest_box.on_submit(self.on_anchor_submit)
+        self.cids.append(self.canvas.mpl_connect("button_press_event",
+                                                 self.on_click))
+        self.update_anchors()
+
+    def data_to_ori(self, x):
+        """
+        Maps an x-position of the ori axes into ori coordinates.
+        """
+        if self.ori_transform is None:
+            return x
+        return self.ori_transform.inverted().transform((x, 0))[0]
+
+    def ori_to_data(self, x):
+        """
+        Maps an x-position in ori coordinates into the ori axes.
+        """
+        if self.ori_transform is None:
+            return x
+        return self.ori_transform.transform((x, 0))[0]
+
+    def _ori_readout(self, x):
+        """
+        """
+        return self.ori_readout(self.data_to_ori(x))
+
+    def update_anchors(self):
+        """
+        Reads the anchor values from the text boxes and updates the markers
+        accordingly.
+        """
+        for (ori_box, dest_box), (ori_m, dest_m) in zip(self.anchor_boxes,
+                                                        self.markers):
+            for box, markers, to_data in ((ori_box, ori_m, self.ori_to_data),
+                                          (dest_box, dest_m, None)):
+                for m in markers:
+                    if box.val is None:
+                        m.set_visible(False)
+                        continue
+                    x = box.val if to_data is None else to_data(box.val)
+                    m.set_xdata([x, x])
+                    m.set_visible(True)
+
+    def on_anchor_submit(self, txt):
+        """
+        """
+        self.update_anchors()
+        self.update()
+
+    def on_click(self, event):
+        """
+        """
+        anchor_idx = self.ANCHOR_BUTTONS.get(event.button, None)
+        if (anchor_idx is None or event.xdata is None or
+                self.canvas.widgetlock.locked()):
+            return
+        ori_box, dest_box = self.anchor_boxes[anchor_idx]
+        if event.inaxes in self.ori_axes:
+            ori_box.set_val(str(round(self.data_to_ori(event.xdata))))
+        elif event.inaxes in self.dest_axes:
+            dest_box.set_val(str(round(event.xdata)))
+
+
+class SynchPreview(object):
+    """
+    Live preview of the affine ``x -> x * stretch + shift`` synchronization
+    given by the anchors, applied to a group of axes (e.g. the MVN ones)
+    against a reference axis (e.g. the audio one). No x-array is recomputed
+    and no MVNX is written: the lines of the group are drawn through an
+    ``Affine2D`` prepended to their data transform, the downsampling functors
+    map their limits back into the original coordinates, and the x-limits of
+    the group follow the ones of the reference axis (and vice versa) while
+    the preview is active.
+
+    ..note::
+
+      This assumes the following textboxes ordering!:
+      ``[ori1, dest1, ori2, dest2, ...]``
+    """
+
+    def __init__(self, axes, ref_ax, functors, textboxes, overlay=None):
+        """
+        :param axes: The list of axes to be transformed. They are expected to
+          share their x-limits.
+        :param ref_ax: The axis in the destination coordinates.
+        :param functors: The list of ``XlimCallbackFunctor`` instances
+          handling the downsampling of ``axes``.
+        :param textboxes: The list of ``NumberPrompt`` instances holding the
+          anchors. Changing them while the preview is active updates it.
+        :param overlay: If given, an ``AnchorCursorOverlay`` whose ori axes
+          are ``axes``. Its markers, readouts and clicks will follow the
+          preview.
+        """
+        self.axes = axes
+        self.ref_ax = ref_ax
+        self.functors = functors
+        self.anchor_boxes = textboxes[:4]
+        self.overlay = overlay
+        self.transform = Affine2D()
+        self.stretch_shift = None
+        self._syncing = False
+        #
+        for ax in [ref_ax] + list(axes):
+            ax.callbacks.connect("xlim_changed", self.on_xlim_changed)
+        for box in self.anchor_boxes:
+            box.on_submit(self.on_anchor_submit)
+
+    @property
+    def active(self):
+        """
+        """
+        return self.stretch_shift is not None
+
+    def set(self, stretch, shift):
+        """
+        Activates (or updates) the preview with the given stretch and shift.
+        The ``Affine2D`` is modified in place, so already transformed artists
+        follow without further changes.
+        """
+        was_active = self.active
+        self.stretch_shift = (stretch, shift)
+        self.transform.clear().scale(stretch, 1).translate(shift, 0)
+        for f in self.functors:
+            f.stretch_shift = self.stretch_shift
+            if not was_active:
+                for line in f.lines:
+                    line.set_transform(self.transform + f.ax.transData)
+        if self.overlay is not None:
+            self.overlay.ori_transform = self.transform
+            self.overlay.update_anchors()
+        # bring the group to the reference view, refreshing the downsampling
+        self.on_xlim_changed(self.ref_ax)
+
+    def clear(self):
+        """
+        Deactivates the preview, keeping the group's view on the same data.
+        """
+        if not self.active:
+            return
+        stretch, shift = self.stretch_shift
+        self.stretch_shift = None
+        for f in self.functors:
+            f.stretch_shift = None
+            for line in f.lines:
+                line.set_transform(f.ax.transData)
+        if self.overlay is not None:
+            self.overlay.ori_transform = None
+            self.overlay.update_anchors()
+        x0, x1 = self.ref_ax.get_xlim()
+        self.axes[0].set_xlim(sorted(((x0 - shift) / stretch,
+                                      (x1 - shift) / stretch)))
+
+    def preview_anchors(self):
+        """
+        Reads the anchors from the text boxes and activates the preview.
+        """
+        vals = [box.val for box in self.anchor_boxes]
+        if any([v is None for v in vals]):
+            print("[SynchPreview] ignored:",
+                  "please set all anchors with valid values before!")
+            return
+        ori1, dest1, ori2, dest2 = vals
+        if ori1 == ori2:
+            print("[SynchPreview] ignored: ori1 and ori2 can't be equal!")
+            return
+        self.set(*convert_anchors(ori1, dest1, ori2, dest2))
+
+    def toggle(self):
+        """
+        """
+        if self.active:
+            self.clear()
+        else:
+            self.preview_anchors()
+
+    def on_anchor_submit(self, txt):
+        """
+        """
+        if self.active:
+            self.preview_anchors()
+
+    def on_xlim_changed(self, ax):
+        """
+        Keeps the x-limits of the group and the reference axis together while
+        the preview is active. Setting the limits of the first axis of the
+        group is enough, since the group is shared.
+        """
+        if not self.active or self._syncing:
+            return
+        self._syncing = True
+        try:
+            target = self.axes[0] if ax is self.ref_ax else self.ref_ax
+            target.set_xlim(ax.get_xlim())
+        finally:
+            self._syncing = False
+
+
+class CandidateNavigator(object):
+    """
+    Cycles through a ranked list of candidate anchors (e.g. clap candidates,
+    see ``claps`` module), centering the ori axis on the candidate's ori
+    and the dest axis on its dest. The candidates are computed on the first
+    jump, since finding them may take a while.
+    """
+
+    def __init__(self, ori_ax, dest_ax, ori_radius, dest_radius,
+                 candidates_fn, preview=None, ori_to_x=None):
+        """
+        :param ori_radius: Half of the x-range shown around the ori of a
+          candidate, in x-units of the ori axis. Same for ``dest_radius``.
+        :param candidates_fn: A functor without arguments that returns a list
+          of ``(ori, dest, score)`` tuples.
+        :param preview: If given, a ``SynchPreview`` on the ori axis. While
+          active, only the dest axis is set, since the ori one follows it.
+        :param ori_to_x: If given, a functor mapping the ori of a candidate
+          to its x-position in the ori axis, for axes whose x-values aren't
+          the oris (e.g. MVN frames plotted at their audio samples).
+        """
+        self.ori_to_x = ori_to_x
+        self.ori_ax = ori_ax
+        self.dest_ax = dest_ax
+        self.ori_radius = ori_radius
+        self.dest_radius = dest_radius
+        self.candidates_fn = candidates_fn
+        self.preview = preview
+        self.candidates = None
+        self.pos = -1
+
+    def jump(self, step):
+        """
+        Moves ``step`` positions in the candidate list (cyclically) and
+        centers the axes on the resulting candidate.
+        """
+        if self.candidates is None:
+            self.candidates = self.candidates_fn()
+        if not self.candidates:
+            print("[CandidateNavigator] no candidates found")
+            return
+        self.pos = (self.pos + step) % len(self.candidates)
+        ori, dest, score = self.candidates[self.pos]
+        self.dest_ax.set_xlim(dest - self.dest_radius, dest + self.dest_radius)
+        if self.preview is None or not self.preview.active:
+            x = ori if self.ori_to_x is None else self.ori_to_x(ori)
+            self.ori_ax.set_xlim(x - self.ori_radius, x + self.ori_radius)
+        self.dest_ax.figure.canvas.draw_idle()
+        print("[CandidateNavigator] candidate %d/%d: ori=%s, dest=%s,"
+              " score=%.3f" % (self.pos + 1, len(self.candidates), ori, dest,
+                               score))
+
+
+class PerformanceHud(object):
+    """
+    Heads-up display with the rolling p50/p95 latencies of the downsampling
+    callbacks (see ``XlimCallbackFunctor.latencies``), of the downsampling
+    itself and of the full redraws of the figure, plus the number of points
+    currently plotted per track. Helps to tune ``max_datapoints`` and to
+    catch interactivity regressions. Nothing is measured while hidden.
+
+    The text is drawn by the given overlay (see ``BlittedCursorOverlay``) and
+    refreshed at the beginning of every full redraw, so the shown draw times
+    are the ones of the previous redraws.
+    """
+
+    HUD_POS = (0.01, 0.99)  # top left, in figure coordinates
+    HUD_FONTSIZE = 7
+    HUD_BBOX = {"facecolor": "white", "edgecolor": "grey", "alpha": 0.85}
+    WINDOW = 100  # no. of latest durations per percentile
+    STAGES = [("callback", "xlim callback"), ("downsample", "downsample"),
+              ("draw", "draw")]
+
+    def __init__(self, fig, functors, overlay, window=WINDOW):
+        """
+        :param functors: The ``XlimCallbackFunctor`` instances of the figure,
+          one per track (i.e. axis).
+        :param overlay: A ``BlittedCursorOverlay`` of the figure.
+        """
+        self.fig = fig
+        self.functors = functors
+        self.latencies = RollingLatencies(window)
+        self.text = overlay.add_artist(fig.text(
+            *self.HUD_POS, "", fontsize=self.HUD_FONTSIZE, family="monospace",
+            va="top", bbox=self.HUD_BBOX, visible=False))
+        self._draw = None  # the original fig.draw, while active
+        self._draw_attr = None  # fig.draw if set on the instance before
+
+    @property
+    def active(self):
+        """
+        """
+        return self._draw is not None
+
+    def format_text(self):
+        """
+        :returns: The text of the HUD.
+        """
+        lines = []
+        for key, label in self.STAGES:
+            pcts = self.latencies.percentiles(key)
+            if pcts is None:
+                lines.append("%-13s -" % label)
+            else:
+                lines.append("%-13s p50 %8.2f ms  p95 %8.2f ms" % (
+                    label, 1000 * pcts[0], 1000 * pcts[1]))
+        points = ["/".join(str(len(line.get_xdata())) for line in f.lines)
+                  for f in self.functors]
+        lines.append("points per track: " + ", ".join(points))
+        return "\n".join(lines)
+
+    def _timed_draw(self, renderer):
+        """
+        Replaces ``fig.draw`` while active.
+        """
+        self.text.set_text(self.format_text())
+        t0 = time.perf_counter()
+        result = self._draw(renderer)
+        self.latencies.add("draw", time.perf_counter() - t0)
+        return result
+
+    def show(self):
+        """
+        Starts measuring, with empty statistics, and shows the HUD.
+        """
+        if self.active:
+            return
+        self.latencies.clear()
+        self._draw_attr = vars(self.fig).get("draw", None)
+        self._draw = self.fig.draw
+        self.fig.draw = self._timed_draw
+        for f in self.functors:
+            f.latencies = self.latencies
+        self.text.set_visible(True)
+        self.fig.canvas.draw_idle()
+
+    def hide(self):
+        """
+        Stops measuring and hides the HUD.
+        """
+        if not self.active:
+            return
+        for f in self.functors:
+            f.latencies = None
+        if self._draw_attr is None:
+            del self.fig.draw  # back to the class method
+        else:
+            self.fig.draw = self._draw_attr
+        self._draw = self._draw_attr = None
+        self.text.set_visible(False)
+        self.fig.canvas.draw_idle()
+
+    def toggle(self):
+        """
+        """
+        if self.active:
+            self.hide()
+        else:
+            self.show()
+
+
 # #############################################################################
 # ## PLOTTER CLASSES
 # #############################################################################
@@ -358,6 +1074,7 @@ class MultipleDownsampledPlotter1D(object):
             for i in self.shared_idxs:
                 self.arr_maxranges[i] = shared_maxrange
 
+    @profiled("plotters.make_fig")
     def make_fig(self, textbox_widgets=[], toolbar_widgets=[]):
         """
         :param toolbar_widgets: A list of class names of type
@@ -382,6 +1099,7 @@ class MultipleDownsampledPlotter1D(object):
 
         # define and configure plt figure
         fig = plt.figure(figsize=self.FIG_ASPECT_RATIO)
+        instrument_figure(fig)
         setattr(fig, "plotter", self)
         redefine_plt_shortcuts(fig)
         gs = list(gridspec.GridSpec(num_axes, 1, height_ratios=hratios))
@@ -398,6 +1116,7 @@ class MultipleDownsampledPlotter1D(object):
         functors = [XlimCallbackFunctor(ax, lns, arrs, shared_axes,
                                         verbose=False)
                     for ax, lns, arrs in zip(axes, line_lists, self.arrays)]
+        setattr(fig, "xlim_functors", functors)  # one per axis, uncollapsed
         # collapse the shared functors, if existing:
         if self.shared_idxs:
             shared_f = SharedXlimCallbackFunctor(
@@ -429,7 +1148,7 @@ class MultipleDownsampledPlotter1D(object):
 
             # optionally adapt labels to given sample rates
             if frmtr is not None:
-                ax.xaxis.set_major_formatter(plt.FuncFormatter(frmtr))
+                ax.xaxis.set_major_formatter(ArrayFuncFormatter(frmtr))
             # if sr is not None:
             #     f = SampleToTimestampFormatter(sr, self.NUM_DECIMALS,
             #                                    self.SHOW_IDX)
@@ -458,10 +1177,12 @@ class MultipleDownsampledPlotter1D(object):
                 textboxes.append(textbox)
             setattr(fig, "textboxes", textboxes)  # allow toolbar to find text
             # add toolbar buttons and link them to textbox
-            add_to_toolbar(fig, *toolbar_widgets)
+            if has_toolbar(fig):
+                add_to_toolbar(fig, *toolbar_widgets)
             for w in toolbar_widgets:
                 w.fig = fig
         #
+        setattr(fig, "signal_axes", axes[:self.N])  # allow overlays to plot
         fig.subplots_adjust(**self.FIG_MARGINS)
         return fig
 
@@ -471,31 +1192,48 @@ class AudioMvnSynchToolEditor(MultipleDownsampledPlotter1D):
     """
     TEXTBOX_WIDGET_CLASSES = [NumberPromptOri1, NumberPromptDest1,
                               NumberPromptOri2, NumberPromptDest2,
-                              TextPromptOutPath]
-    TOOLBAR_BUTTON_CLASSES = [SynchAndSaveMvnButton]
-
+                              TextPromptExtraAnchors, TextPromptOutPath]
+    TOOLBAR_BUTTON_CLASSES = [SynchAndSaveMvnButton, PerformanceHudButton,
+                              SynchPreviewButton, AutoSynchButton,
+                              PrevCandidateButton, NextCandidateButton]
+    CANDIDATE_ZOOM_SECS = 0.5  # shown at each side of a clap candidate
+    # one subplot per group, with the acceleration norms of its segments
+    ACCEL_SEGMENTS = [["LeftShoulder", "LeftForeArm", "LeftHand"],
+                      ["RightShoulder", "RightForeArm", "RightHand"]]
+
+    @profiled("plotters.AudioMvnSynchToolEditor.__init__")
     def __init__(self, wav_path, mvnx_path, validate_mvnx=False,
-                 max_datapoints=10000):
+                 max_datapoints=10000, progress=None, cancel=None):
         """
+        The WAV and MVNX are loaded concurrently, see ``loaders.load_take``
+        for the ``progress`` and ``cancel`` parameters.
         """
         self.wav_path = wav_path
         self.mvnx_path = mvnx_path
-        wav_arr, audio_samplerate = sf.read(wav_path)
-        self.mvn = Mvn(mvnx_path, validate_mvnx)
+        take = load_take(wav_path, mvnx_path, validate_mvnx,
+                         lambda mvn: accel_norm_arrays(mvn,
+                                                       self.ACCEL_SEGMENTS),
+                         progress, cancel)
+        wav_arr, audio_samplerate = take["wav_arr"], take["samplerate"]
+        self.wav_arr = wav_arr
+        self.audio_samplerate = audio_samplerate
+        self.mvn = take["mvn"]
+        self.frame_indexes = self.mvn.get_frame_indexes().tolist()
         # get mvn samplerate and our desired y arrays
         mvn_samplerate = float(self.mvn.mvn.subject.attrib["frameRate"])
-        mvn_arrays = self._get_mvn_arrays()
+        self.mvn_samplerate = mvn_samplerate
+        mvn_arrays = take["decoded"]
         y_arrays = [[wav_arr]] + mvn_arrays
-        # x-array for audio is trivial
-        x_audio = np.arange(len(wav_arr)).astype(np.float64)
+        # x-array for audio is trivial. float32, like DownsamplableFunction
+        x_audio = np.arange(len(wav_arr), dtype=np.float32)
         # x-array for mvn: if no pre-synched entries use frame indexes.
         x_mvn = self.mvn.get_audio_synch()
+        self.presynched = x_mvn is not None
         if x_mvn is None:
-            x_mvn = [int(f.attrib["index"])
-                     for f in self.mvn.mvn.subject.frames.getchildren()
-                     if f.attrib["type"] == "normal"]
+            x_mvn = self.frame_indexes
         # x_mvn = torch.Tensor(x_mvn).numpy()
         x_mvn = np.float32(x_mvn)
+        self.x_mvn = x_mvn
 
         # bundle plotter inputs:
         x_arrays = [[x_audio]] + [[x_mvn for a in arrs] for arrs in mvn_arrays]
@@ -510,56 +1248,117 @@ class AudioMvnSynchToolEditor(MultipleDownsampledPlotter1D):
         super().__init__(y_arrays, samplerates, max_datapoints, shared_plots,
                          x_arrays, xtick_formatters)
 
-    def _get_mvn_arrays(self):
-        """
-        """
-        # extract info from mocap
-        mocap_segments = self.mvn.extract_segments()
-        frames_metadata, _, normal_frames = self.mvn.extract_frame_info()
-        frame_sequences = self.mvn.extract_normalframe_sequences(
-            frames_metadata, normal_frames)
-        mocap_accelerations_3d = frame_sequences["acceleration"]
-        # mocap_accel_norm = torch.norm(mocap_accelerations_3d, 2, dim=-1)
-        mocap_accel_norm = np.linalg.norm(np.stack(mocap_accelerations_3d),
-                                          ord=2, axis=-1)
-        #
-        mvn_arrays = [[
-            mocap_accel_norm[:, mocap_segments.index("LeftShoulder")],
-            mocap_accel_norm[:, mocap_segments.index("LeftForeArm")],
-            mocap_accel_norm[:, mocap_segments.index("LeftHand")]],
-                      [
-            mocap_accel_norm[:, mocap_segments.index("RightShoulder")],
-            mocap_accel_norm[:, mocap_segments.index("RightForeArm")],
-            mocap_accel_norm[:, mocap_segments.index("RightHand")]]]
-        return mvn_arrays
-
     def make_fig(self):
         fig = super().make_fig(self.TEXTBOX_WIDGET_CLASSES,
                                self.TOOLBAR_BUTTON_CLASSES)
         # more monkey patching!
         setattr(fig, "wav_path", self.wav_path)
         setattr(fig, "mvn", self.mvn)
+        # crosshair, anchor markers and click-to-set-anchor
+        audio_ax, mvn_axes = fig.signal_axes[0], fig.signal_axes[1:]
+        audio_fmt = self.xtick_formatters[0]
+        overlay = AnchorCursorOverlay(
+            fig, mvn_axes, [audio_ax],
+            lambda x: "frame: " + str(round(x)),
+            lambda x: "sample: " + audio_fmt(round(x), None),
+            fig.textboxes)
+        setattr(fig, "overlay", overlay)
+        # latencies display, toggled by PerformanceHudButton
+        setattr(fig, "hud", PerformanceHud(fig, fig.xlim_functors, overlay))
+        # live preview of the anchors, toggled by SynchPreviewButton
+        preview = SynchPreview(mvn_axes, audio_ax, fig.xlim_functors[1:],
+                               fig.textboxes, overlay)
+        setattr(fig, "preview", preview)
+        # automatic anchor estimation, triggered by AutoSynchButton
+        setattr(fig, "autosynch", lambda: self.autosynch_anchors(fig))
+        # jump between clap candidates, triggered by Prev/NextCandidateButton
+        mvn_x_rate = (self.audio_samplerate if self.presynched
+                      else self.mvn_samplerate)
+        navigator = CandidateNavigator(
+            mvn_axes[0], audio_ax,
+            self.CANDIDATE_ZOOM_SECS * mvn_x_rate,
+            self.CANDIDATE_ZOOM_SECS * self.audio_samplerate,
+            lambda: clap_candidates([self.wav_arr], self.audio_samplerate,
+                                    self.mvn), preview, self.frame_to_x)
+        setattr(fig, "navigator", navigator)
         return fig
 
+    def frame_to_x(self, frame_idx):
+        """
+        :returns: The x-position of the given frame index in the MVN axes,
+          i.e. its (interpolated) audio sample if the MVN is pre-synched.
+        """
+        return float(np.interp(frame_idx, self.frame_indexes, self.x_mvn))
+
+    def autosynch_anchors(self, fig):
+        """
+        Estimates the synchronization (see ``autosynch`` module) and fills
+        the anchor text boxes of the given figure with it, using the first
+        and last normal frames as origins.
+
+        :returns: The score of the estimation.
+        """
+        stretch, shift, score = autosynch(self.wav_arr,
+                                          self.audio_samplerate, self.mvn)
+        anchors = self.set_synch_anchors(fig, stretch, shift)
+        print("[AudioMvnSynchToolEditor] autosynch anchors:", anchors,
+              "score:", score)
+        return score
+
+    def timecode_anchors(self, fig, **kwargs):
+        """
+        Like ``autosynch_anchors``, but synchronizes via the BWF and MVN
+        timecodes (see ``timecode`` module).
+
+        :param kwargs: Further keyword arguments for ``timecode_synch_wav``.
+        :returns: The max. residual of the timecodes in milliseconds.
+        """
+        stretch, shift, residual_ms = timecode_synch_wav(
+            self.wav_path, self.mvn, **kwargs)
+        anchors = self.set_synch_anchors(fig, stretch, shift)
+        print("[AudioMvnSynchToolEditor] timecode anchors:", anchors,
+              "max. residual (ms):", residual_ms)
+        return residual_ms
+
+    def set_synch_anchors(self, fig, stretch, shift):
+        """
+        Fills the anchor text boxes of the given figure with the given synch,
+        using the first and last normal frames as origins.
+
+        :returns: The anchors ``(ori1, dest1, ori2, dest2)``
+        """
+        anchors = synch_to_anchors(stretch, shift, self.frame_indexes[0],
+                                   self.frame_indexes[-1])
+        for tb, val in zip(fig.textboxes[:4], anchors):
+            tb.set_val(str(val))
+        return anchors
+
 
 class AudioMvnSynchToolChecker(MultipleDownsampledPlotter1D):
     """
     This doesn't modify the synch, just displays it
     """
+    ACCEL_SEGMENTS = [["LeftUpperArm", "LeftForeArm", "LeftHand"],
+                      ["RightUpperArm", "RightForeArm", "RightHand"]]
 
+    @profiled("plotters.AudioMvnSynchToolChecker.__init__")
     def __init__(self, audio_array, audio_samplerate, mvn,
-                 max_datapoints=10000):
+                 max_datapoints=10000, mvn_arrays=None):
         """
+        :param mvn_arrays: If given, the output of ``accel_norm_arrays`` for
+          ``mvn`` and ``ACCEL_SEGMENTS``, e.g. computed while loading (see
+          ``loaders.load_take``). Otherwise, it is computed here.
         """
         assert isinstance(mvn, Mvn), "mvn must be an instance of Mvn!"
         self.mvn = mvn
         # get mvn samplerate and our desired y arrays
         self.mvn_samplerate = float(mvn.mvn.subject.attrib["frameRate"])
-        mvn_arrays = self._get_mvn_arrays()
+        if mvn_arrays is None:
+            mvn_arrays = accel_norm_arrays(self.mvn, self.ACCEL_SEGMENTS)
         y_arrays = [[audio_array]] + mvn_arrays
         # x-array for audio is trivial
         # x_audio = torch.arange(len(audio_array)).type(torch.float64).numpy()
-        x_audio = np.arange(len(audio_array)).astype(np.float64)
+        x_audio = np.arange(len(audio_array), dtype=np.float32)
         # x-array for mvn: if no pre-synched entries use frame indexes.
         x_mvn = self.mvn.get_audio_synch()
         assert x_mvn is not None, "No synch info in mvn file?"
@@ -581,32 +1380,15 @@ class AudioMvnSynchToolChecker(MultipleDownsampledPlotter1D):
         super().__init__(y_arrays, samplerates, max_datapoints, shared_plots,
                          x_arrays, xtick_formatters)
 
-    def _get_mvn_arrays(self):
-        """
-        """
-        # extract info from mocap
-        mocap_segments = self.mvn.extract_segments()
-        frames_metadata, _, normal_frames = self.mvn.extract_frame_info()
-        frame_sequences = self.mvn.extract_normalframe_sequences(
-            frames_metadata, normal_frames)
-        mocap_accelerations_3d = frame_sequences["acceleration"]
-        # mocap_accel_norm = torch.norm(mocap_accelerations_3d, 2, dim=-1)
-        mocap_accel_norm = np.linalg.norm(np.stack(mocap_accelerations_3d),
-                                          ord=2, axis=-1)
-
-        #
-        mvn_arrays = [[
-            mocap_accel_norm[:, mocap_segments.index("LeftUpperArm")],
-            mocap_accel_norm[:, mocap_segments.index("LeftForeArm")],
-            mocap_accel_norm[:, mocap_segments.index("LeftHand")]],
-                      [
-            mocap_accel_norm[:, mocap_segments.index("RightUpperArm")],
-            mocap_accel_norm[:, mocap_segments.index("RightForeArm")],
-            mocap_accel_norm[:, mocap_segments.index("RightHand")]]]
-        return mvn_arrays
-
     def make_fig(self):
         fig = super().make_fig()
         # more monkey patching!
         setattr(fig, "mvn", self.mvn)
+        # all axes are shared in check mode, so they form a single group
+        audio_fmt = self.xtick_formatters[0]
+        overlay = BlittedCursorOverlay(
+            fig, [fig.signal_axes],
+            [lambda x: "sample: " + audio_fmt(round(x), None)])
+        setattr(fig, "overlay", overlay)
+        setattr(fig, "hud", PerformanceHud(fig, fig.xlim_functors, overlay))
         return fig
@@ -0,0 +1,364 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains an opt-in instrumentation layer for the hot paths of
+this package (XML parsing and validation, audio reading, extraction,
+synchronization, figure construction and redraws...). The instrumented
+stages are marked with the ``profiled`` decorator or the ``span`` context
+manager::
+
+  @profiled("mvn.export")
+  def export(...):
+      ...
+
+  with span("mvn.parse"):
+      ...
+
+While disabled (the default), ``span`` returns a shared no-op context and
+``profiled`` only checks a global before calling the function, so the
+instrumentation costs nothing noticeable. It is enabled by calling
+``enable``, by setting the ``AUDIO_SYNCH_TOOL_PROFILE`` environment
+variable before importing this package, or by passing ``--profile`` to the
+CLIs::
+
+  # print a per-stage summary on exit
+  AUDIO_SYNCH_TOOL_PROFILE=1 python -m audio_synch_tool drift -w ...
+  # also save a Chrome trace (open it in chrome://tracing or Perfetto)
+  python -m audio_synch_tool drift -w ... --profile=trace.json
+  # also track Python allocations with tracemalloc (slower)
+  python -m audio_synch_tool drift -w ... --profile --tracemalloc
+
+For each span, the wall time, the growth of the peak RSS of the process and,
+if ``tracemalloc`` is on, the allocated and peak traced memory are recorded.
+The summary aggregates them per stage: call count, total, mean and max
+time, max RSS growth and max traced peak.
+
+.. note::
+
+  Only the current process is recorded: the work done by the workers of the
+  process pools (e.g. ``batch``, ``render``, ``drift``) isn't.
+"""
+
+
+import os
+import sys
+import json
+import time
+import atexit
+import threading
+import functools
+import contextlib
+import tracemalloc
+try:
+    import resource  # not available on Windows
+except ImportError:
+    resource = None
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+PROFILE_ENV_VAR = "AUDIO_SYNCH_TOOL_PROFILE"  # "1" or a .json trace path
+TRACEMALLOC_ENV_VAR = "AUDIO_SYNCH_TOOL_TRACEMALLOC"  # "1" to enable
+PROFILE_FLAG = "--profile"  # optionally followed by "=<trace path>"
+TRACEMALLOC_FLAG = "--tracemalloc"
+# ru_maxrss is given in kilobytes on Linux and in bytes on macOS
+RSS_UNIT_BYTES = 1 if sys.platform == "darwin" else 1024
+MB = 1024 * 1024
+
+_PROFILER = None  # the active Profiler, None while disabled
+_NULL_SPAN = contextlib.nullcontext()  # reusable, returned while disabled
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def peak_rss_bytes():
+    """
+    :returns: The peak resident set size of this process so far, in bytes,
+      or 0 if it isn't available on this platform.
+    """
+    if resource is None:
+        return 0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * RSS_UNIT_BYTES
+
+
+def pop_profile_args(argv):
+    """
+    Removes the ``--profile[=<trace path>]`` and ``--tracemalloc`` flags
+    from the given CLI arguments, and enables the profiler if any of them is
+    present.
+
+    :returns: The list of remaining arguments.
+    """
+    remaining, enabled, trace_path, memory = [], False, None, False
+    for arg in argv:
+        if arg == PROFILE_FLAG:
+            enabled = True
+        elif arg.startswith(PROFILE_FLAG + "="):
+            enabled, trace_path = True, arg[len(PROFILE_FLAG) + 1:]
+        elif arg == TRACEMALLOC_FLAG:
+            enabled, memory = True, True
+        else:
+            remaining.append(arg)
+    if enabled:
+        enable(trace_path, memory)
+    return remaining
+
+
+# #############################################################################
+# ## PROFILER
+# #############################################################################
+
+class Profiler(object):
+    """
+    Records the spans of the instrumented stages. Each span is stored as a
+    dict with its ``name``, thread id ``tid``, start ``ts`` and duration
+    ``dur`` (both in seconds, relative to the creation of the profiler),
+    the growth of the peak RSS ``rss_growth`` in bytes and, if tracemalloc
+    is on, the ``alloc`` and ``alloc_peak`` traced bytes relative to the
+    start of the span.
+    """
+
+    def __init__(self, trace_path=None, memory=False):
+        """
+        :param str trace_path: If given, a Chrome trace is saved here on
+          ``report``.
+        :param bool memory: If true, tracemalloc is started (if not running
+          yet) and the traced memory of each span is recorded.
+        """
+        self.trace_path = trace_path
+        self.memory = memory
+        self.t0 = time.perf_counter()
+        self.events = []
+        self._local = threading.local()  # per-thread stack of open spans
+        self._lock = threading.Lock()
+        self._started_tracemalloc = memory and not tracemalloc.is_tracing()
+        if self._started_tracemalloc:
+            tracemalloc.start()
+
+    def close(self):
+        """
+        Stops tracemalloc if it was started by this profiler.
+        """
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+
+    def _stack(self):
+        """
+        """
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name):
+        """
+        Records the wall time and memory of the enclosed block as a span
+        with the given name. Spans can be nested.
+        """
+        stack = self._stack()
+        # traced peak of the enclosing span so far, since reset_peak is global
+        frame = {"alloc0": 0, "peak": 0}
+        if self.memory:
+            current, peak = tracemalloc.get_traced_memory()
+            if stack:
+                stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            tracemalloc.reset_peak()
+            frame["alloc0"] = current
+        stack.append(frame)
+        rss0 = peak_rss_bytes()
+        beg = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            event = {"name": name, "tid": threading.get_ident(),
+                     "ts": beg - self.t0, "dur": end - beg,
+                     "rss_growth": peak_rss_bytes() - rss0}
+            stack.pop()
+            if self.memory:
+                current, peak = tracemalloc.get_traced_memory()
+                peak = max(peak, frame["peak"])
+                event["alloc"] = current - frame["alloc0"]
+                event["alloc_peak"] = peak - frame["alloc0"]
+                if stack:
+                    stack[-1]["peak"] = max(stack[-1]["peak"], peak)
+            with self._lock:
+                self.events.append(event)
+
+    def summary(self):
+        """
+        :returns: A list of dicts, one per span name sorted by descending
+          total time, with the ``name``, call ``count``, ``total``, ``mean``
+          and ``max`` seconds, ``max_rss_growth`` and (if tracemalloc is on)
+          ``max_alloc_peak`` in bytes.
+        """
+        stages = {}
+        with self._lock:
+            events = list(self.events)
+        for e in events:
+            s = stages.setdefault(e["name"], {
+                "name": e["name"], "count": 0, "total": 0.0, "max": 0.0,
+                "max_rss_growth": 0, "max_alloc_peak": None})
+            s["count"] += 1
+            s["total"] += e["dur"]
+            s["max"] = max(s["max"], e["dur"])
+            s["max_rss_growth"] = max(s["max_rss_growth"], e["rss_growth"])
+            if "alloc_peak" in e:
+                s["max_alloc_peak"] = max(s["max_alloc_peak"] or 0,
+                                          e["alloc_peak"])
+        result = sorted(stages.values(), key=lambda s: -s["total"])
+        for s in result:
+            s["mean"] = s["total"] / s["count"]
+        return result
+
+    def format_summary(self):
+        """
+        :returns: The ``summary`` as a printable table.
+        """
+        lines = ["%-45s %7s %10s %10s %10s %9s %9s" % (
+            "stage", "calls", "total(s)", "mean(ms)", "max(ms)", "rss+(MB)",
+            "alloc(MB)")]
+        for s in self.summary():
+            alloc = ("%9.1f" % (s["max_alloc_peak"] / MB)
+                     if s["max_alloc_peak"] is not None else "%9s" % "-")
+            lines.append("%-45s %7d %10.4f %10.3f %10.3f %9.1f %s" % (
+                s["name"][:45], s["count"], s["total"], 1000 * s["mean"],
+                1000 * s["max"], s["max_rss_growth"] / MB, alloc))
+        lines.append("peak RSS: %.1f MB" % (peak_rss_bytes() / MB))
+        return "\n".join(lines)
+
+    def chrome_trace(self):
+        """
+        :returns: The spans as a dict in the Chrome trace event format
+          (complete ``X`` events with microsecond timestamps).
+        """
+        pid = os.getpid()
+        with self._lock:
+            events = list(self.events)
+        trace = []
+        for e in events:
+            args = {k: e[k] for k in ("rss_growth", "alloc", "alloc_peak")
+                    if k in e}
+            trace.append({"name": e["name"], "cat": "audio_synch_tool",
+                          "ph": "X", "pid": pid, "tid": e["tid"],
+                          "ts": 1e6 * e["ts"], "dur": 1e6 * e["dur"],
+                          "args": args})
+        return {"traceEvents": trace, "displayTimeUnit": "ms"}
+
+    def save_chrome_trace(self, path):
+        """
+        """
+        with open(path, "w") as f:
+            json.dump(self.chrome_trace(), f)
+        print("[Profiler] saved Chrome trace to", path)
+
+    def report(self):
+        """
+        Prints the summary to stderr and, if a trace path was given, saves
+        the Chrome trace.
+        """
+        print("[Profiler] summary:\n" + self.format_summary(), file=sys.stderr)
+        if self.trace_path is not None:
+            self.save_chrome_trace(self.trace_path)
+
+
+# #############################################################################
+# ## GLOBAL SWITCH AND INSTRUMENTATION
+# #############################################################################
+
+def enable(trace_path=None, memory=False, report_at_exit=True):
+    """
+    Starts recording spans into a new global ``Profiler`` (replacing any
+    previous one), which is returned.
+
+    :param bool report_at_exit: If true, ``Profiler.report`` is called when
+      the interpreter exits.
+    """
+    global _PROFILER
+    disable()
+    profiler = Profiler(trace_path, memory)
+    if report_at_exit:
+        atexit.register(lambda: profiler is _PROFILER and profiler.report())
+    _PROFILER = profiler
+    return profiler
+
+
+def disable():
+    """
+    Stops recording spans. Returns the profiler that was active, if any,
+    whose recorded spans are still available.
+    """
+    global _PROFILER
+    profiler, _PROFILER = _PROFILER, None
+    if profiler is not None:
+        profiler.close()
+    return profiler
+
+
+def get_profiler():
+    """
+    :returns: The active ``Profiler``, or None if disabled.
+    """
+    return _PROFILER
+
+
+def enable_from_env():
+    """
+    Enables the profiler if the ``PROFILE_ENV_VAR`` environment variable is
+    set to ``1`` (summary only) or to a ``.json`` path (summary and Chrome
+    trace). ``TRACEMALLOC_ENV_VAR=1`` also tracks memory allocations.
+    """
+    value = os.environ.get(PROFILE_ENV_VAR, "")
+    if value and value != "0":
+        trace_path = None if value == "1" else value
+        memory = os.environ.get(TRACEMALLOC_ENV_VAR, "") == "1"
+        enable(trace_path, memory)
+
+
+def span(name):
+    """
+    :returns: A context manager that records the enclosed block as a span of
+      the active profiler, or a no-op one if disabled.
+    """
+    if _PROFILER is None:
+        return _NULL_SPAN
+    return _PROFILER.span(name)
+
+
+def profiled(name):
+    """
+    Decorator that records every call to the decorated function as a span
+    with the given name, while the profiler is enabled.
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _PROFILER is None:
+                return fn(*args, **kwargs)
+            with _PROFILER.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_figure(fig, name="figure.draw"):
+    """
+    If the profiler is enabled, wraps the ``draw`` method of the given
+    matplotlib figure so that every full redraw is recorded as a span.
+    """
+    if _PROFILER is not None:
+        fig.draw = profiled(name)(fig.draw)
+    return fig
+
+
+enable_from_env()
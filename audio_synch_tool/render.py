@@ -0,0 +1,195 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains the functionality to render check-mode figures
+(see ``plotters.AudioMvnSynchToolChecker``) into image files without a
+display, for the quality assessment of many synched takes. For each take,
+an overview PNG with the whole take and a set of zoomed PNGs around given
+points are produced.
+
+Points are given as strings, with the following formats:
+
+* ``first``, ``last``: The audio sample of the first (resp. last) normal frame
+* ``frame:N``: The audio sample of the normal frame with ``index=N``
+* ``N``: The audio sample N, e.g. one of the ``dest`` anchors
+
+Takes are rendered in a process pool. Every worker renders a single take
+and is then replaced, so the memory of a take is released as soon as it is
+done. Usage example::
+
+  results = render_takes(["a.mvnx", "b.mvnx"], "/tmp/out",
+                         points=["first", "last", "frame:1000"])
+"""
+
+
+import os
+import multiprocessing
+#
+import soundfile as sf
+#
+from .mvn import Mvn
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+DEFAULT_POINTS = ["first", "last"]
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def resolve_wav_path(mvn, mvnx_path, wav_dir=None):
+    """
+    :param Mvn mvn: A synched Mvn, expected to have the ``wav_file``
+      attribute.
+    :param str wav_dir: The directory containing the WAV. If None, the
+      directory of ``mvnx_path`` is used.
+    :returns: The path to the WAV file the given MVN is synched to.
+    """
+    try:
+        wav_name = mvn.mvn.attrib["wav_file"]
+    except KeyError:
+        raise KeyError("No wav_file attribute in %s. Is it synched?" %
+                       mvnx_path)
+    if wav_dir is None:
+        wav_dir = os.path.dirname(mvnx_path)
+    return os.path.join(wav_dir, wav_name)
+
+
+def resolve_point(point, mvn):
+    """
+    :param str point: A point specification, see module docstring.
+    :param Mvn mvn: A synched Mvn
+    :returns: The audio sample corresponding to the given point.
+    """
+    audio_samples = mvn.get_audio_synch()
+    assert audio_samples is not None, "No synch info in mvn file?"
+    if point == "first":
+        return audio_samples[0]
+    if point == "last":
+        return audio_samples[-1]
+    if point.startswith("frame:"):
+        idx = int(point[len("frame:"):])
+        indexes = mvn.get_frame_indexes().tolist()
+        return audio_samples[indexes.index(idx)]
+    return int(float(point))
+
+
+def _init_worker(max_memory_mb=None):
+    """
+    Initializer for the render workers: use the non-interactive Agg backend,
+    and optionally limit the address space of the worker (Unix only).
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    if max_memory_mb is not None:
+        import resource
+        max_bytes = int(max_memory_mb * 1024 * 1024)
+        resource.setrlimit(resource.RLIMIT_AS, (max_bytes, max_bytes))
+
+
+# #############################################################################
+# ## RENDERING
+# #############################################################################
+
+def render_take(mvnx_path, out_dir, points=DEFAULT_POINTS, zoom_secs=0.5,
+                wav_dir=None, validate_mvnx=False, max_datapoints=10000,
+                num_xticks=20, dpi=100):
+    """
+    Renders the check-mode figure of a synched MVNX into an overview PNG
+    plus one zoomed PNG per point. Expects the Agg backend to be active.
+
+    :param str mvnx_path: Path to a synched MVNX.
+    :param str out_dir: Directory to save the images to.
+    :param points: A list of point specifications (see module docstring).
+    :param float zoom_secs: Zoomed images span this many seconds at each side
+      of their point.
+    :param str wav_dir: See ``resolve_wav_path``.
+    :returns: A list with the paths of the saved images.
+    """
+    import matplotlib.pyplot as plt
+    from .plotters import AudioMvnSynchToolChecker
+    #
+    mocap = Mvn(mvnx_path, validate_mvnx)
+    wav_path = resolve_wav_path(mocap, mvnx_path, wav_dir)
+    wav_arr, audio_samplerate = sf.read(wav_path)
+    plotter = AudioMvnSynchToolChecker(wav_arr, audio_samplerate, mocap,
+                                       max_datapoints)
+    plotter.NUM_XTICKS = num_xticks
+    fig = plotter.make_fig()
+    take_name = os.path.splitext(os.path.basename(mvnx_path))[0]
+    out_prefix = os.path.join(out_dir, take_name)
+    result = []
+    try:
+        # overview
+        fig.suptitle("Check Mode: " + take_name)
+        out_path = out_prefix + "_overview.png"
+        fig.savefig(out_path, dpi=dpi)
+        result.append(out_path)
+        # zoomed views: all axes are shared, so setting one is enough
+        zoom_radius = zoom_secs * audio_samplerate
+        for p in points:
+            center = resolve_point(p, mocap)
+            fig.signal_axes[0].set_xlim(center - zoom_radius,
+                                        center + zoom_radius)
+            fig.suptitle("Check Mode: %s (%s)" % (take_name, p))
+            out_path = "%s_zoom_%s.png" % (out_prefix, p.replace(":", "_"))
+            fig.savefig(out_path, dpi=dpi)
+            result.append(out_path)
+    finally:
+        plt.close(fig)
+    return result
+
+
+def _render_take_job(job):
+    """
+    Process pool wrapper around ``render_take``, that returns errors instead
+    of raising them, so a broken take doesn't stop the batch.
+
+    :param job: A tuple ``(mvnx_path, kwargs)``
+    :returns: A tuple ``(mvnx_path, image_paths, error_str)``
+    """
+    mvnx_path, kwargs = job
+    try:
+        return (mvnx_path, render_take(mvnx_path, **kwargs), None)
+    except Exception as e:
+        return (mvnx_path, [], "%s: %s" % (e.__class__.__name__, e))
+
+
+def render_takes(mvnx_paths, out_dir, num_processes=None, max_memory_mb=None,
+                 **kwargs):
+    """
+    Renders several takes in a process pool (see ``render_take``).
+
+    :param int num_processes: Number of parallel workers. If None, the
+      number of CPUs is used.
+    :param max_memory_mb: If given, maximal address space of each worker in
+      MB. Takes that don't fit will be reported as failed.
+    :param kwargs: Further keyword arguments for ``render_take``.
+    :returns: A list of ``(mvnx_path, image_paths, error_str)`` tuples, in
+      the same order as ``mvnx_paths``. ``error_str`` is None on success.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    kwargs["out_dir"] = out_dir
+    jobs = [(p, kwargs) for p in mvnx_paths]
+    # a fresh worker per take releases its memory when it is done
+    with multiprocessing.Pool(num_processes, initializer=_init_worker,
+                              initargs=(max_memory_mb,),
+                              maxtasksperchild=1) as pool:
+        results = []
+        for r in pool.imap(_render_take_job, jobs):
+            mvnx_path, image_paths, error = r
+            if error is None:
+                print("[render]", mvnx_path, "->", len(image_paths),
+                      "images")
+            else:
+                print("[render] FAILED %s: %s" % (mvnx_path, error))
+            results.append(r)
+    return results
@@ -0,0 +1,411 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains functionality to synchronize an MVN with an audio file
+by their timestamps alone, without any signal processing:
+
+* Broadcast-WAV (BWF) files have a ``bext`` chunk, whose ``TimeReference``
+  field is the position of the first audio sample, in samples since
+  midnight. It is read by a small RIFF parser that only reads the header
+  chunks, so no audio is decoded.
+* Every normal frame of an MVN has a ``tc`` timecode like ``02:23:28:164``
+  (where the last field are milliseconds, or frames at a given timecode
+  rate), and an ``ms`` unix timestamp in milliseconds.
+
+Both give the time of day of every normal frame and audio sample, so a line
+fitted through all ``(index, sample)`` pairs yields the ``(stretch, shift)``
+synch (see ``Mvn.set_audio_synch``). Since the quantization errors of the
+timecodes average out over the frames, the result is below one frame.
+Usage example::
+
+  mvn = Mvn("take.mvnx")
+  stretch, shift, residual_ms = timecode_synch_wav("take.wav", mvn)
+
+Note that the ``ms`` timestamps are UTC, so the timezone of the recorder
+clock must be given for that source.
+
+Alternatively, if an audio channel carries linear timecode (LTC), it is
+decoded in one streaming pass into a sparse table of ``(sample, timecode)``
+pairs, one per LTC frame, which is then fitted against the MVN ``tc``::
+
+  stretch, shift, residual_ms = ltc_synch_wav("take.wav", mvn, channel=1)
+
+Drop-frame timecodes are treated like non-drop ones.
+"""
+
+
+import struct
+import datetime
+#
+import numpy as np
+import soundfile as sf
+#
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+DEFAULT_TIMEZONE = "Europe/Berlin"  # same as utils.make_timestamp
+SECS_PER_DAY = 86400
+# byte offsets of the fields in the bext chunk (EBU Tech 3285)
+BEXT_FIELDS = {"description": (0, 256), "originator": (256, 288),
+               "originator_reference": (288, 320),
+               "origination_date": (320, 330),
+               "origination_time": (330, 338)}
+BEXT_TIME_REFERENCE_OFFSET = 338  # uint64, little endian
+#
+LTC_FRAME_BITS = 80
+LTC_SYNC = np.array([0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1],
+                    dtype=bool)  # last 16 bits of each LTC frame
+LTC_RATES = [24, 25, 29.97, 30]
+LTC_KEEP_FRAMES = 4  # LTC frames worth of crossings kept between blocks
+BLOCKSIZE = 2 ** 20  # frames per block when streaming WAV files
+
+
+# #############################################################################
+# ## BWF PARSING
+# #############################################################################
+
+def read_riff_chunks(wav_path, chunk_ids=(b"fmt ", b"bext")):
+    """
+    Reads the given chunks of a RIFF/WAVE file, seeking over the rest.
+
+    :returns: A dict ``{chunk_id: bytes}`` with the contents of the chunks
+      that were found.
+    """
+    result = {}
+    with open(wav_path, "rb") as f:
+        riff, _, wave = struct.unpack("<4sI4s", f.read(12))
+        assert riff in (b"RIFF", b"RF64") and wave == b"WAVE", \
+            "Not a RIFF/WAVE file: %s" % wav_path
+        while len(result) < len(chunk_ids):
+            header = f.read(8)
+            if len(header) < 8:
+                break
+            chunk_id, size = struct.unpack("<4sI", header)
+            if chunk_id == b"data" and size == 0xFFFFFFFF:
+                break  # RF64 data chunk: its real size is elsewhere
+            if chunk_id in chunk_ids:
+                result[chunk_id] = f.read(size)
+                f.seek(size % 2, 1)  # chunks are padded to even sizes
+            else:
+                f.seek(size + size % 2, 1)
+    return result
+
+
+@profiled("timecode.read_bwf_info")
+def read_bwf_info(wav_path):
+    """
+    :returns: A dict with the ``samplerate`` and ``num_channels`` of the
+      given WAV file, and the ``time_reference`` (in samples since midnight)
+      and text fields of its ``bext`` chunk (see ``BEXT_FIELDS``). If the
+      file has no ``bext`` chunk, ``time_reference`` is None.
+    """
+    chunks = read_riff_chunks(wav_path)
+    assert b"fmt " in chunks, "WAV without fmt chunk: %s" % wav_path
+    _, num_channels, samplerate = struct.unpack_from("<HHI", chunks[b"fmt "])
+    info = {"samplerate": samplerate, "num_channels": num_channels,
+            "time_reference": None}
+    bext = chunks.get(b"bext")
+    if bext is not None:
+        info["time_reference"] = struct.unpack_from(
+            "<Q", bext, BEXT_TIME_REFERENCE_OFFSET)[0]
+        for k, (beg, end) in BEXT_FIELDS.items():
+            info[k] = bext[beg:end].split(b"\0")[0].decode("ascii", "replace")
+    return info
+
+
+# #############################################################################
+# ## MVN TIMES
+# #############################################################################
+
+def tc_to_seconds(tcs, tc_fps=None):
+    """
+    :param tcs: A list of timecode strings like ``02:23:28:164``.
+    :param tc_fps: If None, the last field are milliseconds. Otherwise, it
+      is the frame number at the given timecode rate.
+    :returns: A float64 array with the seconds since midnight of each
+      timecode.
+    """
+    fields = np.array(" ".join(tcs).replace(":", " ").replace(";", " ")
+                      .split(), dtype=np.float64).reshape(-1, 4)
+    subsecs = fields[:, 3] / (1000.0 if tc_fps is None else tc_fps)
+    return fields[:, 0] * 3600 + fields[:, 1] * 60 + fields[:, 2] + subsecs
+
+
+@profiled("timecode.mvn_seconds_of_day")
+def mvn_seconds_of_day(mvn, source="tc", tc_fps=None,
+                       timezone=DEFAULT_TIMEZONE):
+    """
+    :param str source: Either ``tc`` or ``ms``, the frame attribute to use.
+    :param tc_fps: See ``tc_to_seconds``.
+    :param str timezone: The timezone of the recorder clock, for ``ms``.
+    :returns: A float64 array with the seconds since midnight of each normal
+      frame. It continues beyond ``SECS_PER_DAY`` for takes recorded over
+      midnight.
+    """
+    assert source in ("tc", "ms"), "Unknown timecode source: %s" % source
+    if source == "tc":
+        secs = tc_to_seconds(mvn.extract_normalframe_attrib("tc"), tc_fps)
+        return np.unwrap(secs, period=SECS_PER_DAY)
+    import pytz  # imported here, since only this source needs it
+    ms = np.array(mvn.extract_normalframe_attrib("ms"), dtype=np.int64)
+    first = datetime.datetime.fromtimestamp(ms[0] / 1000.0,
+                                            tz=pytz.timezone(timezone))
+    first_secs = (ms[0] / 1000.0 +
+                  first.utcoffset().total_seconds()) % SECS_PER_DAY
+    return first_secs + (ms - ms[0]) / 1000.0
+
+
+# #############################################################################
+# ## SYNCH
+# #############################################################################
+
+def timecode_synch(frame_indexes, frame_secs, time_reference, samplerate):
+    """
+    :param frame_indexes: The ``index`` of each normal frame.
+    :param frame_secs: The seconds since midnight of each normal frame.
+    :param int time_reference: Seconds since midnight of the first audio
+      sample, times the samplerate (see ``read_bwf_info``).
+    :returns: A tuple ``(stretch, shift, residual_ms)`` with the least
+      squares line through the ``(index, sample)`` pairs, and the max.
+      deviation of a frame from it in milliseconds.
+    """
+    y = np.asarray(frame_secs, dtype=np.float64) * samplerate - time_reference
+    # the audio may have started on the day before (or after) the mocap
+    day = SECS_PER_DAY * samplerate
+    y -= np.round(y[0] / day) * day
+    stretch, shift, residual = _fit_line(frame_indexes, y)
+    return stretch, shift, residual * 1000 / samplerate
+
+
+def _fit_line(x, y):
+    """
+    :returns: A tuple ``(slope, intercept, residual)`` with the least squares
+      line through the given points and the max. absolute deviation from it.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # center the data for a well-conditioned fit
+    x0, y0 = x.mean(), y.mean()
+    slope, intercept = np.polyfit(x - x0, y - y0, 1)
+    intercept = y0 + intercept - slope * x0
+    residual = np.abs(y - (x * slope + intercept)).max()
+    return float(slope), float(intercept), float(residual)
+
+
+def timecode_synch_wav(wav_path, mvn, source="tc", tc_fps=None,
+                       timezone=DEFAULT_TIMEZONE):
+    """
+    Synchronizes the given BWF file and Mvn by their timestamps. See
+    ``mvn_seconds_of_day`` for the parameters.
+
+    :returns: The ``(stretch, shift, residual_ms)`` of ``timecode_synch``.
+    """
+    info = read_bwf_info(wav_path)
+    assert info["time_reference"] is not None, \
+        "No bext chunk (not a BWF file?): %s" % wav_path
+    frame_secs = mvn_seconds_of_day(mvn, source, tc_fps, timezone)
+    stretch, shift, residual_ms = timecode_synch(
+        mvn.get_frame_indexes(), frame_secs, info["time_reference"],
+        info["samplerate"])
+    print("[timecode] stretch =", stretch, "shift =", shift,
+          "max. residual (ms) =", residual_ms)
+    return stretch, shift, residual_ms
+
+
+# #############################################################################
+# ## LTC DECODING
+# #############################################################################
+
+def _crossings(x):
+    """
+    :returns: A float64 array with the positions of the zero crossings of
+      ``x``, linearly interpolated between the samples around them.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    positive = x >= 0
+    idxs = np.flatnonzero(positive[1:] != positive[:-1])
+    return idxs + x[idxs] / (x[idxs] - x[idxs + 1])
+
+
+def _bits_from_crossings(crossings, bit_period=None):
+    """
+    Bi-phase mark decoding: every bit starts with a transition, and ones
+    have a further one in the middle. So intervals between transitions are
+    either a whole bit (a zero) or half a bit (two of them make a one).
+
+    :param bit_period: Length of a bit in samples. If None, it is estimated
+      from the intervals.
+    :returns: A tuple ``(bits, starts, bit_period)``, where ``bits`` is a
+      bool array and ``starts`` holds the position of each bit.
+    """
+    d = np.diff(crossings)
+    if len(d) == 0:
+        return np.zeros(0, dtype=bool), np.zeros(0), bit_period
+    if bit_period is None:
+        m = np.median(d)
+        # the median interval is a whole bit, unless most bits are ones
+        doubles = np.mean(np.abs(d - 2 * m) < 0.4 * m)
+        bit_period = 2 * m if doubles > 0.05 else m
+    is_long = d > 0.75 * bit_period
+    # pair up the consecutive halves, starting after each whole bit
+    k = np.arange(len(d))
+    last_long = np.maximum.accumulate(np.where(is_long, k, -1))
+    emit = is_long | ((k - last_long - 1) % 2 == 1)
+    starts = np.where(is_long, k, k - 1)[emit]
+    return ~is_long[emit], crossings[starts], bit_period
+
+
+def _decode_frames(bits, starts, fps=None):
+    """
+    :returns: A tuple ``(samples, timecodes)`` with the position of each LTC
+      frame found in the bit stream (i.e. of its first bit), and an int64
+      array of shape ``(frames, 4)`` with its hours, minutes, seconds and
+      frames. Frames with invalid digits are discarded.
+    """
+    if len(bits) < LTC_FRAME_BITS:
+        return np.zeros(0), np.zeros((0, 4), dtype=np.int64)
+    windows = np.lib.stride_tricks.sliding_window_view(bits, len(LTC_SYNC))
+    syncs = np.flatnonzero((windows == LTC_SYNC).all(axis=1))
+    first_bits = syncs - (LTC_FRAME_BITS - len(LTC_SYNC))
+    first_bits = first_bits[first_bits >= 0]
+    frames = bits[first_bits[:, None] + np.arange(LTC_FRAME_BITS)]
+
+    def bcd(beg, num_bits):
+        return frames[:, beg:beg + num_bits] @ (1 << np.arange(num_bits))
+    units = np.stack([bcd(b, 4) for b in (0, 16, 32, 48)], axis=1)
+    tens = np.stack([bcd(b, n) for b, n in ((8, 2), (24, 3), (40, 3),
+                                            (56, 2))], axis=1)
+    timecodes = tens * 10 + units
+    # order: frames, secs, mins, hours. Reverse to hours first
+    timecodes = timecodes[:, ::-1]
+    max_frames = 40 if fps is None else int(np.ceil(fps))
+    valid = ((units < 10).all(axis=1) &
+             (timecodes < [24, 60, 60, max_frames]).all(axis=1))
+    return starts[first_bits[valid]], timecodes[valid]
+
+
+@profiled("timecode.decode_ltc")
+def decode_ltc(blocks, samplerate, fps=None, channel=0):
+    """
+    Streaming LTC decoder: the zero crossings of each block are found
+    vectorized, and decoded into frames whenever enough of them are
+    buffered. Only the last ``LTC_KEEP_FRAMES`` frames worth of crossings
+    are kept between decodings, so memory is constant.
+
+    :param blocks: Iterable of consecutive audio arrays of shape
+      ``(samples,)`` or ``(samples, channels)``.
+    :param fps: The timecode rate. If None, it is estimated from the bit
+      rate and snapped to ``LTC_RATES``.
+    :param int channel: The channel carrying the LTC.
+    :returns: A tuple ``(samples, timecodes, fps)``, where ``samples`` is a
+      float64 array with the (subsample) position of each decoded LTC frame,
+      and ``timecodes`` an int64 array of shape ``(frames, 4)`` with their
+      ``(hours, mins, secs, frames)``.
+    """
+    crossings = np.zeros(0)
+    prev, offset = None, 0
+    bit_period = None if fps is None else samplerate / (fps * LTC_FRAME_BITS)
+    out_samples, out_tcs = [], []
+    keep = 2 * LTC_FRAME_BITS * LTC_KEEP_FRAMES  # at most 2 crossings/bit
+
+    def flush(crossings, bit_period):
+        bits, starts, bit_period = _bits_from_crossings(crossings, bit_period)
+        samples, tcs = _decode_frames(bits, starts, fps)
+        last = out_samples[-1][-1] if out_samples else -np.inf
+        new = samples > last  # frames of the kept crossings are repeated
+        if new.any():
+            out_samples.append(samples[new])
+            out_tcs.append(tcs[new])
+        return bit_period
+    #
+    for block in blocks:
+        if block.ndim > 1:
+            block = block[:, channel]
+        if prev is None:
+            new = _crossings(block) + offset
+        else:
+            new = _crossings(np.concatenate(([prev], block))) + offset - 1
+        prev, offset = block[-1], offset + len(block)
+        crossings = np.concatenate((crossings, new))
+        if len(crossings) >= 2 * keep:
+            est = flush(crossings, bit_period)
+            if fps is None:  # keep the estimate from a long stretch
+                bit_period = est
+            crossings = crossings[-keep:]
+    bit_period = flush(crossings, bit_period)
+    if fps is None and bit_period is not None:
+        est = samplerate / (bit_period * LTC_FRAME_BITS)
+        fps = min(LTC_RATES, key=lambda r: abs(r - est))
+    if not out_samples:
+        return np.zeros(0), np.zeros((0, 4), dtype=np.int64), fps
+    return np.concatenate(out_samples), np.concatenate(out_tcs), fps
+
+
+def decode_ltc_wav(wav_path, fps=None, channel=0, blocksize=BLOCKSIZE):
+    """
+    Like ``decode_ltc``, but streams the audio from the given file.
+    """
+    samplerate = sf.info(wav_path).samplerate
+    return decode_ltc(sf.blocks(wav_path, blocksize=blocksize), samplerate,
+                      fps, channel)
+
+
+def ltc_synch(frame_indexes, frame_secs, ltc_samples, ltc_timecodes, fps):
+    """
+    :param frame_indexes: The ``index`` of each normal frame.
+    :param frame_secs: The seconds since midnight of each normal frame.
+    :param ltc_samples: Positions of the LTC frames (see ``decode_ltc``).
+    :param ltc_timecodes: The ``(hours, mins, secs, frames)`` of each LTC
+      frame.
+    :param fps: The timecode rate.
+    :returns: A tuple ``(stretch, shift, residual)``, where the residual is
+      the max. deviation of an LTC frame from the fitted line, in samples.
+      LTC frames more than half a timecode frame away from the first fit
+      are discarded as misdecoded.
+    """
+    assert len(ltc_samples) >= 2, "Less than 2 LTC frames decoded!"
+    tcs = np.asarray(ltc_timecodes, dtype=np.float64)
+    ltc_secs = tcs[:, :3] @ [3600, 60, 1] + tcs[:, 3] / np.round(fps)
+    ltc_secs = np.unwrap(ltc_secs, period=SECS_PER_DAY)
+    # samples per second of timecode, robust to misdecoded frames
+    slope, intercept, _ = _fit_line(ltc_secs, ltc_samples)
+    res = ltc_samples - (ltc_secs * slope + intercept)
+    good = np.abs(res - np.median(res)) < slope / fps / 2
+    slope, intercept, residual = _fit_line(ltc_secs[good], ltc_samples[good])
+    # the mocap may have started on the day before (or after) the audio
+    frame_secs = np.asarray(frame_secs, dtype=np.float64)
+    frame_secs = frame_secs - np.round(
+        (frame_secs[0] - ltc_secs[0]) / SECS_PER_DAY) * SECS_PER_DAY
+    stretch, shift, _ = _fit_line(frame_indexes,
+                                  frame_secs * slope + intercept)
+    return stretch, shift, residual
+
+
+def ltc_synch_wav(wav_path, mvn, fps=None, channel=0, tc_fps=None):
+    """
+    Synchronizes the given Mvn with the LTC track of the given audio file,
+    via the MVN ``tc`` attributes.
+
+    :param fps: The LTC rate, see ``decode_ltc``.
+    :param tc_fps: The MVN timecode rate, see ``tc_to_seconds``.
+    :returns: The ``(stretch, shift, residual_ms)`` of ``ltc_synch``, with
+      the residual in milliseconds.
+    """
+    samplerate = sf.info(wav_path).samplerate
+    samples, timecodes, fps = decode_ltc_wav(wav_path, fps, channel)
+    print("[timecode] decoded", len(samples), "LTC frames at", fps, "fps")
+    frame_secs = mvn_seconds_of_day(mvn, "tc", tc_fps)
+    stretch, shift, residual = ltc_synch(mvn.get_frame_indexes(), frame_secs,
+                                         samples, timecodes, fps)
+    residual_ms = residual * 1000 / samplerate
+    print("[timecode] stretch =", stretch, "shift =", shift,
+          "max. LTC residual (ms) =", residual_ms)
+    return stretch, shift, residual_ms
@@ -5,11 +5,14 @@
 """
 
 import os
+import math
+import time
 import datetime
-import pytz
+from collections import OrderedDict, deque
 import numpy as np
 #
 from . import __path__ as PACKAGE_ROOT_PATH  # path of the __init__ file
+from .profiling import profiled
 
 
 __author__ = "Andres FR"
@@ -42,41 +45,61 @@ def make_timestamp(timezone="Europe/Berlin"):
     Output example: day, month, year, hour, min, sec, milisecs:
     10_Feb_2018_20:10:16.151
     """
+    import pytz  # imported here, since most entry points don't need it
     ts = datetime.datetime.now(tz=pytz.timezone(timezone)).strftime(
         "%d_%b_%Y_%H:%M:%S.%f")[:-3]
     return "%s (%s)" % (ts, timezone)
 
 
+def _format_timedelta(days, hours, mins, secs, microsecs):
+    """
+    Formats non-negative time fields like ``str(datetime.timedelta)`` does,
+    i.e. as "{X days, }h:mm:ss{.microseconds}".
+    """
+    ts = "%d:%02d:%02d" % (hours, mins, secs)
+    if days:
+        ts = "%d day%s, " % (days, "" if days == 1 else "s") + ts
+    if microsecs:
+        ts += ".%06d" % microsecs
+    return ts
+
+
 class Timedelta(object):
     """
+    Converts a sample number into the elapsed time since sample 0, given the
+    samplerate. For negative sample numbers, the time is computed for the
+    positive value and then the sign is flipped, so the result is symmetric
+    around zero. For many sample numbers at once, see ``timedelta_arrays``.
     """
+    __slots__ = ("_sample_nr", "_samplerate", "_total_seconds", "_days",
+                 "_hours", "_mins", "_secs", "_microsecs")
+
     def __init__(self, sample_nr, samplerate):
         """
         :param number sample_nr: Current sample number
         :param number samplerate: No. of samples per second (must be positive)
         """
         assert samplerate >= 0, "Only non-negative samplerate allowed!"
-        self._is_negative = sample_nr < 0
         self._sample_nr = sample_nr
         self._samplerate = samplerate
         self._total_seconds = float(sample_nr) / samplerate
         # NOTE: to enforce symmetry around zero, compute for positive value
-        # and then flip the sign
-        td = datetime.timedelta(seconds=abs(self._total_seconds))
-        d = td.days
-        h = td.seconds // 3600
-        m = (td.seconds // 60) % 60
-        s = int(td.seconds % 60)
-        mms = td.microseconds
-        td_str = str(td)
-        #
-        self._days = -d if self._is_negative else d
-        self._hours = -h if self._is_negative else h
-        self._mins = -m if self._is_negative else m
-        self._secs = -s if self._is_negative else s
-        self._microsecs = -mms if self._is_negative else mms
-        #
-        self._timestamp = "-" + td_str if self._is_negative else td_str
+        # and then flip the sign. Rounding to microseconds is done like in
+        # datetime.timedelta: the fraction of second is rounded half to even
+        abs_secs = abs(self._total_seconds)
+        whole = math.floor(abs_secs)
+        mms = round((abs_secs - whole) * 1e6)
+        if mms >= 1000000:
+            whole, mms = whole + 1, mms - 1000000
+        d, rem = divmod(whole, 86400)
+        h, rem = divmod(rem, 3600)
+        m, s = divmod(rem, 60)
+        sign = -1 if sample_nr < 0 else 1
+        self._days = sign * d
+        self._hours = sign * h
+        self._mins = sign * m
+        self._secs = sign * s
+        self._microsecs = sign * mms
 
     # "read-only" attributes:
     @property
@@ -121,7 +144,44 @@ class Timedelta(object):
         """
         Returns a string in the form "{X days} h:m:s.microseconds"
         """
-        return self._timestamp
+        ts = _format_timedelta(*[abs(x) for x in self.as_tuple()])
+        return "-" + ts if self._sample_nr < 0 else ts
+
+
+def timedelta_arrays(sample_nrs, samplerate):
+    """
+    Vectorized counterpart of ``Timedelta``, for many sample numbers at once.
+
+    :param sample_nrs: A 1D array of sample numbers.
+    :param number samplerate: No. of samples per second (must be positive)
+    :returns: The tuple ``(days, hours, mins, secs, microsecs, timestamps)``,
+      where the first 5 entries are int64 arrays with the same values as
+      ``Timedelta.as_tuple`` (i.e. symmetric around zero), and ``timestamps``
+      is a list with the same strings as ``str(Timedelta)``.
+    """
+    assert samplerate >= 0, "Only non-negative samplerate allowed!"
+    sample_nrs = np.asarray(sample_nrs, dtype=np.float64)
+    is_neg = sample_nrs < 0
+    abs_secs = np.abs(sample_nrs / float(samplerate))
+    whole = np.floor(abs_secs)
+    mms = np.round((abs_secs - whole) * 1e6)
+    carry = mms >= 1e6
+    whole[carry] += 1
+    mms[carry] -= 1e6
+    days, rem = np.divmod(whole.astype(np.int64), 86400)
+    hours, rem = np.divmod(rem, 3600)
+    mins, secs = np.divmod(rem, 60)
+    mms = mms.astype(np.int64)
+    #
+    timestamps = [
+        "-" + _format_timedelta(d, h, m, s, u) if neg else
+        _format_timedelta(d, h, m, s, u)
+        for neg, d, h, m, s, u in zip(is_neg.tolist(), days.tolist(),
+                                      hours.tolist(), mins.tolist(),
+                                      secs.tolist(), mms.tolist())]
+    sign = np.where(is_neg, -1, 1)
+    return (sign * days, sign * hours, sign * mins, sign * secs, sign * mms,
+            timestamps)
 
 
 # #############################################################################
@@ -160,12 +220,130 @@ def convert_anchors(ori1, dest1, ori2, dest2):
     shift = d1 - stretch * o1
     return stretch, shift
 
+
+def synch_to_anchors(stretch, shift, ori1, ori2):
+    """
+    Inverse of ``convert_anchors``: given a stretch and shift, returns the
+    anchors ``(ori1, dest1, ori2, dest2)`` for the given origins, with the
+    destinations rounded to the nearest integer (e.g. an audio sample).
+    """
+    dest1 = int(round(ori1 * stretch + shift))
+    dest2 = int(round(ori2 * stretch + shift))
+    return ori1, dest1, ori2, dest2
+
+
+def split_anchors(anchors):
+    """
+    :param anchors: The numbers ``ori1, dest1, ori2, dest2, ...`` of at least
+      2 anchor pairs.
+    :returns: A tuple ``(oris, dests)`` of lists, sorted by ``ori``.
+    """
+    assert len(anchors) >= 4 and len(anchors) % 2 == 0, \
+        "Expected at least 2 pairs of ori, dest anchor numbers!"
+    pairs = sorted(zip(anchors[0::2], anchors[1::2]))
+    oris, dests = [list(x) for x in zip(*pairs)]
+    assert all(o1 < o2 for o1, o2 in zip(oris, oris[1:])), \
+        "Ori anchors must be distinct!"
+    assert all(d1 < d2 for d1, d2 in zip(dests, dests[1:])), \
+        "Dest anchors must increase with the ori anchors!"
+    return oris, dests
+
+
+def piecewise_linear_map(x, oris, dests):
+    """
+    Generalization of ``convert_anchors`` to N anchors: maps ``x`` by linear
+    interpolation between consecutive ``(ori, dest)`` anchors. Values
+    outside of the anchors are extrapolated with the first (resp. last)
+    segment, so 2 anchors yield the same affine map as ``convert_anchors``.
+
+    :param x: A real-valued array (e.g. frame indexes)
+    :param oris: At least 2 distinct real-valued numbers. Same length as
+      ``dests``. They don't need to be sorted.
+    :returns: A float64 array with the mapped values of ``x``.
+    """
+    oris = np.asarray(oris, dtype=np.float64)
+    dests = np.asarray(dests, dtype=np.float64)
+    assert len(oris) == len(dests) >= 2, "Expected at least 2 anchor pairs!"
+    order = np.argsort(oris, kind="stable")
+    oris, dests = oris[order], dests[order]
+    assert (np.diff(oris) > 0).all(), "Repeated ori anchors!"
+    assert (np.diff(dests) > 0).all(), "Dest anchors must increase with ori!"
+    x = np.asarray(x, dtype=np.float64)
+    result = np.interp(x, oris, dests)
+    # np.interp clips at the ends: extrapolate with the outer segments
+    for mask, i, j in ((x < oris[0], 0, 1), (x > oris[-1], -2, -1)):
+        slope = (dests[j] - dests[i]) / (oris[j] - oris[i])
+        result[mask] = dests[i] + (x[mask] - oris[i]) * slope
+    return result
+
+
 # #############################################################################
 # ## MATPLOTLIB-RELATED
 # #############################################################################
 
+def _number_strings(vals, float_form):
+    """
+    :param vals: A 1D float array
+    :param str float_form: The format for non-integer values, e.g. "{:.3f}"
+    :returns: A list with ``str(int(v))`` for the integer entries of ``vals``
+      and ``float_form.format(v)`` for the rest.
+    """
+    is_int = np.equal(np.mod(vals, 1), 0)
+    return [str(int(v)) if i else float_form.format(v)
+            for v, i in zip(vals.tolist(), is_int.tolist())]
+
 
-class IdentityFormatter(object):
+class MemoizedTickFormatter(object):
+    """
+    Base class for the tick label formatters in this module. They can be
+    passed to ``plt.FuncFormatter``, since they fulfill the interface
+    (val, pos)->str. They also provide ``format_ticks(vals)->[str]``, which
+    matplotlib uses to label all ticks of a redraw at once (see
+    ``plotters.ArrayFuncFormatter``): the labels that aren't in a small memo
+    of recent ones are computed together in a single vectorized pass by
+    ``format_array(vals)->[str]``, which the subclasses implement: it gets a
+    1D float64 array with the axis values and returns one label per entry.
+    """
+
+    MEMO_SIZE = 256
+
+    def __init__(self):
+        """
+        """
+        self._memo = OrderedDict()
+
+    @profiled("utils.format_ticks")
+    def format_ticks(self, vals):
+        """
+        :param vals: A collection of axis values where the ticks go
+        :returns: A list of strings, one label per entry in ``vals``.
+        """
+        vals = [float(v) for v in vals]
+        memo = self._memo
+        missing = list({v for v in vals if v not in memo})
+        if missing:
+            memo.update(zip(missing,
+                            self.format_array(np.array(missing,
+                                                       dtype=np.float64))))
+        result = []
+        for v in vals:
+            memo.move_to_end(v)
+            result.append(memo[v])
+        while len(memo) > self.MEMO_SIZE:
+            memo.popitem(last=False)
+        return result
+
+    def __call__(self, val, pos=None):
+        """
+        :param number val: the axis value where the tick goes
+        :param int pos: from 0 (left margin) to num_ticks+2 (right
+          margin)
+        :returns: The label for ``val``
+        """
+        return self.format_ticks([val])[0]
+
+
+class IdentityFormatter(MemoizedTickFormatter):
     """
     This functor can be passed to ``plt.FuncFormatter`` to generate
     custom tick labels. It fulfills the interface (val, pos)->str.
@@ -175,57 +353,62 @@ class IdentityFormatter(object):
     behave ALWAYS like this and avoid some other smart conversions like
     scientific notation for big numbers.
     """
-    def __call__(self, val, pos):
+    def format_array(self, vals):
         """
-        :param number val: the axis value where the tick goes
-        :param int pos: from 0 (left margin) to num_ticks+2 (right
-          margin)
-        :returns: ``str(val)``
+        :returns: ``[str(v) for v in vals]``
         """
-        return str(val)
+        return [str(v) for v in vals.tolist()]
 
 
-class SynchedMvnFormatter(object):
+class SynchedMvnFormatter(MemoizedTickFormatter):
     """
     This functor can be passed to ``plt.FuncFormatter`` to generate
     custom tick labels. It fulfills the interface (val, pos)->str.
 
-    Specifically, it looks in the MVN file for the frame index with the
-    given ``val`` and, if found, returns the string ``val [frame_idx]``
-    (otherwise just val). For that, it expects that the frame has defined the
-    ``audio_sample`` attribute.
+    Specifically, it looks in the MVN file for the normal frame whose
+    ``audio_sample`` is nearest to the given ``val`` and, if ``val`` is within
+    the range of the frames, returns the string ``val [frame_idx]``
+    (otherwise just val). For that, it expects that the frames have defined
+    the ``audio_sample`` attribute.
     """
     def __init__(self, mvn, num_decimals=3):
         """
         :param int num_decimals: number of decimals to show for each number
         :param Mvn mvn: expected to be the Mvn instance used in the plot.
         """
+        super().__init__()
         self.float_form = "{:.%df}" % num_decimals
         self.mvn = mvn
         #
-        normal_frames = [f for f in mvn.mvn.subject.frames.getchildren()
-                         if f.attrib["type"] == "normal"]
-        self.mapping = {float(f.attrib["audio_sample"]): i
-                        for i, f in enumerate(normal_frames)}
+        audio_samples = np.int64(mvn.get_audio_synch())
+        self._frame_order = np.argsort(audio_samples, kind="stable")
+        self._sorted_samples = audio_samples[self._frame_order]
+
+    def nearest_frames(self, vals):
+        """
+        :param vals: A 1D float array with audio sample positions
+        :returns: An int64 array with the (0-based) position of the normal
+          frame nearest to each of ``vals``, or -1 if ``vals`` is outside of
+          the range covered by the frames.
+        """
+        srt = self._sorted_samples
+        right = np.clip(srt.searchsorted(vals), 0, len(srt) - 1)
+        left = np.clip(right - 1, 0, len(srt) - 1)
+        pick_left = np.abs(vals - srt[left]) <= np.abs(srt[right] - vals)
+        result = self._frame_order[np.where(pick_left, left, right)]
+        result[(vals < srt[0]) | (vals > srt[-1])] = -1
+        return result
 
-    def __call__(self, val, pos):
+    def format_array(self, vals):
         """
-        :param number val: the axis value where the tick goes
-        :param int pos: from 0 (left margin) to num_ticks+2 (right
-          margin)
-        :returns: ``str(val)``
+        :returns: A list of strings in the form ``val [frame_idx]``
         """
-        result = (str(int(val)) if val.is_integer() else
-                  self.float_form.format(val))
-        try:
-            frame_str = " [" + str(self.mapping[float(val)]) + "]"
-            result += frame_str
-        except KeyError:
-            pass
-        return result
+        return [s if f < 0 else s + " [" + str(f) + "]"
+                for s, f in zip(_number_strings(vals, self.float_form),
+                                self.nearest_frames(vals).tolist())]
 
 
-class ProportionalFormatter(object):
+class ProportionalFormatter(MemoizedTickFormatter):
     """
     This functor can be passed to ``plt.FuncFormatter`` to generate
     custom tick labels. It fulfills the interface (val, pos)->str.
@@ -242,25 +425,20 @@ class ProportionalFormatter(object):
         :param number ratio: A number so that val2 = val * ratio
         """
         assert 0 <= num_decimals <= 6, "num_decimals must be in [0, ..., 6]!"
+        super().__init__()
         self.ratio = ratio
         self.float_form = "{:.%df}" % num_decimals
 
-    def __call__(self, val, pos):
+    def format_array(self, vals):
         """
-        :param number val: the axis value where the tick goes
-        :param int pos: from 0 (left margin) to num_ticks+2 (right
-          margin)
-        :returns: A string in the form "val [val2]"
+        :returns: A list of strings in the form "val [val2]"
         """
-        val_str = (str(int(val)) if val.is_integer() else
-                   self.float_form.format(val))
-        val2 = val * self.ratio
-        val2_str = (str(int(val2)) if val2.is_integer() else
-                    self.float_form.format(val2))
-        return val_str + " [" + val2_str + "]"
+        return [s + " [" + s2 + "]" for s, s2 in zip(
+            _number_strings(vals, self.float_form),
+            _number_strings(vals * self.ratio, self.float_form))]
 
 
-class SampleToTimestampFormatter(object):
+class SampleToTimestampFormatter(MemoizedTickFormatter):
     """
     This functor can be passed to ``plt.FuncFormatter`` to generate
     custom tick labels. It fulfills the interface (val, pos)->str.
@@ -280,27 +458,24 @@ class SampleToTimestampFormatter(object):
         :param number samplerate: A number so that seconds = val / samplerate
         """
         assert 0 <= num_decimals <= 6, "num_decimals must be in [0, ..., 6]!"
+        super().__init__()
         self.num_decimals = num_decimals
         self._n_remove = 6 - num_decimals
         self.show_idx = show_idx
         self.samplerate = samplerate
 
-    def __call__(self, val, pos):
+    def format_array(self, vals):
         """
-        :param number val: the axis value where the tick goes
-        :param int pos: from 0 (left margin) to num_ticks+2 (right
-          margin)
-        :returns: A string in the form "{X days} h:m:s.ms"
+        :returns: A list of strings in the form "{X days} h:m:s.ms"
         """
-        ts = Timedelta(val, self.samplerate)
-        ts_str = str(ts)
-        if ts.microsecs > 0:
-            ts_str = ts_str[: - self._n_remove]
+        *_, microsecs, timestamps = timedelta_arrays(vals, self.samplerate)
+        if self._n_remove > 0:
+            timestamps = [ts[: - self._n_remove] if mms > 0 else ts
+                          for ts, mms in zip(timestamps, microsecs.tolist())]
         if self.show_idx:
-            if isinstance(val, float) and val.is_integer():
-                val = int(val)
-            ts_str = str(val) + " (" + ts_str + ")"
-        return ts_str
+            timestamps = [idx + " (" + ts + ")" for idx, ts in zip(
+                _number_strings(vals, "{}"), timestamps)]
+        return timestamps
 
 
 class DownsamplableFunction(object):
@@ -348,6 +523,7 @@ class DownsamplableFunction(object):
     def __len__(self):
         return self._len_y
 
+    @profiled("utils.downsampled")
     def downsampled(self, xstart, xend, verbose=False):
         """
         This function performs downsampling by reading one sample every
@@ -369,6 +545,44 @@ class DownsamplableFunction(object):
         return x_down, y_down
 
 
+class RollingLatencies(object):
+    """
+    Keeps the last ``window`` durations (in seconds) recorded under each key,
+    e.g. ``"draw"``, to report rolling percentiles of interactive latencies.
+    """
+
+    def __init__(self, window=100):
+        """
+        """
+        assert window > 0, "window must be positive!"
+        self.window = window
+        self.durations = OrderedDict()
+
+    def add(self, key, secs):
+        """
+        """
+        try:
+            self.durations[key].append(secs)
+        except KeyError:
+            self.durations[key] = deque([secs], maxlen=self.window)
+
+    def percentiles(self, key, qs=(50, 95)):
+        """
+        :returns: A list with the given percentiles of the durations under
+          ``key``, in seconds, or None if nothing was recorded for it.
+        """
+        durations = self.durations.get(key, None)
+        if not durations:
+            return None
+        return np.percentile(np.fromiter(durations, np.float64,
+                                         len(durations)), qs).tolist()
+
+    def clear(self):
+        """
+        """
+        self.durations.clear()
+
+
 class XlimCallbackFunctor(object):
     """
     Encapsulates the downsampling callback functionality to prevent side
@@ -377,6 +591,15 @@ class XlimCallbackFunctor(object):
 
       ``ax.callbacks.connect('xlim_changed',
                        DownsamplingCallbackFunctor(ax, [line1..], [arr1...]))``
+
+    If the lines are displayed through an affine ``x -> x * stretch + shift``
+    transform (e.g. to preview a synchronization), set the ``stretch_shift``
+    attribute to the ``(stretch, shift)`` tuple: the axis limits will be then
+    mapped back into the coordinates of the arrays before downsampling.
+
+    If the ``latencies`` attribute is set to a ``RollingLatencies``, the
+    duration of each call (without the deferred redraw) is added to it as
+    ``"callback"``, and the one of each downsampling as ``"downsample"``.
     """
 
     def __init__(self, axis, lines, arrays, shared_axes, verbose=False):
@@ -388,6 +611,8 @@ class XlimCallbackFunctor(object):
         self.arrays = arrays
         self.shared_axes = shared_axes
         self.verbose = verbose
+        self.stretch_shift = None
+        self.latencies = None
 
     @staticmethod
     def _update_xlims(ax, xmin, xmax):
@@ -400,16 +625,32 @@ class XlimCallbackFunctor(object):
         ax.viewLim.x0 = xmin
         ax.viewLim.x1 = xmax
 
+    @profiled("utils.xlim_callback")
     def __call__(self, ax_limits):
         """
         See also::
         https://matplotlib.org/3.1.0/gallery/event_handling/resample.html
         """
+        latencies = self.latencies
+        if latencies is not None:
+            t0 = time.perf_counter()
         lims = ax_limits.viewLim
         xstart, xend = lims.intervalx
         self._update_xlims(self.ax, xstart, xend)
+        if self.stretch_shift is not None:
+            stretch, shift = self.stretch_shift
+            xstart, xend = sorted(((xstart - shift) / stretch,
+                                   (xend - shift) / stretch))
         for l, a in zip(self.lines, self.arrays):
-            l.set_data(*a.downsampled(xstart, xend, self.verbose))
+            if latencies is None:
+                l.set_data(*a.downsampled(xstart, xend, self.verbose))
+                continue
+            t1 = time.perf_counter()
+            xy = a.downsampled(xstart, xend, self.verbose)
+            latencies.add("downsample", time.perf_counter() - t1)
+            l.set_data(*xy)
+        if latencies is not None:
+            latencies.add("callback", time.perf_counter() - t0)
         self.ax.figure.canvas.draw_idle()
 
 
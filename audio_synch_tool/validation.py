@@ -0,0 +1,327 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+This module contains a fast structural validation of MVNX trees, that checks
+what the decoders of ``Mvn`` rely on, which the XSD schema doesn't (it only
+requires the vectors to be non-empty strings):
+
+* The ``segmentCount``, ``sensorCount`` and ``jointCount`` of the frames
+  match the subject and its lists of segments, sensors and joints
+* The config frames come before the normal frames, whose ``index`` are
+  strictly increasing integers
+* All normal frames have the same vector fields as the first one, and every
+  vector has the length given by the counts (see ``vector_dims``)
+
+Instead of visiting the elements from Python, the counting and ordering
+checks are XPath expressions evaluated by libxml2, the vector texts are
+fetched with a single XPath query, and their lengths are compared at once
+with NumPy. Only if an inconsistency is found, the frames are visited to
+report the first offending one. The validation runs on the tree already
+parsed by ``Mvn`` instead of streaming the file, since streaming would parse
+it a second time::
+
+  validate_structure(Mvn("take.mvnx").mvn)  # raises MvnxStructureError
+
+The full XSD validation is still available as strict mode (see
+``Mvn.validate``).
+"""
+
+
+import numpy as np
+from lxml import etree
+#
+from .profiling import profiled
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+STRICT = "strict"  # validation mode that also runs the XSD (see Mvn)
+# (count attribute, multiplier) of the normal frame vectors, see mvn module
+VECTOR_DIMS = {"orientation": ("segmentCount", 4),
+               "position": ("segmentCount", 3),
+               "velocity": ("segmentCount", 3),
+               "acceleration": ("segmentCount", 3),
+               "angularVelocity": ("segmentCount", 3),
+               "angularAcceleration": ("segmentCount", 3),
+               "footContacts": ("footContactCount", 1),
+               "sensorFreeAcceleration": ("sensorCount", 3),
+               "sensorMagneticField": ("sensorCount", 3),
+               "sensorOrientation": ("sensorCount", 4),
+               "jointAngle": ("jointCount", 3),
+               "jointAngleXZY": ("jointCount", 3),
+               "jointAngleErgo": ("ergoJointCount", 3),
+               "centerOfMass": ("one", 3)}
+CONFIG_FIELDS = ["orientation", "position"]  # checked in config frames
+# lists in the subject whose length is given by a count
+SUBJECT_LISTS = {"segments": "segmentCount", "sensors": "sensorCount",
+                 "joints": "jointCount",
+                 "ergonomicJointAngles": "ergoJointCount",
+                 "footContactDefinition": "footContactCount"}
+DEFAULT_COUNTS = {"ergoJointCount": 4, "footContactCount": 4, "one": 1}
+OTHER_WHITESPACE = "\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f"  # ASCII, besides " "
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+class MvnxStructureError(ValueError):
+    """
+    Raised if an MVNX doesn't have the structure expected by ``Mvn``.
+    """
+    pass
+
+
+def _localname(el):
+    """
+    """
+    return etree.QName(el).localname
+
+
+def vector_dims(counts):
+    """
+    :param dict counts: The ``segmentCount``, ``sensorCount`` and
+      ``jointCount`` and optionally ``ergoJointCount`` and
+      ``footContactCount`` (4 by default).
+    :returns: A dict with the expected length of each vector field of the
+      normal frames.
+    """
+    counts = dict(DEFAULT_COUNTS, **counts)
+    return {k: counts[c] * mult for k, (c, mult) in VECTOR_DIMS.items()}
+
+
+def vector_lengths(texts):
+    """
+    :returns: An int64 array with the number of whitespace-separated numbers
+      of each given text. Spaces are counted fast, assuming single spaces as
+      written by MVN. Texts with other whitespace are split exactly, so the
+      result is never too low, but may be too high for texts with repeated,
+      leading or trailing spaces (see ``_check_lengths``).
+    """
+    counts = np.fromiter(map(str.count, texts, [" "] * len(texts)),
+                         dtype=np.int64, count=len(texts)) + 1
+    joined = "".join(texts)
+    if not joined.isascii() or any(c in joined for c in OTHER_WHITESPACE):
+        # the only printable whitespace is the space
+        for i in np.flatnonzero([not t.isprintable() for t in texts]):
+            counts[i] = len(texts[i].split())
+    return counts
+
+
+def _check_lengths(texts, expected, lengths=None):
+    """
+    :param texts: A list of vector texts.
+    :param expected: An int64 array of the same length with their expected
+      lengths, or -1 to skip.
+    :param lengths: Their ``vector_lengths``, if already computed.
+    :returns: The position of the first text with a wrong length, or None.
+      Texts that don't match the fast count are counted again exactly.
+      Since the fast count is never too low, this is exact.
+    """
+    if lengths is None:
+        lengths = vector_lengths(texts)
+    suspects = np.flatnonzero((lengths != expected) & (expected >= 0))
+    for i in suspects.tolist():
+        if len(texts[i].split()) != expected[i]:
+            return i
+    return None
+
+
+# #############################################################################
+# ## VALIDATION
+# #############################################################################
+
+class _StructureValidator(object):
+    """
+    Holds the namespace-aware XPath expressions for a given MVNX root.
+    """
+
+    def __init__(self, root):
+        """
+        """
+        ns = etree.QName(root).namespace
+        self.namespaces = {"m": ns} if ns is not None else {}
+        self.p = "m:" if ns is not None else ""
+
+    def xpath(self, expr, el, **kwargs):
+        """
+        Evaluates the expression on ``el``, where ``{p}`` is replaced by the
+        namespace prefix.
+        """
+        return etree.XPath(expr.format(p=self.p), namespaces=self.namespaces,
+                           **kwargs)(el)
+
+    def child(self, parent, name, required=True):
+        """
+        """
+        result = self.xpath("{p}" + name, parent)
+        if not result and required:
+            raise MvnxStructureError("Missing %s in %s" % (
+                name, _localname(parent)))
+        return result[0] if result else None
+
+    def counts(self, subject, frames):
+        """
+        :returns: A dict with the counts given by the frames, also checking
+          them against the subject and its lists.
+        """
+        counts = {}
+        for name in ("segmentCount", "sensorCount", "jointCount"):
+            try:
+                counts[name] = int(frames.attrib[name])
+            except (KeyError, ValueError):
+                raise MvnxStructureError("Missing or invalid %s in frames"
+                                         % name)
+        if "segmentCount" in subject.attrib and \
+           subject.attrib["segmentCount"] != str(counts["segmentCount"]):
+            raise MvnxStructureError(
+                "segmentCount of subject (%s) and frames (%d) differ" % (
+                    subject.attrib["segmentCount"], counts["segmentCount"]))
+        for list_name, count_name in SUBJECT_LISTS.items():
+            lst = self.child(subject, list_name, required=False)
+            if lst is None:
+                continue
+            num = int(self.xpath("count({p}*)", lst))
+            if count_name not in counts:
+                counts[count_name] = num
+            elif num != counts[count_name]:
+                raise MvnxStructureError("%s has %d elements, but %s is %d" % (
+                    list_name, num, count_name, counts[count_name]))
+        return counts
+
+    def config_frames(self, frames, counts):
+        """
+        Checks that the config frames come first, and their vector lengths.
+        """
+        if self.xpath("count({p}frame[@type='normal'][1]/following-sibling" +
+                      "::{p}frame[@type!='normal'])", frames):
+            raise MvnxStructureError("Config frames after normal frames")
+        dims = vector_dims(counts)
+        for fr in self.xpath("{p}frame[@type!='normal']", frames):
+            for name in CONFIG_FIELDS:
+                el = self.child(fr, name, required=False)
+                if el is not None and \
+                   _check_lengths([el.text or ""],
+                                  np.array([dims[name]])) is not None:
+                    raise MvnxStructureError(
+                        "%s of %s frame should have %d numbers" % (
+                            name, fr.get("type"), dims[name]))
+
+    def normal_frames(self, frames, counts):
+        """
+        Checks the indexes and vectors of the normal frames.
+
+        :returns: The number of normal frames.
+        """
+        indexes = self.xpath("{p}frame[@type='normal']/@index", frames,
+                             smart_strings=False)
+        try:
+            indexes = np.array(indexes, dtype=np.int64)
+        except ValueError:
+            raise MvnxStructureError("Normal frame indexes must be integers")
+        num_frames = len(indexes)
+        if num_frames != self.xpath("count({p}frame[@type='normal'])",
+                                    frames):
+            raise MvnxStructureError("Normal frames without index")
+        if num_frames == 0:
+            return 0
+        bad = np.flatnonzero(np.diff(indexes) <= 0)
+        if len(bad):
+            raise MvnxStructureError(
+                "Normal frame indexes must increase (index %d after %d)" % (
+                    indexes[bad[0] + 1], indexes[bad[0]]))
+        #
+        first = self.xpath("{p}frame[@type='normal'][1]", frames)[0]
+        fields = [_localname(ch)
+                  for ch in first.iterchildren(tag=etree.Element)]
+        dims = vector_dims(counts)
+        expected = np.array([dims.get(f, -1) for f in fields], dtype=np.int64)
+        texts = self.xpath("{p}frame[@type='normal']/*/text()", frames,
+                           smart_strings=False)
+        # missing, extra and empty vectors change the number of texts
+        if len(texts) != num_frames * len(fields):
+            self._locate(frames, fields, expected)
+        lengths = vector_lengths(texts)
+        # fields with unknown length must have the same one in all frames
+        expected = np.tile(np.where(expected < 0, lengths[:len(fields)],
+                                    expected), num_frames)
+        if _check_lengths(texts, expected, lengths) is not None:
+            self._locate(frames, fields, expected[:len(fields)])
+        return num_frames
+
+    def _locate(self, frames, fields, expected):
+        """
+        Slow path: visits the normal frames to raise an error about the
+        first one whose fields or vector lengths are wrong.
+        """
+        for fr in self.xpath("{p}frame[@type='normal']", frames):
+            children = list(fr.iterchildren(tag=etree.Element))
+            names = [_localname(ch) for ch in children]
+            if names != fields:
+                raise MvnxStructureError(
+                    "Normal frame %s has fields %s, expected %s" % (
+                        fr.get("index"), names, fields))
+            for ch, exp in zip(children, expected.tolist()):
+                if exp >= 0 and len((ch.text or "").split()) != exp:
+                    raise MvnxStructureError(
+                        "%s of normal frame %s should have %d numbers" % (
+                            _localname(ch), fr.get("index"), exp))
+        raise MvnxStructureError("Inconsistent normal frames")
+
+
+def entity_counts(root):
+    """
+    :param root: The root element of an MVNX.
+    :returns: A dict with all the counts used by ``vector_dims`` (defaults
+      included), given by the frames and the subject lists of the MVNX.
+    :raises: ``MvnxStructureError`` if they are inconsistent.
+    """
+    v = _StructureValidator(root)
+    subject = v.child(root, "subject")
+    counts = v.counts(subject, v.child(subject, "frames"))
+    return dict(DEFAULT_COUNTS, **counts)
+
+
+@profiled("validation.validate_structure")
+def validate_structure(root):
+    """
+    Validates the structure of the given MVNX tree (see module docstring).
+
+    :param root: The root element of an MVNX, e.g. ``Mvn(...).mvn``.
+    :returns: The number of normal frames.
+    :raises: ``MvnxStructureError`` describing the first problem found.
+    """
+    if _localname(root) != "mvnx":
+        raise MvnxStructureError("Root must be mvnx, not %s" % root.tag)
+    v = _StructureValidator(root)
+    subject = v.child(root, "subject")
+    frames = v.child(subject, "frames")
+    counts = v.counts(subject, frames)
+    v.config_frames(frames, counts)
+    return v.normal_frames(frames, counts)
+
+
+# #############################################################################
+# ## CLI
+# #############################################################################
+
+def add_validation_args(parser, short_flag="-v"):
+    """
+    Adds the validation options to the given ``argparse`` parser. Both are
+    stored as ``validate_mvnx``, to be passed as the ``validate`` argument
+    of ``Mvn``: ``True`` for the structural validation, or ``STRICT`` to
+    also validate against the XSD schema.
+    """
+    parser.add_argument(short_flag, "--validate_mvnx", action="store_const",
+                        const=True, default=False,
+                        help="If given, the MVNX structure is validated")
+    parser.add_argument("--validate_mvnx_strict", dest="validate_mvnx",
+                        action="store_const", const=STRICT,
+                        help="Like --validate_mvnx, plus validation" +
+                        " against our XSD schema")
@@ -0,0 +1,19 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Benchmarks for the hot paths of ``audio_synch_tool``, on synthetic takes of
+several sizes (see ``synthetic`` module). Results are saved as JSON, so they
+can be compared between versions::
+
+  python -m audio_synch_tool_benchmark run -o before.json
+  # ... change the code ...
+  python -m audio_synch_tool_benchmark run -o after.json
+  python -m audio_synch_tool_benchmark compare before.json after.json
+"""
+
+from os.path import dirname, abspath
+
+
+BENCHMARK_DIR = dirname(abspath(__file__))  # this directory
+REPO_DIR = dirname(BENCHMARK_DIR)  # one step higher than BENCHMARK_DIR
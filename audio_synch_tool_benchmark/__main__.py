@@ -0,0 +1,100 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""
+
+Usage example::
+
+  # Benchmark takes of 10s, 1min and 5min, 3 runs each, and save the report
+  python -m audio_synch_tool_benchmark run -s 10 60 300 -r 3 -o new.json
+
+  # Compare the medians with those of a previous report
+  python -m audio_synch_tool_benchmark compare old.json new.json
+"""
+
+import sys
+import json
+import argparse
+#
+from .benchmarks import run_benchmarks, compare_reports, SIZES_SECS, REPEATS
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## SUBCOMMANDS
+# #############################################################################
+
+def run_main(argv):
+    """
+    Generate synthetic takes and benchmark them.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool_benchmark run",
+        description="Benchmark audio_synch_tool on synthetic takes")
+    parser.add_argument("-s", "--sizes_secs", type=float, nargs="+",
+                        default=SIZES_SECS, help="durations of the takes")
+    parser.add_argument("-r", "--repeats", type=int, default=REPEATS)
+    parser.add_argument("-o", "--out_path", type=str, default=None,
+                        help="If given, the report is saved here as JSON")
+    parser.add_argument("-t", "--tmp_dir", type=str, default=None,
+                        help="where to generate the takes (default: /tmp)")
+    parser.add_argument("-f", "--frame_rate", type=int, default=240)
+    parser.add_argument("-a", "--samplerate", type=int, default=48000)
+    parser.add_argument("-g", "--num_segments", type=int, default=23)
+    parser.add_argument("-e", "--num_sensors", type=int, default=17)
+    parser.add_argument("-j", "--num_joints", type=int, default=22)
+    parser.add_argument("-c", "--num_claps", type=int, default=10)
+    args = parser.parse_args(argv)
+    #
+    run_benchmarks(args.sizes_secs, args.repeats, args.out_path,
+                   args.tmp_dir, frame_rate=args.frame_rate,
+                   samplerate=args.samplerate, num_claps=args.num_claps,
+                   num_segments=args.num_segments,
+                   num_sensors=args.num_sensors, num_joints=args.num_joints)
+    return True
+
+
+def compare_main(argv):
+    """
+    Compare two benchmark reports.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m audio_synch_tool_benchmark compare",
+        description="Compare the medians of two benchmark reports")
+    parser.add_argument("old_report", type=str)
+    parser.add_argument("new_report", type=str)
+    args = parser.parse_args(argv)
+    #
+    with open(args.old_report) as f:
+        old_report = json.load(f)
+    with open(args.new_report) as f:
+        new_report = json.load(f)
+    print("benchmark\ttake\told (s)\tnew (s)\tnew/old")
+    for name, take, old, new, ratio in compare_reports(old_report,
+                                                       new_report):
+        print("%s\t%s\t%.4f\t%.4f\t%.2f" % (name, take, old, new, ratio))
+    return True
+
+
+SUBCOMMANDS = {"run": run_main, "compare": compare_main}
+
+
+# #############################################################################
+# ## MAIN ROUTINE
+# #############################################################################
+
+def main():
+    """
+    Dispatches the subcommand given as first CLI argument.
+    """
+    if len(sys.argv) < 2 or sys.argv[1] not in SUBCOMMANDS:
+        print(__doc__)
+        sys.exit(1)
+    success = SUBCOMMANDS[sys.argv[1]](sys.argv[2:])
+    sys.exit(0 if success else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Timings of the hot paths of ``audio_synch_tool`` on synthetic takes (see
+``synthetic`` module). Each benchmark is run ``repeats`` times per take,
+and the wall-clock seconds of every run are recorded together with their
+minimum and median. Output of the library (e.g. progress prints) is
+suppressed while timing.
+"""
+
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import tempfile
+import subprocess
+import contextlib
+#
+import numpy as np
+import soundfile as sf
+#
+from audio_synch_tool.utils import DownsamplableFunction, make_timestamp
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.locators import numpy_find_sublist
+from . import REPO_DIR
+from .synthetic import make_take
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+SIZES_SECS = [10, 60, 300]  # durations of the default takes
+REPEATS = 3
+MAX_DATAPOINTS = 10000  # as in the GUI default
+ZOOM_FRACTIONS = [1.0, 0.1, 0.001]  # visible ranges for downsampled()
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def time_runs(fn, repeats=REPEATS):
+    """
+    :returns: A list with the wall-clock seconds of ``repeats`` calls to
+      ``fn``, whose prints are suppressed.
+    """
+    secs = []
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fn()
+            secs.append(time.perf_counter() - t0)
+    return secs
+
+
+def environment_info():
+    """
+    :returns: A dict describing the environment, so results from different
+      machines or versions aren't compared by mistake.
+    """
+    import matplotlib
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=REPO_DIR,
+                                capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except Exception:
+        commit = None
+    return {"timestamp": make_timestamp(), "git_commit": commit,
+            "python": sys.version.split()[0], "numpy": np.__version__,
+            "matplotlib": matplotlib.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+# #############################################################################
+# ## BENCHMARKS
+# #############################################################################
+
+def benchmark_take(take, tmp_dir, repeats=REPEATS,
+                   max_datapoints=MAX_DATAPOINTS):
+    """
+    Runs all benchmarks on the given take (see ``synthetic.make_take``).
+
+    :returns: A list of result dicts, one per benchmark.
+    """
+    # plotters are imported here, after the backend is set by the caller
+    from audio_synch_tool.plotters import AudioMvnSynchToolEditor
+    from audio_synch_tool.plotters import AudioMvnSynchToolChecker
+    mvnx_path, wav_path = take["mvnx_path"], take["wav_path"]
+    results = []
+
+    def record(name, fn):
+        secs = time_runs(fn, repeats)
+        results.append({"benchmark": name, "take": take["name"],
+                        "num_frames": take["num_frames"],
+                        "num_samples": take["num_samples"], "secs": secs,
+                        "min": min(secs), "median": float(np.median(secs))})
+        print("[benchmark] %s (%s): median %.4f s" % (
+            name, take["name"], results[-1]["median"]))
+    # MVN parsing and extraction
+    record("Mvn.__init__", lambda: Mvn(mvnx_path))
+    mvn = Mvn(mvnx_path)
+    record("Mvn.extract_frames", lambda: Mvn.extract_frames(mvn.mvn))
+    frames_metadata, _, normal_frames = mvn.extract_frame_info()
+    record("Mvn.extract_normalframe_sequences",
+           lambda: mvn.extract_normalframe_sequences(frames_metadata,
+                                                     normal_frames))
+
+    # synch until the XML is written, comparable with eager versions
+    def synch():
+        mvn.set_audio_synch(take["stretch"], take["shift"])
+        mvn.flush_audio_synch()
+    record("Mvn.set_audio_synch", synch)
+    out_path = os.path.join(tmp_dir, take["name"] + "_out.mvnx")
+    record("Mvn.export", lambda: mvn.export(out_path, pretty_print=False))
+    os.remove(out_path)
+    # audio
+    wav_arr, samplerate = sf.read(wav_path)
+    x = np.arange(len(wav_arr), dtype=np.float64)
+    dsf = DownsamplableFunction(wav_arr, max_datapoints, x)
+
+    def downsample():
+        for frac in ZOOM_FRACTIONS:
+            width = frac * len(wav_arr)
+            beg = (len(wav_arr) - width) / 2
+            dsf.downsampled(beg, beg + width)
+    record("DownsamplableFunction.downsampled", downsample)
+    # the middle tenth of the audio, to be found within the whole
+    short = wav_arr[int(len(wav_arr) * 0.45):int(len(wav_arr) * 0.55)]
+    record("numpy_find_sublist", lambda: numpy_find_sublist(short, wav_arr))
+    # plotter constructors
+    record("AudioMvnSynchToolEditor.__init__",
+           lambda: AudioMvnSynchToolEditor(wav_path, mvnx_path,
+                                           max_datapoints=max_datapoints))
+    record("AudioMvnSynchToolChecker.__init__",
+           lambda: AudioMvnSynchToolChecker(wav_arr, samplerate, mvn,
+                                            max_datapoints))
+    return results
+
+
+def run_benchmarks(sizes_secs=SIZES_SECS, repeats=REPEATS, out_path=None,
+                   tmp_dir=None, **take_kwargs):
+    """
+    Generates one synthetic take per size, and benchmarks it.
+
+    :param sizes_secs: Durations of the takes in seconds.
+    :param str out_path: If given, the report is saved here as JSON.
+    :param str tmp_dir: Where the takes are generated. If None, a temporary
+      directory is used and removed afterwards.
+    :param take_kwargs: Further keyword arguments for ``make_take``, like
+      ``num_segments``.
+    :returns: A dict with the ``environment``, the ``takes`` and the
+      ``results``.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    report = {"environment": environment_info(), "takes": [], "results": []}
+    with tempfile.TemporaryDirectory(dir=tmp_dir) as tmp:
+        for secs in sizes_secs:
+            take = make_take(tmp, "take_%gs" % secs, secs, **take_kwargs)
+            report["takes"].append(take)
+            report["results"].extend(benchmark_take(take, tmp, repeats))
+            os.remove(take["mvnx_path"])
+            os.remove(take["wav_path"])
+    for take in report["takes"]:
+        del take["mvnx_path"], take["wav_path"]
+    if out_path is not None:
+        with open(out_path, "w") as f:
+            json.dump(report, f, indent=2)
+        print("[benchmark] saved report to", out_path)
+    return report
+
+
+def compare_reports(old_report, new_report):
+    """
+    :returns: A list of ``(benchmark, take, old_median, new_median, ratio)``
+      tuples for the benchmarks present in both reports, where a ratio
+      above 1 means that the new one is slower.
+    """
+    old = {(r["benchmark"], r["take"]): r["median"]
+           for r in old_report["results"]}
+    result = []
+    for r in new_report["results"]:
+        key = (r["benchmark"], r["take"])
+        if key in old:
+            result.append(key + (old[key], r["median"],
+                                 r["median"] / max(old[key], 1e-12)))
+    return result
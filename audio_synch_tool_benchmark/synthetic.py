@@ -0,0 +1,233 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Generator of synthetic takes: a schema-valid MVNX and a matching WAV, with
+the same slate claps in both (hand acceleration spikes and audio bursts).
+The ground truth synchronization is known, so the generated takes also
+serve to check the accuracy of the automatic synchronization.
+
+Files of any size are written in a streaming fashion. To keep generation
+fast, the per-frame vectors are drawn from a small pool of pre-formatted
+random strings, except for the accelerations at the claps::
+
+  take = make_take("/tmp/takes", "take1", duration_secs=60)
+  mvn = Mvn(take["mvnx_path"], validate="strict")
+"""
+
+
+import os
+#
+import numpy as np
+import soundfile as sf
+#
+from audio_synch_tool.mvn import Mvn
+
+
+__author__ = "Andres FR"
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+SEGMENT_NAMES = ["Pelvis", "L5", "L3", "T12", "T8", "Neck", "Head",
+                 "RightShoulder", "RightUpperArm", "RightForeArm",
+                 "RightHand", "LeftShoulder", "LeftUpperArm", "LeftForeArm",
+                 "LeftHand", "RightUpperLeg", "RightLowerLeg", "RightFoot",
+                 "RightToe", "LeftUpperLeg", "LeftLowerLeg", "LeftFoot",
+                 "LeftToe"]
+HAND_SEGMENTS = ["LeftHand", "RightHand"]
+CONFIG_FRAME_TYPES = ["identity", "tpose", "tpose-isb"]
+START_MS = 1515983008686  # unix timestamp of the first frame
+POOL_SIZE = 32  # pre-formatted random strings per frame field
+CLAP_ACCELERATION = 30.0  # added to the hand accelerations at claps
+CLAP_SECS = 0.02  # length of the audio bursts
+NOISE_STD = 0.01  # background noise of the audio
+BLOCKSIZE = 2 ** 18  # samples per block when writing WAV files
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def segment_names(num_segments):
+    """
+    :returns: A list with the first ``num_segments`` of ``SEGMENT_NAMES``,
+      followed by ``ExtraSegment<N>`` labels if more are needed. Note that
+      the plotters need the arm segments, i.e. at least 15 segments.
+    """
+    extra = ["ExtraSegment%d" % i
+             for i in range(max(0, num_segments - len(SEGMENT_NAMES)))]
+    return (SEGMENT_NAMES + extra)[:num_segments]
+
+
+def frame_fields(num_segments, num_sensors, num_joints):
+    """
+    :returns: A list of ``(name, dimension)`` tuples with the vector fields
+      of a normal frame, in the order expected by the schema.
+    """
+    s, n, j = num_segments, num_sensors, num_joints
+    return [("orientation", 4 * s), ("position", 3 * s),
+            ("velocity", 3 * s), ("acceleration", 3 * s),
+            ("angularVelocity", 3 * s), ("angularAcceleration", 3 * s),
+            ("footContacts", 4), ("sensorFreeAcceleration", 3 * n),
+            ("sensorMagneticField", 3 * n), ("sensorOrientation", 4 * n),
+            ("jointAngle", 3 * j), ("jointAngleXZY", 3 * j),
+            ("jointAngleErgo", 12), ("centerOfMass", 3)]
+
+
+def _vec_str(arr):
+    """
+    """
+    return " ".join(["%.6f" % x for x in arr])
+
+
+# #############################################################################
+# ## GENERATORS
+# #############################################################################
+
+def write_synthetic_mvnx(path, num_frames, frame_rate=240, num_segments=23,
+                         num_sensors=17, num_joints=22, clap_frames=(),
+                         seed=0):
+    """
+    Writes a schema-valid MVNX with 3 config frames and ``num_frames``
+    normal frames, streaming them one by one.
+
+    :param clap_frames: Indexes of the normal frames where the hand
+      accelerations have a spike.
+    """
+    rng = np.random.RandomState(seed)
+    segments = segment_names(num_segments)
+    hand_dims = np.concatenate([np.arange(3) + 3 * segments.index(h)
+                                for h in HAND_SEGMENTS if h in segments]
+                               ).astype(np.int64)
+    fields = frame_fields(num_segments, num_sensors, num_joints)
+    pools = {k: [_vec_str(rng.randn(d)) for _ in range(POOL_SIZE)]
+             for k, d in fields}
+    pools["footContacts"] = [" ".join(str(x) for x in rng.randint(0, 2, 4))
+                             for _ in range(POOL_SIZE)]
+    clap_frames = set(int(c) for c in clap_frames)
+    #
+    with open(path, "w") as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                '<mvnx version="4" xmlns="http://www.xsens.com/mvn/mvnx">\n'
+                '<mvn version="2019.0.0" build="synthetic"/>\n'
+                '<comment>synthetic take</comment>\n')
+        f.write('<subject label="synthetic" torsoColor="#ea6852" '
+                'frameRate="%d" segmentCount="%d" recDate="synthetic" '
+                'originalFilename="synthetic.mvn" configuration="FullBody" '
+                'userScenario="noLevel">\n<comment></comment>\n<segments>\n'
+                % (frame_rate, num_segments))
+        for i, s in enumerate(segments, 1):
+            f.write('<segment label="%s" id="%d"><points><point label="p%s">'
+                    '<pos_b>0 0 0</pos_b></point></points></segment>\n'
+                    % (s, i, s))
+        f.write("</segments>\n<sensors>\n")
+        for i in range(num_sensors):
+            f.write('<sensor label="Sensor%d"/>\n' % i)
+        f.write("</sensors>\n<joints>\n")
+        for i in range(num_joints):
+            f.write('<joint label="Joint%d"><connector1>%s/p</connector1>'
+                    '<connector2>%s/p</connector2></joint>\n'
+                    % (i, segments[0], segments[-1]))
+        f.write('</joints>\n<frames segmentCount="%d" sensorCount="%d" '
+                'jointCount="%d">\n' % (num_segments, num_sensors,
+                                        num_joints))
+        for t in CONFIG_FRAME_TYPES:
+            f.write('<frame time="0" tc="00:00:00:00" ms="%d" type="%s">'
+                    '<orientation>%s</orientation><position>%s</position>'
+                    '</frame>\n' % (START_MS, t, pools["orientation"][0],
+                                    pools["position"][0]))
+        for i in range(num_frames):
+            ms = round(i * 1000 / frame_rate)
+            secs, millis = divmod(START_MS + ms, 1000)
+            tc = "%02d:%02d:%02d:%03d" % (secs // 3600 % 24, secs // 60 % 60,
+                                          secs % 60, millis)
+            f.write('<frame time="%d" index="%d" tc="%s" ms="%d" '
+                    'type="normal">' % (ms, i, tc, START_MS + ms))
+            choices = rng.randint(0, POOL_SIZE, len(fields))
+            for (k, d), c in zip(fields, choices):
+                if k == "acceleration" and i in clap_frames:
+                    accel = rng.randn(d)
+                    accel[hand_dims] += CLAP_ACCELERATION
+                    txt = _vec_str(accel)
+                else:
+                    txt = pools[k][c]
+                f.write("<%s>%s</%s>" % (k, txt, k))
+            f.write("</frame>\n")
+        f.write('</frames>\n</subject>\n<securityCode code="synthetic"/>\n'
+                '</mvnx>\n')
+
+
+def write_synthetic_wav(path, num_samples, samplerate, clap_samples=(),
+                        num_channels=1, seed=0):
+    """
+    Writes a WAV with background noise and a short noise burst starting at
+    each of the given samples, streaming it in blocks.
+    """
+    rng = np.random.RandomState(seed)
+    burst_len = max(1, int(CLAP_SECS * samplerate))
+    decay = np.exp(-np.arange(burst_len) * (5.0 / burst_len))
+    clap_samples = np.sort(np.asarray(clap_samples, dtype=np.int64))
+    with sf.SoundFile(path, "w", samplerate, num_channels,
+                      subtype="PCM_16") as f:
+        for beg in range(0, num_samples, BLOCKSIZE):
+            end = min(beg + BLOCKSIZE, num_samples)
+            block = rng.randn(end - beg, num_channels) * NOISE_STD
+            lo = np.searchsorted(clap_samples, beg - burst_len, "right")
+            hi = np.searchsorted(clap_samples, end, "left")
+            for c in clap_samples[lo:hi]:
+                b0, b1 = max(beg, c), min(end, c + burst_len)
+                burst = rng.randn(b1 - b0, 1) * 0.5
+                block[b0 - beg:b1 - beg] += burst * decay[b0 - c:b1 - c, None]
+            f.write(np.clip(block, -1, 1))
+
+
+def make_take(out_dir, name, duration_secs, frame_rate=240, samplerate=48000,
+              num_claps=10, drift_ppm=100.0, offset_secs=1.0, seed=0,
+              **mvnx_kwargs):
+    """
+    Writes ``<name>.mvnx`` and ``<name>.wav`` into ``out_dir``. The WAV
+    begins ``offset_secs`` before the first frame and ends as much after the
+    last one, and the audio clock runs ``drift_ppm`` faster than nominal.
+
+    :param mvnx_kwargs: Further keyword arguments for
+      ``write_synthetic_mvnx``, like ``num_segments``.
+    :returns: A dict with the paths, the sizes and the ground truth
+      ``stretch``, ``shift`` and ``clap_frames``.
+    """
+    rng = np.random.RandomState(seed)
+    num_frames = int(duration_secs * frame_rate)
+    stretch = samplerate / frame_rate * (1 + drift_ppm * 1e-6)
+    shift = offset_secs * samplerate
+    clap_frames = np.sort(rng.choice(num_frames, min(num_claps, num_frames),
+                                     replace=False))
+    clap_samples = np.rint(clap_frames * stretch + shift).astype(np.int64)
+    num_samples = int(num_frames * stretch + 2 * shift)
+    mvnx_path = os.path.join(out_dir, name + ".mvnx")
+    wav_path = os.path.join(out_dir, name + ".wav")
+    write_synthetic_mvnx(mvnx_path, num_frames, frame_rate,
+                         clap_frames=clap_frames, seed=seed, **mvnx_kwargs)
+    write_synthetic_wav(wav_path, num_samples, samplerate, clap_samples,
+                        seed=seed)
+    return {"name": name, "mvnx_path": mvnx_path, "wav_path": wav_path,
+            "num_frames": num_frames, "num_samples": num_samples,
+            "frame_rate": frame_rate, "samplerate": samplerate,
+            "mvnx_bytes": os.path.getsize(mvnx_path),
+            "wav_bytes": os.path.getsize(wav_path),
+            "stretch": stretch, "shift": shift,
+            "clap_frames": clap_frames.tolist()}
+
+
+def validate_take(take):
+    """
+    :returns: True if the MVNX of the given take (see ``make_take``) is
+      structurally valid and valid according to ``Mvn.MVNX_SCHEMA_PATH``.
+    """
+    try:
+        Mvn(take["mvnx_path"], validate="strict")
+        return True
+    except Exception as e:
+        print("[validate_take]", take["name"], "is invalid:", e)
+        return False
@@ -0,0 +1,107 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the streaming application of anchors. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+from lxml import etree
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.apply import apply_anchors
+from audio_synch_tool_benchmark.synthetic import write_synthetic_mvnx
+from .mvn_test import make_mvnx
+
+
+def tree_items(path):
+    """
+    :returns: A list with the tag, attributes and stripped text of every
+      element of the given XML, except for the ``pythonComment``.
+    """
+    result = []
+    for el in etree.parse(path).getroot().iter():
+        attrib = dict(el.attrib)
+        attrib.pop("pythonComment", None)
+        result.append((el.tag, attrib, (el.text or "").strip()))
+    return result
+
+
+class ApplyAnchorsTest(unittest.TestCase):
+    """
+    Tests that streaming the anchors into an MVNX yields the same result as
+    synching and exporting it with ``Mvn``.
+    """
+    NUM_FRAMES = 50
+
+    def setUp(self):
+        """
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.in_path = os.path.join(self.tmpdir.name, "in.mvnx")
+        write_synthetic_mvnx(self.in_path, self.NUM_FRAMES, num_segments=15,
+                             num_sensors=2, num_joints=2)
+        self.out_path = os.path.join(self.tmpdir.name, "out.mvnx")
+        self.ref_path = os.path.join(self.tmpdir.name, "ref.mvnx")
+
+    def tearDown(self):
+        """
+        """
+        self.tmpdir.cleanup()
+
+    def reference(self, anchors, wav_name=None):
+        """
+        """
+        mvn = Mvn(self.in_path)
+        mvn.set_audio_warp(anchors[0::2], anchors[1::2])
+        if wav_name is not None:
+            mvn.mvn.attrib["wav_file"] = wav_name
+        mvn.export(self.ref_path, pretty_print=False)
+        return tree_items(self.ref_path)
+
+    def test_same_as_mvn(self):
+        """
+        The output is schema-valid and equal to the ``Mvn`` export, for 2
+        and more anchors and any chunk size.
+        """
+        for anchors in ([0, 100, 40, 8000], [0, 100, 20, 4000, 40, 8050.5]):
+            expected = self.reference(anchors, "take.wav")
+            for chunk_frames in (1, 7, 1000):
+                num = apply_anchors(self.in_path, self.out_path, anchors,
+                                    "/some/dir/take.wav", chunk_frames)
+                self.assertEqual(num, self.NUM_FRAMES)
+                self.assertEqual(tree_items(self.out_path), expected)
+        Mvn(self.out_path, validate="strict")
+
+    def test_minimal_mvnx(self):
+        """
+        Works without line breaks or other elements around the frames, and
+        without ``wav_file``.
+        """
+        with open(self.in_path, "w") as f:
+            f.write(make_mvnx(20))
+        anchors = [0, 10, 19, 200]
+        expected = self.reference(anchors)
+        apply_anchors(self.in_path, self.out_path, anchors, chunk_frames=3)
+        self.assertEqual(tree_items(self.out_path), expected)
+
+    def test_errors(self):
+        """
+        Invalid anchors and outputs are rejected, and a failure leaves no
+        output behind.
+        """
+        with self.assertRaises(AssertionError):
+            apply_anchors(self.in_path, self.out_path, [0, 100, 0, 200])
+        with self.assertRaises(AssertionError):
+            apply_anchors(self.in_path, self.in_path, [0, 100, 40, 8000])
+        with open(self.in_path, "rb") as f:
+            data = f.read()
+        with open(self.in_path, "wb") as f:
+            f.write(data[:len(data) // 2])
+        with self.assertRaises(etree.XMLSyntaxError):
+            apply_anchors(self.in_path, self.out_path, [0, 100, 40, 8000],
+                          chunk_frames=1)
+        self.assertFalse(os.path.exists(self.out_path))
@@ -0,0 +1,68 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the autosynch module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import soundfile as sf
+import audio_synch_tool.autosynch as asy
+
+
+class AutosynchTest(unittest.TestCase):
+    """
+    Tests for the automatic synch estimation, on synthetic claps: short noise
+    bursts in the audio and acceleration spikes in the mocap.
+    """
+    SAMPLERATE = 8000
+    FRAME_RATE = 60.0
+    NUM_FRAMES = 6000
+    NUM_CLAPS = 30
+    STRETCH = 8000 / 60.0 * 1.0007
+    SHIFT = 12345.6
+
+    def setUp(self):
+        """
+        Creates the audio and mocap envelope with claps at random frames.
+        """
+        rng = np.random.RandomState(12345)
+        audio_len = int(self.NUM_FRAMES * self.STRETCH + self.SHIFT) + 8000
+        self.audio = rng.randn(audio_len) * 0.01
+        self.mocap = np.abs(rng.randn(self.NUM_FRAMES)) * 0.2
+        for f in rng.randint(10, self.NUM_FRAMES - 10, self.NUM_CLAPS):
+            s = int(round(f * self.STRETCH + self.SHIFT))
+            self.audio[s:s + 400] += rng.randn(400)
+            self.mocap[f] += 5
+
+    def test_streaming_envelope(self):
+        """
+        Streaming the audio from a file must give the same envelope as
+        computing it in memory, regardless of the block boundaries.
+        """
+        env = asy.audio_envelope(self.audio, self.SAMPLERATE, self.FRAME_RATE)
+        self.assertEqual(len(env), int(np.ceil(
+            len(self.audio) * self.FRAME_RATE / self.SAMPLERATE)))
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.wav")
+            sf.write(path, self.audio, self.SAMPLERATE, subtype="DOUBLE")
+            streamed = asy.wav_envelope(path, self.FRAME_RATE, blocksize=999)
+        self.assertTrue(np.allclose(env, streamed))
+
+    def test_estimate(self):
+        """
+        The estimated synch must be within 1 frame along the whole take.
+        """
+        env = asy.audio_envelope(self.audio, self.SAMPLERATE, self.FRAME_RATE)
+        ratio, lag, score = asy.estimate_synch(env, self.mocap)
+        samples_per_frame = self.SAMPLERATE / self.FRAME_RATE
+        stretch, shift = ratio * samples_per_frame, lag * samples_per_frame
+        for f in (0, self.NUM_FRAMES - 1):
+            err = (f * stretch + shift) - (f * self.STRETCH + self.SHIFT)
+            self.assertLess(abs(err), samples_per_frame)
+        self.assertGreater(score, 0.5)
@@ -0,0 +1,162 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the batch module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import json
+import tempfile
+import unittest
+import numpy as np
+import soundfile as sf
+from audio_synch_tool.batch import load_manifest, group_jobs, run_batch, \
+    synch_and_trim
+from audio_synch_tool.locators import xcorr_locate_wav
+from audio_synch_tool.mvn import Mvn
+from .mvn_test import make_mvnx
+
+
+class BatchTest(unittest.TestCase):
+    """
+    Tests for manifest parsing and batch synch-and-trim with resume.
+    """
+
+    def setUp(self):
+        """
+        Writes a longer WAV, 2 shorter WAVs (one missing), a minimal MVNX and
+        a CSV manifest with 3 jobs to a temp dir.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.dir = self.tmpdir.name
+        arr = np.random.RandomState(0).randint(-3000, 3000, 8000)
+        arr = arr.astype(np.int16)
+        sf.write(os.path.join(self.dir, "long.wav"), arr, 8000)
+        sf.write(os.path.join(self.dir, "short1.wav"), arr[1000:3000], 8000)
+        sf.write(os.path.join(self.dir, "short2.wav"), arr[5000:], 8000)
+        with open(os.path.join(self.dir, "take.mvnx"), "w") as f:
+            f.write(make_mvnx(100))
+        self.manifest = os.path.join(self.dir, "manifest.csv")
+        with open(self.manifest, "w") as f:
+            f.write("shorter_wav,longer_wav,mvnx,anchors,out_path\n")
+            f.write("short1.wav,long.wav,take.mvnx,0 0 10 1000,out1.mvnx\n")
+            f.write("short2.wav,long.wav,take.mvnx,0 0 10 1000,out2.mvnx\n")
+            f.write("missing.wav,long.wav,take.mvnx,0 0 10 1000,\n")
+
+    def tearDown(self):
+        """
+        Removes the temp dir.
+        """
+        self.tmpdir.cleanup()
+
+    def test_manifest(self):
+        """
+        Paths are resolved relative to the manifest, anchors parsed and the
+        default out path filled in. All jobs share the longer WAV.
+        """
+        jobs = load_manifest(self.manifest)
+        self.assertEqual(jobs[0]["anchors"], [0, 0, 10, 1000])
+        self.assertEqual(jobs[1]["mvnx"], os.path.join(self.dir, "take.mvnx"))
+        self.assertEqual(jobs[2]["out_path"], os.path.join(
+            self.dir, "take.mvnx_o1d1o2d2=0_0_10_1000"))
+        self.assertEqual(len(group_jobs(jobs)), 1)
+
+    def test_run_and_resume(self):
+        """
+        Found snippets are synched and trimmed, missing ones are reported as
+        failed without affecting the rest. Rerunning only retries failures.
+        """
+        report = run_batch(self.manifest, num_processes=1)
+        self.assertEqual([report[i]["status"] for i in range(3)],
+                         ["ok", "ok", "failed"])
+        self.assertEqual((report[1]["beg"], report[1]["end"]), (5000, 8000))
+        out = Mvn(os.path.join(self.dir, "out1.mvnx"))
+        self.assertEqual(out.get_audio_synch(), list(range(0, 2001, 100)))
+        self.assertEqual(out.mvn.attrib["wav_file"], "short1.wav")
+        #
+        run_batch(self.manifest, num_processes=1)
+        with open(self.manifest + ".report.jsonl") as f:
+            jobs = [json.loads(line)["job"] for line in f]
+        self.assertEqual(sorted(jobs), [0, 1, 2, 2])
+
+    def test_failure_within_group(self):
+        """
+        A job failing while synched doesn't affect the other jobs of its
+        group, whose records are reported. A rerun only retries the failure.
+        """
+        with open(self.manifest, "w") as f:
+            f.write("shorter_wav,longer_wav,mvnx,anchors,out_path\n")
+            f.write("short1.wav,long.wav,take.mvnx,0 0 10 1000,out1.mvnx\n")
+            f.write("short1.wav,long.wav,missing.mvnx,0 0 10 1000,out2.mvnx\n")
+            f.write("short2.wav,long.wav,take.mvnx,0 0 10 1000,out3.mvnx\n")
+        report = run_batch(self.manifest, num_processes=2)
+        self.assertEqual([report[i]["status"] for i in range(3)],
+                         ["ok", "failed", "ok"])
+        self.assertEqual((report[1]["beg"], report[1]["end"]), (1000, 3000))
+        self.assertIn("missing.mvnx", report[1]["error"])
+        out_paths = [os.path.join(self.dir, "out%d.mvnx" % i) for i in (1, 3)]
+        mtimes = [os.path.getmtime(p) for p in out_paths]
+        #
+        report = run_batch(self.manifest, num_processes=2)
+        self.assertEqual(report[1]["status"], "failed")
+        self.assertEqual([os.path.getmtime(p) for p in out_paths], mtimes)
+        with open(self.manifest + ".report.jsonl") as f:
+            jobs = [json.loads(line)["job"] for line in f]
+        self.assertEqual(sorted(jobs), [0, 1, 1, 2])
+
+    def test_resampled_snippet(self):
+        """
+        A snippet at half the samplerate of the longer WAV is located in
+        frames of the longer WAV, and the audio samples of the result refer
+        to the snippet.
+        """
+        noise = np.random.RandomState(1).randn(8000)
+        arr = np.convolve(noise, np.hanning(9), "same") / 10
+        sf.write(os.path.join(self.dir, "long.wav"), arr, 8000)
+        short_path = os.path.join(self.dir, "short.wav")
+        sf.write(short_path, arr[2000:6000:2], 4000)
+        beg, end, confidence = xcorr_locate_wav(
+            short_path, os.path.join(self.dir, "long.wav"))
+        self.assertEqual((beg, end), (2000, 6000))
+        self.assertGreater(confidence, 0.99)
+        out_path = os.path.join(self.dir, "out.mvnx")
+        synch_and_trim(short_path, os.path.join(self.dir, "take.mvnx"),
+                       [0, 0, 10, 1000], beg, end, out_path,
+                       long_samplerate=8000)
+        out = Mvn(out_path)
+        self.assertEqual(out.get_audio_synch(), list(range(0, 2001, 50)))
+        self.assertEqual(out.mvn.attrib["wav_file"], "short.wav")
+        # same in a batch
+        with open(self.manifest, "w") as f:
+            f.write("shorter_wav,longer_wav,mvnx,anchors,out_path\n")
+            f.write("short.wav,long.wav,take.mvnx,0 0 10 1000,batch.mvnx\n")
+        report = run_batch(self.manifest, num_processes=1)
+        self.assertEqual(report[0]["status"], "ok")
+        self.assertEqual(report[0]["rescaled"], 0.5)
+        out = Mvn(os.path.join(self.dir, "batch.mvnx"))
+        self.assertEqual(out.get_audio_synch(), list(range(0, 2001, 50)))
+
+    def test_resume_edited_manifest(self):
+        """
+        Jobs are resumed by their contents, not by their position in the
+        manifest.
+        """
+        run_batch(self.manifest, num_processes=1)
+        out_path = os.path.join(self.dir, "out1.mvnx")
+        mtime = os.path.getmtime(out_path)
+        with open(self.manifest, "w") as f:
+            f.write("shorter_wav,longer_wav,mvnx,anchors,out_path\n")
+            f.write("short2.wav,long.wav,take.mvnx,0 0 10 800,out2.mvnx\n")
+            f.write("short1.wav,long.wav,take.mvnx,0 0 10 1000,out1.mvnx\n")
+        report = run_batch(self.manifest, num_processes=1)
+        self.assertEqual(sorted(report), [0, 1])
+        self.assertEqual(os.path.getmtime(out_path), mtime)
+        with open(self.manifest + ".report.jsonl") as f:
+            records = [json.loads(line) for line in f]
+        self.assertEqual(len(records), 4)
+        self.assertEqual(records[-1]["key"], report[0]["key"])
+        out = Mvn(os.path.join(self.dir, "out2.mvnx"))
+        self.assertEqual(out.get_audio_synch()[:2], [0, 40])
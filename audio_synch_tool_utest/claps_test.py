@@ -0,0 +1,75 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the claps module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import unittest
+import numpy as np
+import audio_synch_tool.claps as cl
+
+
+class ClapsTest(unittest.TestCase):
+    """
+    Tests for the peak detection and matching of clap candidates.
+    """
+    SAMPLERATE = 8000
+    SAMPLES_PER_FRAME = 100.0
+    SHIFT = 5000
+    CLAP_FRAMES = [50, 300, 900]
+
+    def setUp(self):
+        """
+        Audio with noise bursts at the claps, plus a spurious burst.
+        """
+        rng = np.random.RandomState(12345)
+        self.audio = rng.randn(100000) * 0.01
+        for f in self.CLAP_FRAMES + [600]:
+            s = int(f * self.SAMPLES_PER_FRAME + self.SHIFT)
+            self.audio[s:s + 200] += rng.randn(200)
+
+    def test_pick_peaks(self):
+        """
+        Peaks are sorted by strength and at least ``window`` apart.
+        """
+        arr = np.random.RandomState(0).rand(1000)
+        arr[[100, 103, 500, 900]] = [30, 50, 40, 20]
+        positions, strengths = cl.pick_peaks(arr, 10)
+        self.assertEqual(positions.tolist(), [103, 500, 900])
+        self.assertTrue((np.diff(strengths) <= 0).all())
+
+    def test_blockwise_onsets(self):
+        """
+        Onsets must not depend on the block size, and be found within a hop
+        of each burst.
+        """
+        samples, _ = cl.audio_onsets([self.audio], self.SAMPLERATE)
+        blocks = np.split(self.audio, np.arange(1024, len(self.audio), 1024))
+        samples2, _ = cl.audio_onsets(blocks, self.SAMPLERATE)
+        self.assertEqual(samples.tolist(), samples2.tolist())
+        expected = [f * self.SAMPLES_PER_FRAME + self.SHIFT
+                    for f in self.CLAP_FRAMES + [600]]
+        self.assertEqual(len(samples), len(expected))
+        for s in samples:
+            self.assertLess(np.abs(np.array(expected) - s).min(), cl.HOP)
+
+    def test_matching(self):
+        """
+        Consistent pairs must be ranked first, spurious peaks after them.
+        """
+        samples, s_strengths = cl.audio_onsets([self.audio], self.SAMPLERATE)
+        frames = np.array(self.CLAP_FRAMES + [700])
+        f_strengths = np.array([10.0, 10, 10, 20])
+        candidates = cl.match_peaks(frames, f_strengths, samples,
+                                    s_strengths, self.SAMPLES_PER_FRAME,
+                                    tolerance=cl.HOP)
+        self.assertEqual(sorted(f for f, _, _ in candidates[:3]),
+                         self.CLAP_FRAMES)
+        for f, s, score in candidates[:3]:
+            self.assertLess(abs(s - (f * self.SAMPLES_PER_FRAME +
+                                     self.SHIFT)), cl.HOP)
+            self.assertEqual(score, 1.0)
+        self.assertLess(candidates[3][2], 1.0)
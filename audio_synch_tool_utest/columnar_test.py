@@ -0,0 +1,99 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the columnar export of MVNX files. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.columnar import load_columns
+from audio_synch_tool.validation import MvnxStructureError
+from audio_synch_tool_benchmark.synthetic import write_synthetic_mvnx
+from .mvn_test import make_mvnx
+
+
+class ColumnarExportTest(unittest.TestCase):
+    """
+    Tests that the exported arrays hold the same values as the MVNX, and
+    that they are loaded memory-mapped.
+    """
+    NUM_FRAMES = 50
+
+    def setUp(self):
+        """
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.in_path = os.path.join(self.tmpdir.name, "in.mvnx")
+        write_synthetic_mvnx(self.in_path, self.NUM_FRAMES, num_segments=15,
+                             num_sensors=2, num_joints=3)
+        self.out_dir = os.path.join(self.tmpdir.name, "columns")
+
+    def tearDown(self):
+        """
+        """
+        self.tmpdir.cleanup()
+
+    def test_same_as_sequences(self):
+        """
+        Each array equals the corresponding ``extract_normalframe_sequences``
+        output, for any chunk size, and the sidecar has the labels and wav.
+        """
+        mvn = Mvn(self.in_path)
+        mvn.set_audio_warp([0, 20, 40], [100, 4000, 8050])
+        mvn.mvn.attrib["wav_file"] = "take.wav"
+        fm, _, normal_frames = mvn.extract_frame_info()
+        seqs = mvn.extract_normalframe_sequences(fm, normal_frames)
+        for chunk_frames in (1, 7, 1000):
+            mvn.export_columns(self.out_dir, chunk_frames)
+            meta, arrays = load_columns(self.out_dir)
+            self.assertEqual(sorted(arrays), sorted(set(seqs) -
+                                                    {"tc", "type"}))
+            for name, arr in arrays.items():
+                self.assertIsInstance(arr, np.memmap)
+                self.assertEqual(arr.shape[0], self.NUM_FRAMES)
+                expected = np.asarray(seqs[name]).reshape(arr.shape)
+                self.assertTrue(np.array_equal(expected, arr), name)
+        self.assertEqual(arrays["orientation"].shape,
+                         (self.NUM_FRAMES, 15, 4))
+        self.assertEqual(arrays["sensorOrientation"].dtype, np.float32)
+        self.assertEqual(arrays["footContacts"].dtype, np.int8)
+        self.assertEqual(meta["wav_file"], "take.wav")
+        self.assertEqual(meta["num_frames"], self.NUM_FRAMES)
+        self.assertEqual(meta["labels"]["segments"], mvn.extract_segments())
+        self.assertEqual(meta["labels"]["joints"],
+                         ["Joint0", "Joint1", "Joint2"])
+        self.assertEqual(meta["arrays"]["jointAngle"]["entities"], "joints")
+        _, arrays = load_columns(self.out_dir, ["index"], mmap_mode=None)
+        self.assertEqual(list(arrays), ["index"])
+        self.assertNotIsInstance(arrays["index"], np.memmap)
+
+    def test_unsynched(self):
+        """
+        Without audio samples there is no ``audio_sample`` array, and MVNX
+        files with empty frames are exported too.
+        """
+        with open(self.in_path, "w") as f:
+            f.write(make_mvnx(20))
+        meta = Mvn(self.in_path).export_columns(self.out_dir)
+        self.assertEqual(sorted(meta["arrays"]), ["index", "ms", "time"])
+        _, arrays = load_columns(self.out_dir)
+        self.assertEqual(arrays["index"].tolist(), list(range(20)))
+
+    def test_errors(self):
+        """
+        An inconsistent frame fails the export and leaves no files behind.
+        """
+        mvn = Mvn(self.in_path)
+        accel = mvn._normal_frames()[33].acceleration
+        accel._setText(accel.text.rsplit(" ", 1)[0])
+        with self.assertRaises(MvnxStructureError):
+            mvn.export_columns(self.out_dir, chunk_frames=10)
+        self.assertEqual(os.listdir(self.out_dir), [])
+        with self.assertRaises(AssertionError):
+            load_columns(self.out_dir)
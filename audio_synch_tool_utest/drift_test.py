@@ -0,0 +1,97 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the drift module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import unittest
+import numpy as np
+import audio_synch_tool.drift as dr
+from audio_synch_tool.autosynch import audio_envelope
+
+
+class DriftTest(unittest.TestCase):
+    """
+    Tests for the windowed drift estimation, on synthetic claps with a
+    linear drift plus a jump (e.g. dropped frames) in the last windows.
+    """
+    SAMPLERATE = 8000
+    FRAME_RATE = 60.0
+    NUM_FRAMES = 60 * 600
+    DRIFT = 1.0002
+    SHIFT = 20000.0
+    JUMP = 800  # samples
+    JUMP_FRAME = 60 * 500
+
+    def true_synch(self, frame):
+        """
+        The synthetic map from frame index to audio sample.
+        """
+        stretch = self.SAMPLERATE / self.FRAME_RATE * self.DRIFT
+        jump = self.JUMP if frame >= self.JUMP_FRAME else 0
+        return frame * stretch + self.SHIFT + jump
+
+    def setUp(self):
+        """
+        Creates the audio and mocap envelopes with claps at random frames.
+        """
+        rng = np.random.RandomState(12345)
+        audio_len = int(self.true_synch(self.NUM_FRAMES)) + 8000
+        audio = rng.randn(audio_len) * 0.01
+        self.mocap = np.abs(rng.randn(self.NUM_FRAMES)) * 0.2
+        for f in rng.randint(10, self.NUM_FRAMES - 10, 300):
+            s = int(round(self.true_synch(f)))
+            audio[s:s + 400] += rng.randn(400)
+            self.mocap[f] += 5
+        self.audio_env = audio_envelope(audio, self.SAMPLERATE,
+                                        self.FRAME_RATE)
+
+    def test_theil_sen(self):
+        """
+        A few outliers must not affect the fit.
+        """
+        x = np.arange(20.0)
+        y = 3 * x + 5
+        y[[3, 7]] += 1000
+        self.assertEqual(dr.theil_sen(x, y), (3.0, 5.0))
+
+    def test_drift(self):
+        """
+        The drift must be measured within 10 ppm starting from the nominal
+        stretch, and the windows after the jump must show it as residual.
+        """
+        nominal = self.SAMPLERATE / self.FRAME_RATE
+        windows = dr.align_windows(self.audio_env, self.mocap, 0,
+                                   self.SAMPLERATE, self.FRAME_RATE, nominal,
+                                   self.SHIFT, num_processes=1)
+        report = dr.fit_drift(windows, self.SAMPLERATE, self.FRAME_RATE)
+        self.assertEqual(report["num_windows"], 20)
+        self.assertLess(abs(report["drift_ppm"] - 200), 10)
+        jump_ms = 1000.0 * self.JUMP / self.SAMPLERATE
+        for w in report["windows"]:
+            expected = jump_ms if w["frame"] >= self.JUMP_FRAME else 0
+            self.assertLess(abs(w["residual_ms"] - expected), jump_ms / 4)
+
+    def test_mocap_outlasts_audio(self):
+        """
+        Windows running past the end of the audio are skipped, and the rest
+        are still measured.
+        """
+        nominal = self.SAMPLERATE / self.FRAME_RATE
+        audio_env = self.audio_env[:len(self.audio_env) // 2]
+        windows = dr.align_windows(audio_env, self.mocap, 0,
+                                   self.SAMPLERATE, self.FRAME_RATE, nominal,
+                                   self.SHIFT, num_processes=1)
+        self.assertEqual(len(windows), 10)
+        audio_len = len(audio_env) * self.SAMPLERATE / self.FRAME_RATE
+        for frame, sample, score in windows:
+            self.assertLess(sample, audio_len)
+            if score >= dr.MIN_SCORE:
+                self.assertLess(abs(sample - self.true_synch(frame)), 200)
+        rng = np.random.RandomState(0)
+        windows = dr.align_windows(rng.rand(1000), rng.rand(2000), 0, 10.0,
+                                   10.0, 1.0, 0.0, num_processes=1)
+        self.assertEqual([w[0] for w in windows], [149.5, 449.5, 749.5])
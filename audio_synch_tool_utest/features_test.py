@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the per-frame audio features. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+import numpy as np
+import soundfile as sf
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.features import frame_features, window_features, \
+    take_features, extract_features, read_audio_synch, FEATURE_NAMES
+from audio_synch_tool_benchmark.synthetic import make_take
+
+
+def blocks_of(arr, blocksize):
+    """
+    """
+    return (arr[i:i + blocksize] for i in range(0, len(arr), blocksize))
+
+
+class FrameFeaturesTest(unittest.TestCase):
+    """
+    Tests that the streamed features equal the ones computed on the whole
+    audio, and that they measure what they should.
+    """
+    SAMPLERATE = 16000
+    WINDOW_SIZE = 128
+
+    def test_same_as_whole(self):
+        """
+        Any block size gives the same result, also for windows that reach
+        out of the audio and for repeated samples.
+        """
+        rng = np.random.RandomState(0)
+        audio = rng.randn(20000, 2)
+        samples = np.sort(np.concatenate([rng.randint(-300, 20300, 200),
+                                          [5000, 5000]]))
+        pad = 1000
+        padded = np.concatenate([np.zeros(pad), audio.mean(axis=1),
+                                 np.zeros(pad)])
+        starts = samples - self.WINDOW_SIZE // 2 + pad
+        windows = np.stack([padded[s:s + self.WINDOW_SIZE] for s in starts])
+        expected, _ = window_features(windows, self.SAMPLERATE)
+        for blocksize in (1, 97, 5000, 100000):
+            result = frame_features(blocks_of(audio, blocksize),
+                                    self.SAMPLERATE, samples,
+                                    self.WINDOW_SIZE)
+            self.assertEqual(result.shape, (len(samples), len(FEATURE_NAMES)))
+            self.assertTrue(np.allclose(result, expected, rtol=1e-5,
+                                        atol=1e-6))
+        with self.assertRaises(AssertionError):
+            frame_features([audio], self.SAMPLERATE, samples[::-1],
+                           self.WINDOW_SIZE)
+
+    def test_known_signals(self):
+        """
+        A sine has its RMS and centroid, and a burst after silence has the
+        strongest onset.
+        """
+        t = np.arange(16000) / self.SAMPLERATE
+        audio = 0.5 * np.sin(2 * np.pi * 2000 * t)
+        audio[:8000] = 0
+        samples = np.arange(100, 15900, 100)
+        result = frame_features(blocks_of(audio, 1000), self.SAMPLERATE,
+                                samples, self.WINDOW_SIZE)
+        sine = samples > 8000 + self.WINDOW_SIZE
+        self.assertTrue(np.allclose(result[sine, 0], 0.5 / np.sqrt(2),
+                                    rtol=0.02))
+        self.assertTrue(np.allclose(result[sine, 1], 2000, rtol=0.05))
+        self.assertTrue((result[samples < 8000 - self.WINDOW_SIZE] ==
+                         0).all())
+        onset_sample = samples[np.argmax(result[:, 2])]
+        self.assertLess(abs(onset_sample - 8000), self.WINDOW_SIZE)
+
+
+class TakeFeaturesTest(unittest.TestCase):
+    """
+    Tests the features of synched takes, from MVNX and columnar exports.
+    """
+
+    def test_takes(self):
+        """
+        MVNX files and their columnar exports give the same features, and
+        takes are processed in a pool without stopping on failures.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            take = make_take(tmpdir, "take", 2, samplerate=8000,
+                             num_claps=2, num_segments=15)
+            mvn = Mvn(take["mvnx_path"])
+            mvn.set_audio_synch(take["stretch"], take["shift"])
+            mvn.mvn.attrib["wav_file"] = "take.wav"
+            synched_path = os.path.join(tmpdir, "synched.mvnx")
+            mvn.export(synched_path)
+            columns_dir = os.path.join(tmpdir, "synched_columns")
+            mvn.export_columns(columns_dir)
+            #
+            samples, frame_rate, wav_file = read_audio_synch(synched_path)
+            self.assertEqual(samples.tolist(), mvn.get_audio_synch())
+            self.assertEqual((frame_rate, wav_file), (240.0, "take.wav"))
+            audio, samplerate = sf.read(take["wav_path"])
+            expected = frame_features([audio], samplerate, samples, 64)
+            self.assertTrue(np.array_equal(take_features(synched_path),
+                                           expected))
+            self.assertTrue(np.array_equal(take_features(columns_dir),
+                                           expected))
+            #
+            out_dir = os.path.join(tmpdir, "features")
+            results = extract_features([synched_path, take["mvnx_path"]],
+                                       out_dir, num_processes=1)
+            self.assertIsNone(results[0][2])
+            self.assertTrue(np.array_equal(np.load(results[0][1]),
+                                           expected))
+            self.assertIn("Is it synched?", results[1][2])
@@ -0,0 +1,58 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the import footprint of the headless entry points. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import sys
+import unittest
+import subprocess
+
+
+# modules only needed by the GUI (or by a few functions), which must be
+# imported on demand
+LAZY_MODULES = ["matplotlib", "pytz"]
+HEADLESS_MODULES = ["audio_synch_tool.__main__", "audio_synch_tool.mvn",
+                    "audio_synch_tool.utils", "audio_synch_tool.batch",
+                    "audio_synch_tool.locators", "audio_synch_tool.timecode",
+                    "audio_synch_tool.drift", "audio_synch_tool.render",
+                    "audio_synch_tool.apply", "audio_synch_tool.columnar",
+                    "audio_synch_tool.features",
+                    "audio_synch_tool_benchmark.__main__"]
+
+
+def loaded_modules(module_name):
+    """
+    :returns: The set of top-level module names loaded after importing the
+      given module in a fresh interpreter.
+    """
+    code = ("import sys, %s; print(' '.join(sorted(set("
+            "m.split('.')[0] for m in sys.modules))))" % module_name)
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True,
+                         text=True, check=True).stdout
+    return set(out.split())
+
+
+class LazyImportsTest(unittest.TestCase):
+    """
+    Tests that the headless entry points don't import the GUI dependencies.
+    """
+
+    def test_headless_modules(self):
+        """
+        """
+        for module_name in HEADLESS_MODULES:
+            loaded = loaded_modules(module_name)
+            for lazy in LAZY_MODULES:
+                self.assertNotIn(lazy, loaded, "%s imports %s" % (
+                    module_name, lazy))
+
+    def test_lazy_functions(self):
+        """
+        The lazily imported modules are still available when needed.
+        """
+        from audio_synch_tool.utils import make_timestamp
+        self.assertIn("(Europe/Berlin)", make_timestamp())
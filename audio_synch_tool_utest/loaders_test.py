@@ -0,0 +1,105 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the concurrent loading of takes. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import time
+import tempfile
+import threading
+import unittest
+import numpy as np
+import soundfile as sf
+from lxml import etree
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.loaders import load_take, LoadCancelled
+from audio_synch_tool_benchmark.synthetic import make_take
+from .mvn_test import make_mvnx
+
+
+class LoadTakeTest(unittest.TestCase):
+    """
+    Tests that the concurrent loading gives the same results as loading
+    sequentially, and that it reports progress, fails and cancels properly.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        """
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.take = make_take(cls.tmpdir.name, "take", 2, samplerate=8000,
+                             num_claps=2)
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        """
+        cls.tmpdir.cleanup()
+
+    def test_same_as_sequential(self):
+        """
+        All stages are reported once and in order of dependencies, and the
+        results are the same as loading sequentially.
+        """
+        calls = []
+        take = load_take(self.take["wav_path"], self.take["mvnx_path"], True,
+                         lambda mvn: mvn.extract_accel_norms(["LeftHand"]),
+                         lambda *args: calls.append(args))
+        self.assertEqual([c[1:] for c in calls], [(i, 4) for i in (1, 2, 3,
+                                                                   4)])
+        stages = [c[0] for c in calls]
+        self.assertEqual(sorted(stages),
+                         ["audio", "decode", "mvnx", "validate"])
+        self.assertLess(stages.index("mvnx"), stages.index("decode"))
+        self.assertLess(stages.index("mvnx"), stages.index("validate"))
+        #
+        wav_arr, samplerate = sf.read(self.take["wav_path"])
+        mvn = Mvn(self.take["mvnx_path"])
+        self.assertEqual(take["samplerate"], samplerate)
+        self.assertTrue((take["wav_arr"] == wav_arr).all())
+        self.assertTrue((take["mvn"].get_frame_indexes() ==
+                         mvn.get_frame_indexes()).all())
+        self.assertTrue(np.array_equal(take["decoded"],
+                                       mvn.extract_accel_norms(["LeftHand"])))
+
+    def test_errors(self):
+        """
+        The error of a failed stage is raised.
+        """
+        with self.assertRaises(RuntimeError):
+            load_take(self.take["wav_path"] + ".missing",
+                      self.take["mvnx_path"])
+        invalid_path = os.path.join(self.tmpdir.name, "invalid.mvnx")
+        with open(invalid_path, "w") as f:
+            f.write(make_mvnx(10))
+        take = load_take(self.take["wav_path"], invalid_path, True)
+        self.assertEqual(len(take["mvn"].get_frame_indexes()), 10)
+        with self.assertRaises(etree.DocumentInvalid):
+            load_take(self.take["wav_path"], invalid_path, "strict")
+
+    def test_cancel(self):
+        """
+        A cancelled loading raises without waiting for the running stages.
+        """
+        cancel = threading.Event()
+        cancel.set()
+        with self.assertRaises(LoadCancelled):
+            load_take(self.take["wav_path"], self.take["mvnx_path"],
+                      cancel=cancel)
+        #
+        cancel = threading.Event()
+        sleep_secs = 2
+
+        def slow_decode(mvn):
+            cancel.set()
+            time.sleep(sleep_secs)
+        t0 = time.perf_counter()
+        with self.assertRaises(LoadCancelled):
+            load_take(self.take["wav_path"], self.take["mvnx_path"],
+                      decode=slow_decode, cancel=cancel)
+        self.assertLess(time.perf_counter() - t0, sleep_secs)
@@ -0,0 +1,131 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the locators module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import random
+import tempfile
+import unittest
+import numpy as np
+import soundfile as sf
+import audio_synch_tool.locators as loc
+
+
+class FindSublistTest(unittest.TestCase):
+    """
+    Tests for the exact search of a shorter signal within a longer one.
+    """
+    NUM_TESTS = 100
+    LEN = 20000
+
+    def setUp(self):
+        """
+        Random stereo PCM-like signal with a silent region in the middle.
+        """
+        rng = np.random.RandomState(12345)
+        self.arr = rng.randint(-3000, 3000, (self.LEN, 2)).astype(np.int16)
+        self.arr[5000:9000] = 0
+
+    def test_random_slices(self):
+        """
+        Any slice must be found at its position, or at an earlier one with
+        the same contents (e.g. within the silence).
+        """
+        for _ in range(self.NUM_TESTS):
+            beg = random.randint(0, self.LEN - 1)
+            end = random.randint(beg + 1, self.LEN)
+            needle = self.arr[beg:end]
+            pos = loc.find_sublist(self.arr, needle)
+            self.assertLessEqual(pos, beg)
+            self.assertTrue(np.array_equal(self.arr[pos:pos + len(needle)],
+                                           needle))
+
+    def test_not_found(self):
+        """
+        A single modified sample must prevent the match.
+        """
+        needle = self.arr[1000:12000].copy()
+        needle[-1, 1] += 1
+        self.assertIsNone(loc.find_sublist(self.arr, needle))
+        self.assertEqual(loc.numpy_find_sublist(needle, self.arr),
+                         (None, None))
+
+    def test_numpy_find_sublist(self):
+        """
+        Results work in both directions, for mono signals too.
+        """
+        mono = self.arr[:, 0]
+        self.assertEqual(loc.numpy_find_sublist(mono[100:200], mono),
+                         ((100, 200), None))
+        self.assertEqual(loc.numpy_find_sublist(mono, mono[100:200]),
+                         (None, (100, 200)))
+
+    def test_streaming(self):
+        """
+        Streaming search over files must find slices also across block
+        boundaries.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            long_path = os.path.join(tmpdir, "long.wav")
+            sf.write(long_path, self.arr, 8000, subtype="PCM_16")
+            ranges = [(0, 10), (4000, 15000), (self.LEN - 10, self.LEN)]
+            short_paths = []
+            for i, (beg, end) in enumerate(ranges):
+                short_paths.append(os.path.join(tmpdir, "%d.wav" % i))
+                sf.write(short_paths[-1], self.arr[beg:end], 8000,
+                         subtype="PCM_16")
+            results = loc.locate_wavs(short_paths, long_path, blocksize=1000)
+            self.assertEqual(results, ranges)
+
+
+class XcorrLocateTest(unittest.TestCase):
+    """
+    Tests for the tolerant search based on cross-correlation.
+    """
+    SAMPLERATE = 8000
+    LEN = 8000 * 60
+
+    def setUp(self):
+        """
+        Random mono signal with a random amplitude envelope.
+        """
+        rng = np.random.RandomState(12345)
+        env = np.repeat(rng.rand(self.LEN // 400), 400)
+        self.arr = rng.randn(self.LEN) * env * 0.3
+        self.noise = rng.randn(self.LEN) * 1e-3
+
+    def test_overlap_save(self):
+        """
+        Streaming xcorr must match the direct Pearson correlation at all lags,
+        also across block boundaries.
+        """
+        x, t = self.arr[:3000], self.arr[1000:1100]
+        blocks = np.split(x, [700, 1234, 2900])
+        ncc = np.concatenate([n for _, n in loc.xcorr_overlap_save(
+            blocks, t, fft_size=256)])
+        direct = [np.corrcoef(x[k:k + len(t)], t)[0, 1]
+                  for k in range(len(x) - len(t) + 1)]
+        self.assertTrue(np.allclose(ncc, direct))
+
+    def test_reencoded(self):
+        """
+        A slice with gain and noise, stored with a different sample format,
+        must be found at its exact position with high confidence.
+        """
+        beg, end = 123457, 123457 + self.SAMPLERATE * 10
+        short = 0.5 * self.arr[beg:end] + self.noise[beg:end]
+        with tempfile.TemporaryDirectory() as tmpdir:
+            long_path = os.path.join(tmpdir, "long.wav")
+            short_path = os.path.join(tmpdir, "short.wav")
+            sf.write(long_path, self.arr, self.SAMPLERATE, subtype="FLOAT")
+            sf.write(short_path, short, self.SAMPLERATE, subtype="PCM_16")
+            self.assertIsNone(loc.locate_wav(short_path, long_path))
+            result = loc.xcorr_locate_wav(short_path, long_path,
+                                          blocksize=10000)
+        self.assertEqual(result[:2], (beg, end))
+        self.assertGreater(result[2], 0.9)
@@ -0,0 +1,227 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Memory regression tests: the peak memory increment of loading, extracting
+and exporting MVNs and of constructing the plotters must stay within a
+budget given in bytes per frame and bytes per audio sample, on synthetic
+inputs of increasing size. E.g. a copy of the whole XML tree as a string,
+or a float64 copy of the audio x-axis, exceed them.
+
+Each measurement runs in a separate process, forked when possible, after
+releasing the free heap memory, since it would be reused and hide the
+increments. The peak is sampled with ``memory_profiler``.
+"""
+
+import os
+import gc
+import ctypes
+import ctypes.util
+import tempfile
+import unittest
+import multiprocessing
+#
+from memory_profiler import memory_usage
+import soundfile as sf
+#
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.plotters import AudioMvnSynchToolEditor
+from audio_synch_tool.plotters import AudioMvnSynchToolChecker
+from audio_synch_tool_benchmark.synthetic import write_synthetic_mvnx
+from audio_synch_tool_benchmark.synthetic import write_synthetic_wav
+
+
+# #############################################################################
+# ## GLOBALS
+# #############################################################################
+
+MIB = 1024 * 1024
+FRAME_SIZES = [1200, 4800]  # normal frames of the MVNX tests
+SAMPLE_SIZES = [1000000, 4000000]  # audio samples of the plotter tests
+PLOTTER_FRAMES = 600  # normal frames of the MVNX used by the plotter tests
+SAMPLERATE = 48000
+INTERVAL_SECS = 0.002  # memory sampling interval
+NUM_PROCESSES = 4
+START_METHOD = ("fork" if "fork" in multiprocessing.get_all_start_methods()
+                else "spawn")
+BASE_BUDGET = 16 * MIB  # allowance for size-independent allocations
+# The budgets are about 1.2-1.5 times the measured increments. For reference,
+# the XML file has about 7.5KB per frame and the audio is read as float64
+BYTES_PER_FRAME = {"load": 16000, "extract": 40000, "export": 2000,
+                   "editor": 24000, "checker": 8000}
+BYTES_PER_SAMPLE = {"editor": 14, "checker": 6}
+
+
+# #############################################################################
+# ## HELPERS
+# #############################################################################
+
+def _setup(op, mvnx_path, wav_path):
+    """
+    Prepares the inputs of the given operation, which are not part of the
+    measurement.
+
+    :returns: A tuple ``(fn, args)`` with the callable to be measured.
+    """
+    if op == "load":
+        return Mvn, (mvnx_path,)
+    mvn = Mvn(mvnx_path)
+    if op == "extract":
+        return mvn.extract_frame_info, ()
+    if op == "export":
+        mvn.set_audio_synch(SAMPLERATE / 240, 0)
+        out_path = os.path.join(os.path.dirname(mvnx_path), "out.mvnx")
+        return mvn.export, (out_path, False)
+    if op == "editor":
+        return AudioMvnSynchToolEditor, (wav_path, mvnx_path)
+    if op == "checker":
+        audio, samplerate = sf.read(wav_path)
+        mvn.set_audio_synch(len(audio) / PLOTTER_FRAMES, 0)
+        return AudioMvnSynchToolChecker, (audio, samplerate, mvn)
+    raise ValueError("Unknown operation: %s" % op)
+
+
+def release_free_memory():
+    """
+    Returns the free heap memory to the OS if possible (glibc only), so that
+    the RSS grows with any new allocation.
+    """
+    gc.collect()
+    libc_path = ctypes.util.find_library("c")
+    if libc_path is None:
+        return
+    malloc_trim = getattr(ctypes.CDLL(libc_path), "malloc_trim", None)
+    if malloc_trim is not None:
+        malloc_trim(0)
+
+
+def _measure_job(conn, op, mvnx_path, wav_path):
+    """
+    Runs in a separate process. Sends the peak memory increment of the given
+    operation in bytes (or the exception) through ``conn``.
+    """
+    try:
+        fn, args = _setup(op, mvnx_path, wav_path)
+        release_free_memory()
+        mem = memory_usage((fn, args), interval=INTERVAL_SECS)
+        conn.send((max(mem) - mem[0]) * MIB)
+    except Exception as e:
+        conn.send(e)
+    finally:
+        conn.close()
+
+
+def measure_peaks(jobs, num_processes=NUM_PROCESSES):
+    """
+    :param jobs: A list of ``(op, mvnx_path, wav_path)`` tuples.
+    :returns: A list with the peak memory increment of each job in bytes.
+      Every job runs in a separate process, at most ``num_processes`` at
+      once.
+    """
+    ctx = multiprocessing.get_context(START_METHOD)
+    results = []
+    for beg in range(0, len(jobs), num_processes):
+        running = []
+        for job in jobs[beg:beg + num_processes]:
+            recv_conn, send_conn = ctx.Pipe(duplex=False)
+            p = ctx.Process(target=_measure_job, args=(send_conn,) + job)
+            p.start()
+            send_conn.close()
+            running.append((p, recv_conn))
+        for p, recv_conn in running:
+            result = recv_conn.recv()
+            p.join()
+            if isinstance(result, Exception):
+                raise result
+            results.append(result)
+    return results
+
+
+def budget(op, num_frames, num_samples=0):
+    """
+    :returns: The memory budget in bytes of the given operation.
+    """
+    return (BASE_BUDGET + BYTES_PER_FRAME[op] * num_frames +
+            BYTES_PER_SAMPLE.get(op, 0) * num_samples)
+
+
+# #############################################################################
+# ## TESTS
+# #############################################################################
+
+class MemoryBudgetTest(unittest.TestCase):
+    """
+    Peak memory of the MVN operations and the plotter constructors.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Generates the inputs and measures all jobs at once, to run them in
+        parallel.
+        """
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        tmp = cls.tmpdir.name
+        cls.jobs = []  # (op, num_frames, num_samples, mvnx_path, wav_path)
+        for num_frames in FRAME_SIZES:
+            path = os.path.join(tmp, "take_%d.mvnx" % num_frames)
+            write_synthetic_mvnx(path, num_frames)
+            for op in ("load", "extract", "export"):
+                cls.jobs.append((op, num_frames, 0, path, None))
+        small_path = os.path.join(tmp, "small.mvnx")
+        write_synthetic_mvnx(small_path, PLOTTER_FRAMES)
+        for num_samples in SAMPLE_SIZES:
+            path = os.path.join(tmp, "audio_%d.wav" % num_samples)
+            write_synthetic_wav(path, num_samples, SAMPLERATE)
+            for op in ("editor", "checker"):
+                cls.jobs.append((op, PLOTTER_FRAMES, num_samples, small_path,
+                                 path))
+        cls.peaks = measure_peaks([(op, mvnx, wav) for op, _, _, mvnx, wav
+                                   in cls.jobs])
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        """
+        cls.tmpdir.cleanup()
+
+    def check_budgets(self, op):
+        """
+        """
+        checked = 0
+        for (job_op, frames, samples, _, _), peak in zip(self.jobs,
+                                                         self.peaks):
+            if job_op != op:
+                continue
+            b = budget(op, frames, samples)
+            self.assertLessEqual(
+                peak, b, "%s: peak %.1f MiB above budget %.1f MiB for %d "
+                "frames and %d samples" % (op, peak / MIB, b / MIB, frames,
+                                           samples))
+            checked += 1
+        self.assertGreater(checked, 0)
+
+    def test_mvn_load(self):
+        """
+        """
+        self.check_budgets("load")
+
+    def test_mvn_extract(self):
+        """
+        """
+        self.check_budgets("extract")
+
+    def test_mvn_export(self):
+        """
+        """
+        self.check_budgets("export")
+
+    def test_editor(self):
+        """
+        """
+        self.check_budgets("editor")
+
+    def test_checker(self):
+        """
+        """
+        self.check_budgets("checker")
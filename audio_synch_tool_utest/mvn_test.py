@@ -0,0 +1,119 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the mvn module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+from audio_synch_tool.mvn import Mvn
+
+
+def make_mvnx(num_frames, start_ms=1000):
+    """
+    :returns: A minimal (not schema-valid) MVNX string with 3 config frames
+      and ``num_frames`` normal frames at 240 fps, starting at the given unix
+      timestamp in ms. The ``tc`` is the UTC time of day, with milliseconds.
+    """
+    frame = '<frame time="%d" %s tc="%s" ms="%d" type="%s"/>'
+
+    def tc(ms):
+        secs, ms = divmod(ms % (86400 * 1000), 1000)
+        return "%02d:%02d:%02d:%03d" % (secs // 3600, secs // 60 % 60,
+                                        secs % 60, ms)
+    config = [frame % (0, "", tc(start_ms), start_ms, t)
+              for t in ("identity", "tpose", "tpose-isb")]
+    ms = [start_ms + round(i * 1000 / 240) for i in range(num_frames)]
+    normal = [frame % (m - start_ms, 'index="%d"' % i, tc(m), m, "normal")
+              for i, m in enumerate(ms)]
+    return ('<mvnx version="4" xmlns="http://www.xsens.com/mvn/mvnx">'
+            '<subject frameRate="240" segmentCount="0">'
+            '<frames segmentCount="0" sensorCount="0" jointCount="0">' +
+            "".join(config + normal) + '</frames></subject></mvnx>')
+
+
+class MvnSynchTest(unittest.TestCase):
+    """
+    Tests for the audio synchronization and trimming of Mvn objects.
+    """
+    NUM_FRAMES = 100
+
+    def setUp(self):
+        """
+        Writes a minimal MVNX to a temp file and loads it.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.mvnx")
+            with open(path, "w") as f:
+                f.write(make_mvnx(self.NUM_FRAMES))
+            self.mvn = Mvn(path)
+
+    def test_set_audio_synch(self):
+        """
+        Audio samples must be rounded like python's round (half to even).
+        """
+        stretch, shift = 2.5, 0.5
+        self.mvn.set_audio_synch(stretch, shift)
+        self.assertEqual(self.mvn.get_audio_synch(),
+                         [round(i * stretch + shift)
+                          for i in range(self.NUM_FRAMES)])
+
+    def test_trim(self):
+        """
+        Frames outside of the audio range are removed, except the last one
+        before the range, which gets audio sample 0. Config frames are kept.
+        """
+        self.mvn.set_audio_synch(10, 0)
+        first, last = self.mvn.trim_to_audio_range(205, 500)
+        self.assertEqual((first, last), (20, 51))
+        self.assertEqual(self.mvn.get_audio_synch(),
+                         [0] + list(range(5, 300, 10)))
+        frames = self.mvn.mvn.subject.frames.getchildren()
+        self.assertEqual([f.attrib["type"] for f in frames[:4]],
+                         ["identity", "tpose", "tpose-isb", "normal"])
+        self.assertEqual(frames[3].attrib["index"], "20")
+
+    def test_trim_no_frame_before(self):
+        """
+        If all frames are after ``beg``, none is removed on the left and the
+        audio samples are just shifted.
+        """
+        self.mvn.set_audio_synch(10, 1000)
+        self.assertEqual(self.mvn.trim_to_audio_range(100, 10 ** 6),
+                         (0, self.NUM_FRAMES))
+        self.assertEqual(self.mvn.get_audio_synch(),
+                         list(range(900, 1900, 10)))
+
+    def test_audio_warp(self):
+        """
+        With more than 2 anchors, audio samples are interpolated between
+        consecutive anchors and extrapolated with the outer ones. With 2, the
+        warp equals ``set_audio_synch``.
+        """
+        self.mvn.set_audio_warp([10, 50, 90], [100, 500, 1300])
+        expected = ([10 * i for i in range(50)] +
+                    [500 + 20 * (i - 50) for i in range(50, self.NUM_FRAMES)])
+        self.assertEqual(self.mvn.get_audio_synch(), expected)
+        self.mvn.set_audio_warp([0, 99], [5, 302])
+        self.assertEqual(self.mvn.get_audio_synch(),
+                         [3 * i + 5 for i in range(self.NUM_FRAMES)])
+
+    def test_flush(self):
+        """
+        Audio samples are written into the XML when exporting, also after
+        trimming.
+        """
+        self.mvn.set_audio_warp([0, 50, 99], [0, 500, 1490])
+        self.mvn.trim_to_audio_range(480, 10 ** 6)
+        expected = self.mvn.get_audio_synch()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "out.mvnx")
+            self.mvn.export(path)
+            frames = Mvn(path).mvn.subject.frames.getchildren()[3:]
+        self.assertEqual([int(f.attrib["audio_sample"]) for f in frames],
+                         expected)
+        self.assertEqual(int(frames[0].attrib["index"]), 48)
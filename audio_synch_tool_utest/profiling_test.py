@@ -0,0 +1,126 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the profiling module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+#
+from audio_synch_tool import profiling
+from audio_synch_tool.profiling import span, profiled, pop_profile_args
+from audio_synch_tool.mvn import Mvn
+from .mvn_test import make_mvnx
+
+
+@profiled("test.allocate")
+def allocate(num_bytes):
+    """
+    """
+    return bytearray(num_bytes)
+
+
+class ProfilingTest(unittest.TestCase):
+    """
+    Tests for the span recording and reports of the profiler.
+    """
+
+    def setUp(self):
+        """
+        Makes sure that every test starts with the profiler disabled.
+        """
+        self.previous = profiling.disable()
+
+    def tearDown(self):
+        """
+        """
+        profiling.disable()
+        if self.previous is not None:
+            profiling.enable(self.previous.trace_path, self.previous.memory,
+                             report_at_exit=False)
+
+    def test_disabled(self):
+        """
+        While disabled, spans are no-ops and decorated functions behave as
+        usual.
+        """
+        self.assertIs(span("a"), span("b"))
+        with span("a"):
+            self.assertEqual(len(allocate(10)), 10)
+        self.assertIsNone(profiling.get_profiler())
+
+    def test_spans(self):
+        """
+        Calls are counted per stage, nested spans are contained in their
+        parents, and the Chrome trace has one complete event per span.
+        """
+        profiler = profiling.enable(report_at_exit=False)
+        with span("outer"):
+            for _ in range(3):
+                allocate(10)
+        summary = {s["name"]: s for s in profiler.summary()}
+        self.assertEqual(summary["outer"]["count"], 1)
+        self.assertEqual(summary["test.allocate"]["count"], 3)
+        self.assertGreaterEqual(summary["outer"]["total"],
+                                summary["test.allocate"]["total"])
+        self.assertIsNone(summary["outer"]["max_alloc_peak"])
+        trace = profiler.chrome_trace()["traceEvents"]
+        self.assertEqual(len(trace), 4)
+        outer = [e for e in trace if e["name"] == "outer"][0]
+        for e in trace:
+            self.assertEqual(e["ph"], "X")
+            self.assertGreaterEqual(e["ts"], outer["ts"])
+            self.assertLessEqual(e["ts"] + e["dur"],
+                                 outer["ts"] + outer["dur"])
+
+    def test_tracemalloc(self):
+        """
+        The traced peak of a span includes the peaks of its children, even
+        if they were freed.
+        """
+        profiler = profiling.enable(memory=True, report_at_exit=False)
+        num_bytes = 10 ** 7
+        with span("outer"):
+            allocate(num_bytes)
+            allocate(10)
+        summary = {s["name"]: s for s in profiler.summary()}
+        self.assertGreaterEqual(summary["outer"]["max_alloc_peak"], num_bytes)
+        self.assertGreaterEqual(summary["test.allocate"]["max_alloc_peak"],
+                                num_bytes)
+        self.assertIn("max(ms)", profiler.format_summary())
+
+    def test_mvn_stages(self):
+        """
+        Loading and synching an Mvn records its stages.
+        """
+        profiler = profiling.enable(report_at_exit=False)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "test.mvnx")
+            with open(path, "w") as f:
+                f.write(make_mvnx(100))
+            mvn = Mvn(path)
+            mvn.set_audio_synch(200, 0)
+            mvn.export(os.path.join(tmpdir, "out.mvnx"))
+        names = {s["name"] for s in profiler.summary()}
+        for name in ("mvn.parse", "mvn.set_audio_synch",
+                     "mvn.flush_audio_synch", "mvn.export"):
+            self.assertIn(name, names)
+
+    def test_cli_args(self):
+        """
+        The profiling flags are removed from the CLI arguments, and enable
+        the profiler.
+        """
+        argv = pop_profile_args(["drift", "-w", "a.wav"])
+        self.assertEqual(argv, ["drift", "-w", "a.wav"])
+        self.assertIsNone(profiling.get_profiler())
+        argv = pop_profile_args(["drift", "--profile=t.json", "-w", "a.wav",
+                                 "--tracemalloc"])
+        self.assertEqual(argv, ["drift", "-w", "a.wav"])
+        profiler = profiling.get_profiler()
+        self.assertEqual(profiler.trace_path, "t.json")
+        self.assertTrue(profiler.memory)
@@ -0,0 +1,88 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the headless rendering of check-mode images. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+import matplotlib
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.render import render_take, render_takes
+from audio_synch_tool_benchmark.synthetic import make_take
+
+
+class RenderTest(unittest.TestCase):
+    """
+    Tests that synched takes are rendered into non-empty PNGs, and that
+    broken takes are reported without stopping the others.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        """
+        Writes a small synthetic take and its synched MVNX.
+        """
+        matplotlib.use("Agg")
+        cls.tmpdir = tempfile.TemporaryDirectory()
+        cls.dir = cls.tmpdir.name
+        take = make_take(cls.dir, "take", 2, samplerate=8000, num_claps=2,
+                         num_segments=15)
+        mvn = Mvn(take["mvnx_path"])
+        mvn.set_audio_synch(take["stretch"], take["shift"])
+        mvn.mvn.attrib["wav_file"] = "take.wav"
+        cls.synched_path = os.path.join(cls.dir, "synched.mvnx")
+        mvn.export(cls.synched_path)
+        # not synched, so it can't be rendered
+        cls.broken_path = take["mvnx_path"]
+
+    @classmethod
+    def tearDownClass(cls):
+        """
+        """
+        cls.tmpdir.cleanup()
+
+    def assertImages(self, paths, expected_names):
+        """
+        """
+        self.assertEqual([os.path.basename(p) for p in paths],
+                         expected_names)
+        for p in paths:
+            self.assertTrue(os.path.isfile(p), p)
+            self.assertGreater(os.path.getsize(p), 0, p)
+
+    def test_render_take(self):
+        """
+        An overview plus one zoomed image per point are written.
+        """
+        out_dir = os.path.join(self.dir, "take_images")
+        os.makedirs(out_dir)
+        paths = render_take(self.synched_path, out_dir,
+                            points=["first", "last", "frame:100"],
+                            max_datapoints=1000, dpi=30)
+        self.assertImages(paths, ["synched_overview.png",
+                                  "synched_zoom_first.png",
+                                  "synched_zoom_last.png",
+                                  "synched_zoom_frame_100.png"])
+
+    def test_render_takes(self):
+        """
+        A take that can't be rendered is reported, and the others are still
+        rendered.
+        """
+        out_dir = os.path.join(self.dir, "pool_images")
+        results = render_takes([self.broken_path, self.synched_path],
+                               out_dir, num_processes=1, points=["first"],
+                               max_datapoints=1000, dpi=30)
+        self.assertEqual([r[0] for r in results],
+                         [self.broken_path, self.synched_path])
+        broken, ok = results
+        self.assertEqual(broken[1], [])
+        self.assertIn("Is it synched?", broken[2])
+        self.assertIsNone(ok[2])
+        self.assertImages(ok[1], ["synched_overview.png",
+                                  "synched_zoom_first.png"])
@@ -0,0 +1,46 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the synthetic take generator of the benchmarks. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import tempfile
+import unittest
+import numpy as np
+import soundfile as sf
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.claps import clap_candidates_wav
+from audio_synch_tool_benchmark.synthetic import make_take, validate_take
+
+
+class SyntheticTakeTest(unittest.TestCase):
+    """
+    Tests that synthetic takes are valid and consistent with their ground
+    truth.
+    """
+
+    def test_take(self):
+        """
+        The MVNX is schema-valid with the requested sizes, and the claps are
+        found at the ground truth positions in both MVNX and WAV.
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            take = make_take(tmpdir, "test", 3, samplerate=16000,
+                             num_claps=3, num_segments=25, num_sensors=5)
+            self.assertTrue(validate_take(take))
+            mvn = Mvn(take["mvnx_path"])
+            self.assertEqual(len(mvn.get_frame_indexes()), 720)
+            self.assertEqual(len(mvn.extract_segments()), 25)
+            self.assertEqual(sf.info(take["wav_path"]).frames,
+                             take["num_samples"])
+            candidates = clap_candidates_wav(take["wav_path"], mvn)
+        found = sorted(candidates[:3])
+        self.assertEqual([f for f, _, _ in found], take["clap_frames"])
+        expected = (np.array(take["clap_frames"]) * take["stretch"] +
+                    take["shift"])
+        # audio onsets have a resolution of claps.HOP samples
+        self.assertLess(np.abs(np.array([s for _, s, _ in found]) -
+                               expected).max(), 64)
@@ -0,0 +1,196 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the timecode module. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import struct
+import tempfile
+import unittest
+import numpy as np
+import soundfile as sf
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.timecode import read_bwf_info, tc_to_seconds
+from audio_synch_tool.timecode import timecode_synch_wav
+from audio_synch_tool.timecode import decode_ltc, ltc_synch_wav
+from .mvn_test import make_mvnx
+
+
+def write_bwf(path, audio, samplerate, time_reference):
+    """
+    Writes the given int16 mono array as a BWF file with the given
+    ``TimeReference``, and an odd-sized chunk before the ``bext`` one.
+    """
+    def chunk(chunk_id, data):
+        return (struct.pack("<4sI", chunk_id, len(data)) + data +
+                b"\0" * (len(data) % 2))
+    fmt = struct.pack("<HHIIHH", 1, 1, samplerate, samplerate * 2, 2, 16)
+    bext = bytearray(602)
+    bext[0:4] = b"test"
+    struct.pack_into("<Q", bext, 338, time_reference)
+    body = (b"WAVE" + chunk(b"fmt ", fmt) + chunk(b"junk", b"odd") +
+            chunk(b"bext", bytes(bext)) +
+            chunk(b"data", audio.astype("<i2").tobytes()))
+    with open(path, "wb") as f:
+        f.write(struct.pack("<4sI", b"RIFF", len(body)) + body)
+
+
+class TimecodeTest(unittest.TestCase):
+    """
+    Tests for the BWF parsing and the timecode synchronization.
+    """
+    SAMPLERATE = 48000
+    NUM_FRAMES = 2000
+    START_MS = 1515983008686  # 2018-01-15 02:23:28.686 UTC
+
+    def setUp(self):
+        """
+        Writes a BWF starting 1.5 seconds before the MVN, and the MVN.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        start_secs = (self.START_MS / 1000.0) % 86400 - 1.5
+        self.time_reference = round(start_secs * self.SAMPLERATE)
+        self.wav_path = os.path.join(self.tmpdir.name, "test.wav")
+        write_bwf(self.wav_path, np.zeros(1000), self.SAMPLERATE,
+                  self.time_reference)
+        path = os.path.join(self.tmpdir.name, "test.mvnx")
+        with open(path, "w") as f:
+            f.write(make_mvnx(self.NUM_FRAMES, self.START_MS))
+        self.mvn = Mvn(path)
+
+    def tearDown(self):
+        """
+        """
+        self.tmpdir.cleanup()
+
+    def test_read_bwf(self):
+        """
+        The RIFF parser finds the fmt and bext fields, also after an
+        odd-sized chunk.
+        """
+        info = read_bwf_info(self.wav_path)
+        self.assertEqual(info["samplerate"], self.SAMPLERATE)
+        self.assertEqual(info["num_channels"], 1)
+        self.assertEqual(info["time_reference"], self.time_reference)
+        self.assertEqual(info["description"], "test")
+
+    def test_tc_to_seconds(self):
+        """
+        The last field is interpreted as milliseconds or timecode frames.
+        """
+        tcs = ["00:00:01:500", "01:02:03:012"]
+        self.assertTrue(np.allclose(tc_to_seconds(tcs),
+                                    [1.5, 3723.012]))
+        self.assertTrue(np.allclose(tc_to_seconds(tcs, tc_fps=25),
+                                    [21, 3723.48]))
+
+    def test_synch(self):
+        """
+        Both timecode sources give the synch up to the rounding of the
+        ``ms`` to milliseconds, which is much less than a frame.
+        """
+        stretch_gt = self.SAMPLERATE / 240.0
+        shift_gt = 1.5 * self.SAMPLERATE
+        for source in ("tc", "ms"):
+            stretch, shift, residual_ms = timecode_synch_wav(
+                self.wav_path, self.mvn, source, timezone="UTC")
+            self.assertAlmostEqual(stretch, stretch_gt, places=3)
+            self.assertLess(abs(shift - shift_gt), 0.1 * stretch_gt)
+            self.assertLess(residual_ms, 1)
+
+
+def encode_ltc(timecodes, fps, samplerate, start=0.0):
+    """
+    :param timecodes: A list of ``(hours, mins, secs, frames)`` tuples.
+    :returns: A float array with the bi-phase mark LTC of the given
+      timecodes, the first frame starting at sample ``start``.
+    """
+    bits = np.zeros((len(timecodes), 80), dtype=bool)
+    bits[:, 64:] = [0, 0, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 1, 0, 1]
+    for row, tc in zip(bits, timecodes):
+        for val, (units, tens, num_tens) in zip(
+                tc, ((48, 56, 2), (32, 40, 3), (16, 24, 3), (0, 8, 2))):
+            row[units:units + 4] = [(val % 10) >> i & 1 for i in range(4)]
+            row[tens:tens + num_tens] = [(val // 10) >> i & 1
+                                         for i in range(num_tens)]
+    bits = bits.ravel()
+    bit_period = samplerate / (fps * 80)
+    k = np.arange(len(bits))
+    transitions = np.sort(np.concatenate((k, k[bits] + 0.5))) * bit_period
+    num_samples = int(start + len(bits) * bit_period) + 10
+    level = np.searchsorted(transitions + start, np.arange(num_samples) + 0.5,
+                            "right") % 2
+    return level - 0.5
+
+
+class LtcTest(unittest.TestCase):
+    """
+    Tests for the LTC decoder and the LTC synchronization.
+    """
+    SAMPLERATE = 48000
+    FPS = 25
+    START = 5000.0  # first LTC sample
+    START_MS = 1515983008686  # first MVN frame, see TimecodeTest
+    NUM_LTC_FRAMES = 300
+
+    def setUp(self):
+        """
+        Writes a stereo WAV with LTC on the second channel, starting at the
+        last whole second before the MVN, and the MVN.
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.ltc_start_secs = (self.START_MS // 1000) % 86400 - 1
+        self.timecodes = []
+        for i in range(self.NUM_LTC_FRAMES):
+            secs = self.ltc_start_secs + i // self.FPS
+            self.timecodes.append((secs // 3600, secs // 60 % 60, secs % 60,
+                                   i % self.FPS))
+        ltc = encode_ltc(self.timecodes, self.FPS, self.SAMPLERATE,
+                         self.START)
+        rng = np.random.RandomState(0)
+        self.audio = np.stack([rng.randn(len(ltc)) * 0.1,
+                               ltc + 0.05 * rng.randn(len(ltc))], axis=1)
+        self.wav_path = os.path.join(self.tmpdir.name, "ltc.wav")
+        sf.write(self.wav_path, self.audio, self.SAMPLERATE)
+        path = os.path.join(self.tmpdir.name, "test.mvnx")
+        with open(path, "w") as f:
+            f.write(make_mvnx(2000, self.START_MS))
+        self.mvn = Mvn(path)
+
+    def tearDown(self):
+        """
+        """
+        self.tmpdir.cleanup()
+
+    def test_decode(self):
+        """
+        All frames but the last (whose last bit has no closing transition)
+        are decoded, also across block boundaries, every ``SAMPLERATE / FPS``
+        samples. The rate is estimated.
+        """
+        blocks = [self.audio[i:i + 10000]
+                  for i in range(0, len(self.audio), 10000)]
+        samples, timecodes, fps = decode_ltc(blocks, self.SAMPLERATE,
+                                             channel=1)
+        self.assertEqual(fps, self.FPS)
+        self.assertEqual(timecodes.tolist(),
+                         [list(tc) for tc in self.timecodes[:-1]])
+        expected = self.START + np.arange(len(samples)) * 1920
+        self.assertLess(np.abs(samples - expected).max(), 1)
+
+    def test_synch(self):
+        """
+        The synch from the LTC matches the one from the MVN timestamps.
+        """
+        stretch, shift, residual_ms = ltc_synch_wav(self.wav_path, self.mvn,
+                                                    channel=1)
+        first_secs = (self.START_MS / 1000.0) % 86400
+        shift_gt = (self.START +
+                    (first_secs - self.ltc_start_secs) * self.SAMPLERATE)
+        self.assertAlmostEqual(stretch, self.SAMPLERATE / 240, places=3)
+        self.assertLess(abs(shift - shift_gt), 1)
+        self.assertLess(residual_ms, 0.1)
@@ -9,6 +9,7 @@ https://docs.python.org/3/library/unittest.html#assert-methods
 
 import random
 import unittest
+import numpy as np
 import audio_synch_tool.utils as uts
 
 
@@ -107,6 +108,29 @@ class TimedeltaTest(unittest.TestCase):
             self.assertAlmostEqual(SAMPLE_NR, ts.total_seconds * SAMPLERATE,
                                    places=0)
 
+    def test_no_dict(self):
+        """
+        Timedelta is slotted, so no attributes can be added.
+        """
+        ts = uts.Timedelta(1234.5678, 1000)
+        with self.assertRaises(AttributeError):
+            ts.new_attribute = None
+
+    def test_batch_consistency(self):
+        """
+        ``timedelta_arrays`` must return the same fields and strings as
+        ``Timedelta``, also for negative sample numbers.
+        """
+        NUM_ITERS = 1000
+        SAMPLERATE = random.randint(1, 1e5)
+        sample_nrs = [random.uniform(-1e10, 1e10) for _ in range(NUM_ITERS)]
+        sample_nrs += [0, 1, -1, 0.5, -0.5]
+        d, h, m, s, mms, strs = uts.timedelta_arrays(sample_nrs, SAMPLERATE)
+        for i, sn in enumerate(sample_nrs):
+            ts = uts.Timedelta(sn, SAMPLERATE)
+            self.assertEqual((d[i], h[i], m[i], s[i], mms[i]), ts.as_tuple())
+            self.assertEqual(strs[i], str(ts))
+
 
 class ConvertAnchorsTest(unittest.TestCase):
     """
@@ -137,3 +161,148 @@ class ConvertAnchorsTest(unittest.TestCase):
             result2 = round(stretch * o2 + shift)
             self.assertEqual(result1, d1)
             self.assertEqual(result2, d2)
+
+    def test_inverse(self):
+        """
+        ``utils.synch_to_anchors`` recovers integer anchors from the stretch
+        and shift computed by ``utils.convert_anchors``.
+        """
+        for _ in range(self.NUM_TESTS):
+            o1 = random.randint(0, self.MVN_SAMPLERATE * self.LOW_SEC_MAX)
+            d1 = random.randint(0, self.AUDIO_SAMPLERATE * self.LOW_SEC_MAX)
+            o2 = random.randint(self.MVN_SAMPLERATE * self.HI_SEC_MIN,
+                                self.MVN_SAMPLERATE * self.HI_SEC_MIN * 2)
+            d2 = random.randint(self.AUDIO_SAMPLERATE * self.HI_SEC_MIN,
+                                self.AUDIO_SAMPLERATE * self.HI_SEC_MIN * 2)
+            stretch, shift = uts.convert_anchors(o1, d1, o2, d2)
+            self.assertEqual(uts.synch_to_anchors(stretch, shift, o1, o2),
+                             (o1, d1, o2, d2))
+
+    def test_piecewise_linear(self):
+        """
+        ``utils.piecewise_linear_map`` hits every anchor, matches
+        ``utils.convert_anchors`` for 2 anchors and extrapolates linearly.
+        """
+        x = np.arange(-100, 1000)
+        stretch, shift = uts.convert_anchors(10, 500, 800, 40000)
+        self.assertTrue(np.allclose(
+            uts.piecewise_linear_map(x, [800, 10], [40000, 500]),
+            x * stretch + shift))
+        oris, dests = [0, 100, 200, 900], [1000, 2000, 2500, 9500]
+        y = uts.piecewise_linear_map(x, oris, dests)
+        self.assertTrue(np.allclose(y[np.array(oris) + 100], dests))
+        self.assertTrue(np.allclose(y[:100], np.arange(-100, 0) * 10 + 1000))
+        self.assertTrue(np.allclose(np.diff(y[1000:]), 10))
+        with self.assertRaises(AssertionError):
+            uts.piecewise_linear_map(x, [0, 10], [5, 5])
+
+
+class FormattersTest(unittest.TestCase):
+    """
+    Tests for the vectorized tick label formatters.
+    """
+    NUM_TESTS = 1000
+    SAMPLERATES = [44100, 48000, 240, 7]
+
+    class MvnStub(object):
+        """
+        Provides the audio synch of 100 normal frames, as ``Mvn`` does.
+        """
+        def get_audio_synch(self):
+            return [round(i * 33.3 + 100) for i in range(100)]
+
+    def test_timestamp_consistency(self):
+        """
+        The vectorized timestamps must equal the ones given by ``Timedelta``.
+        """
+        for sr in self.SAMPLERATES:
+            frmt = uts.SampleToTimestampFormatter(sr, num_decimals=3,
+                                                  show_idx=False)
+            vals = [random.uniform(-1e10, 1e10) for _ in range(self.NUM_TESTS)]
+            vals += [float(random.randint(-1e10, 1e10)) for _ in range(10)]
+            vals += [0.0, 0.5, -0.5]
+            labels = frmt.format_ticks(vals)
+            for v, lbl in zip(vals, labels):
+                ts = uts.Timedelta(v, sr)
+                expected = str(ts)[:-3] if ts.microsecs > 0 else str(ts)
+                self.assertEqual(lbl, expected)
+                self.assertEqual(lbl, frmt(v, None))  # single-value API
+
+    def test_memo_size(self):
+        """
+        The memo of recent labels can't grow beyond ``MEMO_SIZE``.
+        """
+        frmt = uts.ProportionalFormatter(0.5)
+        for _ in range(10):
+            frmt.format_ticks([random.uniform(0, 1e6) for _ in range(100)])
+        self.assertLessEqual(len(frmt._memo), frmt.MEMO_SIZE)
+
+    def test_synched_mvn_nearest_frame(self):
+        """
+        Values are labeled with the nearest frame, and values outside of the
+        frames range get no frame label.
+        """
+        frmt = uts.SynchedMvnFormatter(self.MvnStub(), num_decimals=1)
+        labels = frmt.format_ticks([100, 133, 150, 99, 3397, 3398, 200.5])
+        self.assertEqual(labels, ["100 [0]", "133 [1]", "150 [1]", "99",
+                                  "3397 [99]", "3398", "200.5 [3]"])
+
+
+class RollingLatenciesTest(unittest.TestCase):
+    """
+    Tests for the rolling latency statistics of the performance HUD.
+    """
+
+    class AxisStub(object):
+        """
+        Provides the view limits and canvas used by ``XlimCallbackFunctor``.
+        """
+        class Lims(object):
+            intervalx = (100.0, 200.0)
+
+        class Canvas(object):
+            def draw_idle(self):
+                pass
+
+        def __init__(self):
+            self.viewLim = self.Lims()
+            self.figure = self
+            self.canvas = self.Canvas()
+
+    class LineStub(object):
+        """
+        """
+        def set_data(self, x, y):
+            self.x, self.y = x, y
+
+    def test_window(self):
+        """
+        Only the latest ``window`` durations count for the percentiles.
+        """
+        lat = uts.RollingLatencies(window=10)
+        self.assertIsNone(lat.percentiles("draw"))
+        for secs in range(100):
+            lat.add("draw", float(secs))
+        p50, p95 = lat.percentiles("draw")
+        self.assertAlmostEqual(p50, 94.5)
+        self.assertAlmostEqual(p95, 98.55)
+        lat.clear()
+        self.assertIsNone(lat.percentiles("draw"))
+
+    def test_xlim_callback(self):
+        """
+        The callback records its duration and the one of every downsampling
+        only if ``latencies`` is set.
+        """
+        arr = uts.DownsamplableFunction(np.zeros(1000), 10,
+                                        np.arange(1000))
+        ax, lines = self.AxisStub(), [self.LineStub(), self.LineStub()]
+        functor = uts.XlimCallbackFunctor(ax, lines, [arr, arr], set())
+        functor(ax)
+        self.assertEqual(len(lines[0].x), 11)
+        lat = uts.RollingLatencies()
+        functor.latencies = lat
+        functor(ax)
+        functor(ax)
+        self.assertEqual(len(lat.durations["callback"]), 2)
+        self.assertEqual(len(lat.durations["downsample"]), 4)
@@ -0,0 +1,139 @@
+# -*- coding:utf-8 -*-
+
+
+"""
+Unit testing of the structural validation of MVNX trees. Doc:
+https://docs.python.org/3/library/unittest.html#assert-methods
+
+"""
+
+import os
+import tempfile
+import unittest
+from lxml import etree
+from audio_synch_tool.mvn import Mvn
+from audio_synch_tool.validation import validate_structure, \
+    MvnxStructureError
+from audio_synch_tool_benchmark.synthetic import write_synthetic_mvnx
+from .mvn_test import make_mvnx
+
+
+NS = {"m": "http://www.xsens.com/mvn/mvnx"}
+
+
+class ValidateStructureTest(unittest.TestCase):
+    """
+    Tests that the structural validation accepts valid MVNX files and
+    reports the inconsistencies that the decoders would trip on.
+    """
+    NUM_FRAMES = 30
+
+    def setUp(self):
+        """
+        """
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "take.mvnx")
+        write_synthetic_mvnx(self.path, self.NUM_FRAMES, num_segments=15,
+                             num_sensors=2, num_joints=3)
+        self.root = etree.parse(self.path).getroot()
+
+    def tearDown(self):
+        """
+        """
+        self.tmpdir.cleanup()
+
+    def normal_frame(self, i):
+        """
+        """
+        return self.root.xpath("//m:frame[@type='normal']", namespaces=NS)[i]
+
+    def assertInvalid(self, msg_part):
+        """
+        """
+        with self.assertRaises(MvnxStructureError) as cm:
+            validate_structure(self.root)
+        self.assertIn(msg_part, str(cm.exception))
+
+    def test_valid(self):
+        """
+        Valid files pass, also with irregular whitespace in the vectors.
+        """
+        self.assertEqual(validate_structure(self.root), self.NUM_FRAMES)
+        self.assertEqual(validate_structure(etree.fromstring(make_mvnx(7))),
+                         7)
+        com = self.normal_frame(3).find("m:centerOfMass", NS)
+        com.text = "\n  1.0   2.0\t3.0 "
+        self.assertEqual(validate_structure(self.root), self.NUM_FRAMES)
+
+    def test_vector_length(self):
+        """
+        """
+        accel = self.normal_frame(17).find("m:acceleration", NS)
+        accel.text = accel.text.rsplit(" ", 1)[0]
+        self.assertInvalid("acceleration of normal frame 17 should have 45")
+
+    def test_other_whitespace(self):
+        """
+        Numbers separated by other whitespace than spaces are counted too.
+        """
+        com = self.normal_frame(4).find("m:centerOfMass", NS)
+        com.text = "1.0 2.0 3.0\t4.0"
+        self.assertInvalid("centerOfMass of normal frame 4 should have 3")
+        com.text = "1.0 2.0\u00a03.0 4.0"
+        self.assertInvalid("centerOfMass of normal frame 4 should have 3")
+
+    def test_missing_field(self):
+        """
+        """
+        frame = self.normal_frame(5)
+        frame.remove(frame.find("m:velocity", NS))
+        self.assertInvalid("Normal frame 5 has fields")
+
+    def test_empty_field(self):
+        """
+        """
+        self.normal_frame(9).find("m:jointAngle", NS).text = None
+        self.assertInvalid("jointAngle of normal frame 9 should have 9")
+
+    def test_config_after_normal(self):
+        """
+        """
+        frames = self.root.find("m:subject/m:frames", NS)
+        frames.append(frames.find("m:frame[@type='tpose']", NS))
+        self.assertInvalid("Config frames after normal frames")
+
+    def test_counts(self):
+        """
+        """
+        frames = self.root.find("m:subject/m:frames", NS)
+        frames.attrib["sensorCount"] = "3"
+        self.assertInvalid("sensors has 2 elements, but sensorCount is 3")
+        frames.attrib["sensorCount"] = "2"
+        self.root.find("m:subject", NS).attrib["segmentCount"] = "16"
+        self.assertInvalid("segmentCount of subject (16) and frames (15)")
+
+    def test_indexes(self):
+        """
+        """
+        self.normal_frame(12).attrib["index"] = "11"
+        self.assertInvalid("index 11 after 11")
+        self.normal_frame(12).attrib["index"] = "twelve"
+        self.assertInvalid("must be integers")
+
+    def test_mvn_modes(self):
+        """
+        ``Mvn`` validates the structure if ``validate`` is true, and also
+        the schema if strict, compiling it only once.
+        """
+        Mvn(self.path, validate=True)
+        Mvn(self.path, validate="strict")
+        self.assertIs(Mvn(self.path, validate="strict").schema,
+                      Mvn.get_schema())
+        invalid_path = os.path.join(self.tmpdir.name, "invalid.mvnx")
+        with open(invalid_path, "w") as f:
+            f.write(make_mvnx(5))
+        Mvn(invalid_path, validate=True)
+        with self.assertRaises(etree.DocumentInvalid):
+            Mvn(invalid_path, validate="strict")
+        with self.assertRaises(AssertionError):
+            Mvn(self.path, validate="yes")